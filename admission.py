@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from config import (
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_QUEUE_MAX_DEPTH,
+    LLM_QUEUE_TIMEOUT,
+    LLM_ADMISSION_BACKEND,
+    SESSION_STORE_URL
+)
+from logging_service import LoggingService
+
+METRICS_LOG_INTERVAL = 60  # seconds between metric snapshots in the app log
+
+# Lower value is served first
+PRIORITY_USER = 0
+PRIORITY_GUEST = 1
+
+
+class AdmissionRejected(RuntimeError):
+    pass
+
+
+class LocalBudget:
+    """Token buckets for requests and tokens, refilled continuously, for one process."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.request_capacity = float(max(1, requests_per_minute // 6))  # up to 10s of burst
+        self.token_capacity = float(max(1, tokens_per_minute // 6))
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_rate)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_rate)
+
+    def try_take(self, requests: int, tokens: int) -> float:
+        """Take the budget and return 0, or return seconds until it will be available."""
+        self._refill()
+        tokens = min(tokens, self.token_capacity)
+        wait = max(
+            (requests - self.requests) / self.request_rate if self.requests < requests else 0.0,
+            (tokens - self.tokens) / self.token_rate if self.tokens < tokens else 0.0
+        )
+        if wait == 0.0:
+            self.requests -= requests
+            self.tokens -= tokens
+        return wait
+
+    def settle(self, tokens: int):
+        """Charge (positive) or refund (negative) the difference to the estimate."""
+        self._refill()
+        self.tokens = min(self.token_capacity, self.tokens - tokens)
+
+
+_SHARED_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local request_rate, request_capacity = tonumber(ARGV[2]), tonumber(ARGV[3])
+local token_rate, token_capacity = tonumber(ARGV[4]), tonumber(ARGV[5])
+local need_requests, need_tokens, force = tonumber(ARGV[6]), tonumber(ARGV[7]), ARGV[8] == "1"
+local state = redis.call("HMGET", KEYS[1], "r", "t", "ts")
+local requests = tonumber(state[1]) or request_capacity
+local tokens = tonumber(state[2]) or token_capacity
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(request_capacity, requests + elapsed * request_rate)
+tokens = math.min(token_capacity, tokens + elapsed * token_rate)
+local wait = 0
+if not force then
+    if requests < need_requests then wait = math.max(wait, (need_requests - requests) / request_rate) end
+    if tokens < need_tokens then wait = math.max(wait, (need_tokens - tokens) / token_rate) end
+end
+if wait == 0 then
+    requests = requests - need_requests
+    tokens = math.min(token_capacity, tokens - need_tokens)
+end
+redis.call("HSET", KEYS[1], "r", requests, "t", tokens, "ts", now)
+redis.call("EXPIRE", KEYS[1], 3600)
+return tostring(wait)
+"""
+
+
+class SharedBudget(LocalBudget):
+    """The same buckets kept in a redis-compatible server, so every worker
+    process draws from one budget. Queueing and fairness stay per process."""
+
+    def __init__(self, client, requests_per_minute: int, tokens_per_minute: int, key: str = "llm:budget"):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self.key = key
+        self._script = client.register_script(_SHARED_BUCKET_SCRIPT)
+
+    def _call(self, requests: int, tokens: int, force: bool) -> float:
+        return float(self._script(keys=[self.key], args=[
+            time.time(), self.request_rate, self.request_capacity, self.token_rate, self.token_capacity,
+            requests, tokens, "1" if force else "0"
+        ]))
+
+    def try_take(self, requests: int, tokens: int) -> float:
+        return self._call(requests, min(tokens, self.token_capacity), force=False)
+
+    def settle(self, tokens: int):
+        self._call(0, tokens, force=True)
+
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "tokens", "enqueued_at", "state")
+
+    def __init__(self, user_id: str, priority: int, tokens: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.state = "waiting"  # -> admitted | shed | timed_out
+
+
+class Ticket:
+    __slots__ = ("user_id", "priority", "tokens")
+
+    def __init__(self, user_id: str, priority: int, tokens: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.tokens = tokens
+
+
+class AdmissionController:
+    """Admits LLM calls against a request and token budget.
+
+    Waiting calls are ordered by priority (logged-in users before guests) and,
+    within a priority, by start-time fair queueing on estimated tokens, so one
+    user firing many questions cannot starve the others. When the queue is
+    full the newest guest call is shed to make room for a logged-in user;
+    otherwise the incoming call is rejected.
+    """
+
+    def __init__(self, budget: Optional[LocalBudget] = None, max_depth: int = LLM_QUEUE_MAX_DEPTH,
+                 timeout: float = LLM_QUEUE_TIMEOUT):
+        self.budget = budget or LocalBudget(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._user_finish: Dict[str, float] = {}
+        self._depth = {PRIORITY_USER: 0, PRIORITY_GUEST: 0}
+        self._waits = {PRIORITY_USER: deque(maxlen=1000), PRIORITY_GUEST: deque(maxlen=1000)}
+        self._counts = {"admitted": 0, "shed": 0, "rejected": 0, "timed_out": 0}
+        self._metrics_logged_at = time.monotonic()
+        self.logger = LoggingService()
+
+    def acquire(self, user_id: str, priority: int = PRIORITY_USER, tokens: int = 1000,
+                timeout: Optional[float] = None) -> Ticket:
+        """Block until the call may go upstream; raises AdmissionRejected if shed or timed out."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if sum(self._depth.values()) >= self.max_depth and not self._shed_one(priority):
+                self._counts["rejected"] += 1
+                raise AdmissionRejected("LLM queue is full")
+            waiter = _Waiter(user_id, priority, tokens)
+            tag = max(self._virtual_time, self._user_finish.get(user_id, 0.0)) + tokens
+            self._user_finish[user_id] = tag
+            heapq.heappush(self._heap, (priority, tag, next(self._seq), waiter))
+            self._depth[priority] += 1
+
+            while True:
+                if waiter.state == "shed":
+                    raise AdmissionRejected("Shed for a higher-priority call")
+                self._prune()
+                wait = None
+                if self._heap[0][3] is waiter:
+                    wait = self.budget.try_take(1, tokens)
+                    if wait == 0.0:
+                        heapq.heappop(self._heap)
+                        self._depth[priority] -= 1
+                        self._virtual_time = tag
+                        waiter.state = "admitted"
+                        self._counts["admitted"] += 1
+                        self._waits[priority].append(time.monotonic() - waiter.enqueued_at)
+                        self._forget_idle_users()
+                        self._cond.notify_all()
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    waiter.state = "timed_out"
+                    self._depth[priority] -= 1
+                    self._counts["timed_out"] += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected("Timed out waiting for LLM capacity")
+                self._cond.wait(min(remaining, wait) if wait else remaining)
+
+        if time.monotonic() - self._metrics_logged_at >= METRICS_LOG_INTERVAL:
+            self._metrics_logged_at = time.monotonic()
+            self.logger.log_app_event('llm_admission_metrics', self.get_metrics())
+        return Ticket(user_id, priority, tokens)
+
+    def settle(self, ticket: Ticket, used_tokens: int):
+        """Correct the token budget once the real usage of an admitted call is known."""
+        with self._cond:
+            self.budget.settle(used_tokens - ticket.tokens)
+            self._cond.notify_all()
+
+    def get_metrics(self) -> Dict:
+        with self._cond:
+            metrics = dict(self._counts)
+            metrics["queue_depth"] = sum(self._depth.values())
+            for priority, label in ((PRIORITY_USER, "user"), (PRIORITY_GUEST, "guest")):
+                waits = sorted(self._waits[priority])
+                metrics[f"queue_depth_{label}"] = self._depth[priority]
+                metrics[f"wait_ms_p50_{label}"] = round(waits[len(waits) // 2] * 1000, 1) if waits else None
+                metrics[f"wait_ms_p95_{label}"] = round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None
+            return metrics
+
+    def _prune(self):
+        while self._heap and self._heap[0][3].state != "waiting":
+            heapq.heappop(self._heap)
+
+    def _shed_one(self, priority: int) -> bool:
+        # Evict the lowest-priority, latest-tagged waiter if it ranks below the newcomer
+        candidates = [entry for entry in self._heap if entry[3].state == "waiting" and entry[0] > priority]
+        if not candidates:
+            return False
+        victim = max(candidates)[3]
+        victim.state = "shed"
+        self._depth[victim.priority] -= 1
+        self._counts["shed"] += 1
+        self._cond.notify_all()
+        return True
+
+    def _forget_idle_users(self):
+        # Users whose finish tag has fallen behind the clock no longer affect ordering
+        if len(self._user_finish) > 10000:
+            self._user_finish = {u: t for u, t in self._user_finish.items() if t > self._virtual_time}
+
+
+def create_admission_controller() -> AdmissionController:
+    if LLM_ADMISSION_BACKEND == "redis":
+        import redis  # optional dependency, only needed for the shared budget
+        budget = SharedBudget(redis.Redis.from_url(SESSION_STORE_URL), LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+        return AdmissionController(budget)
+    return AdmissionController()
@@ -0,0 +1,273 @@
+"""Headless HTTP API for the nutrition assistant.
+
+Serves the same prompt, auth and profile services as the Streamlit app to
+mobile and partner clients, without a script rerun or websocket per request:
+
+    uvicorn api:app --workers 4
+
+Every endpoint except /health takes ``Authorization: Bearer <session token>``,
+as returned by the app's login. POST /v1/session turns that token into an
+HttpOnly cookie the Streamlit app reads on refresh; DELETE /v1/session clears it.
+"""
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import List, Literal, Optional
+
+from fastapi import Cookie, Depends, FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from config import (
+    APP_ORIGIN,
+    CYCLE_PHASES,
+    ERROR_MESSAGES,
+    LLM_DEADLINE,
+    SESSION_COOKIE_NAME,
+    SESSION_COOKIE_SECURE,
+    SESSION_TIMEOUT
+)
+from knowledge_base import get_knowledge_base
+from meal_plan_service import (
+    MealPlan,
+    grocery_list,
+    parse_meal_plan,
+    parse_plan_request,
+    plan_chain_inputs,
+    plan_to_text,
+    profile_key
+)
+from pdf_export import recommendations_to_pdf
+from services import (
+    get_auth_service,
+    get_profile_service,
+    get_feedback_service,
+    get_meal_plan_service,
+    get_llm_usage_store,
+    get_llm_chain,
+    get_meal_plan_chain
+)
+from single_flight import StreamFlight, prompt_key
+from utils import build_chain_inputs
+
+# One upstream stream per distinct prompt in flight, fanned out to every caller asking it
+_flight = StreamFlight(idle_timeout=LLM_DEADLINE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the pooled clients once per worker, before the first request
+    get_llm_chain()
+    get_meal_plan_chain()
+    get_auth_service()
+    get_profile_service()
+    get_feedback_service()
+    yield
+
+
+app = FastAPI(title="HerFoodCode API", version="1.0", lifespan=lifespan)
+# The app's cookie component calls /v1/session from the browser, with credentials
+app.add_middleware(CORSMiddleware, allow_origins=[APP_ORIGIN], allow_credentials=True,
+                   allow_methods=["POST", "DELETE"], allow_headers=["Authorization"])
+bearer = HTTPBearer()
+
+# Unknown phases are rejected with a 422 instead of reaching the prompt and retrieval
+Phase = Literal[tuple(CYCLE_PHASES)]
+
+
+class ChatRequest(BaseModel):
+    phase: Phase
+    goal: str = ""
+    diet: List[str] = Field(default_factory=list)
+    question: str = Field(min_length=1, max_length=2000)
+
+
+class ChatResponse(BaseModel):
+    answer: str
+
+
+class ProfileUpdate(BaseModel):
+    phase: Optional[Phase] = None
+    goal: Optional[str] = None
+    diet: Optional[List[str]] = None
+    last_period: Optional[date] = None
+    cycle_length: Optional[int] = None
+
+
+class MealPlanRequest(BaseModel):
+    phase: Phase
+    goal: str = ""
+    diet: List[str] = Field(default_factory=list)
+    request: str = Field(min_length=1, max_length=500, examples=["Give me a 3-day breakfast plan"])
+
+
+class FeedbackRequest(BaseModel):
+    feedback: str = Field(min_length=1, max_length=5000)
+
+
+async def current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer)) -> str:
+    # Usually a cache hit, but refreshing revocations reads the shared store: keep it off the event loop
+    success, result = await run_in_threadpool(get_auth_service().verify_session, credentials.credentials)
+    if not success:
+        raise HTTPException(status_code=401, detail=result)
+    return result
+
+
+async def _chain_inputs(request: ChatRequest) -> dict:
+    # BM25 and dense retrieval are CPU work; run them in the threadpool like the other blocking calls
+    return await run_in_threadpool(build_chain_inputs, request.phase, request.goal, request.diet, request.question)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "coalescing": _flight.get_metrics()}
+
+
+async def _save_exchange(user_id: str, question: str, answer: str):
+    # Stored like the app's chats, so they show up in history and search
+    profiles = get_profile_service()
+    await run_in_threadpool(profiles.add_chat_message, user_id, "user", question)
+    await run_in_threadpool(profiles.add_chat_message, user_id, "assistant", answer)
+
+
+async def _shared_stream(inputs: dict, category: str, user_id: str):
+    """Answer chunks; identical prompts in flight share one upstream stream."""
+    chain = get_llm_chain()
+    started = time.monotonic()
+    joined = {}
+    parts = []
+    outcome = "error"
+    try:
+        async for chunk in _flight.subscribe(prompt_key(chain.prompt.format(**inputs)),
+                                             lambda: chain.astream(inputs, user_id=user_id, category=category),
+                                             on_join=lambda shared: joined.update(shared=shared)):
+            parts.append(chunk)
+            yield chunk
+        outcome = "ok"
+    finally:
+        # The chain records the leader's tokens; callers that joined add a coalesced record
+        if joined.get("shared"):
+            get_llm_usage_store().record(category, latency_ms=(time.monotonic() - started) * 1000,
+                                         cache="coalesced", outcome=outcome)
+    await _save_exchange(user_id, inputs["question"], "".join(parts))
+
+
+@app.post("/v1/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, user_id: str = Depends(current_user)):
+    try:
+        answer = await run_in_threadpool(get_llm_chain().run, await _chain_inputs(request), user_id=user_id,
+                                         category="api")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"{ERROR_MESSAGES['api_error']}: {str(e)}")
+    await _save_exchange(user_id, request.question, answer)
+    return ChatResponse(answer=answer)
+
+
+@app.post("/v1/chat/stream")
+async def chat_stream(request: ChatRequest, user_id: str = Depends(current_user)):
+    return StreamingResponse(_shared_stream(await _chain_inputs(request), "api_stream", user_id),
+                             media_type="text/plain; charset=utf-8")
+
+
+@app.post("/v1/session", status_code=204)
+async def set_session_cookie(response: Response, credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+    await current_user(credentials)
+    response.set_cookie(SESSION_COOKIE_NAME, credentials.credentials, max_age=SESSION_TIMEOUT, path="/",
+                        httponly=True, secure=SESSION_COOKIE_SECURE, samesite="strict")
+
+
+@app.delete("/v1/session", status_code=204)
+async def clear_session_cookie(response: Response, session: Optional[str] = Cookie(None, alias=SESSION_COOKIE_NAME)):
+    if session:
+        await run_in_threadpool(get_auth_service().logout, session)
+    response.delete_cookie(SESSION_COOKIE_NAME, path="/", httponly=True, secure=SESSION_COOKIE_SECURE,
+                           samesite="strict")
+
+
+@app.get("/v1/profile")
+async def get_profile(user_id: str = Depends(current_user)):
+    success, profile, msg = await run_in_threadpool(get_profile_service().get_profile, user_id)
+    if not success:
+        raise HTTPException(status_code=404, detail=msg)
+    return profile
+
+
+@app.patch("/v1/profile")
+async def update_profile(updates: ProfileUpdate, user_id: str = Depends(current_user)):
+    changes = updates.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No profile fields given")
+    success, msg = await run_in_threadpool(get_profile_service().update_profile, user_id, changes)
+    if not success:
+        raise HTTPException(status_code=400, detail=msg)
+    return {"message": msg}
+
+
+@app.post("/v1/meal-plans")
+async def create_meal_plan(request: MealPlanRequest, user_id: str = Depends(current_user)):
+    """The stored plan for this profile and request, or a newly generated one (one LLM call)."""
+    plan_request = parse_plan_request(request.request)
+    if plan_request is None:
+        raise HTTPException(status_code=400, detail="Not a meal-plan request, e.g. \"Give me a 3-day breakfast plan\"")
+    service = get_meal_plan_service()
+    profile = profile_key(request.phase, request.goal, request.diet)
+    success, row, msg = await run_in_threadpool(service.get_plan, user_id, profile, plan_request)
+    if success and row is not None:
+        return {"id": row["id"], "plan": row["plan"], "reused": True}
+
+    context = await run_in_threadpool(get_knowledge_base().context_for, request.request, request.phase,
+                                      request.goal, request.diet)
+    inputs = plan_chain_inputs(plan_request, request.phase, request.goal, request.diet, context)
+    try:
+        answer = await run_in_threadpool(get_meal_plan_chain().run, inputs, user_id=user_id, category="api_meal_plan")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"{ERROR_MESSAGES['api_error']}: {str(e)}")
+    plan = parse_meal_plan(answer)
+    if plan is None:
+        raise HTTPException(status_code=502, detail="The model did not return a valid meal plan")
+    success, row, msg = await run_in_threadpool(service.save_plan, user_id, profile, plan_request, plan, request.phase)
+    if not success:
+        raise HTTPException(status_code=500, detail=msg)
+    return {"id": row["id"], "plan": plan.model_dump(), "reused": False}
+
+
+async def _stored_plan(user_id: str, plan_id: str) -> MealPlan:
+    success, row, msg = await run_in_threadpool(get_meal_plan_service().get_plan_by_id, user_id, plan_id)
+    if not success:
+        raise HTTPException(status_code=404, detail=msg)
+    return MealPlan.model_validate(row["plan"])
+
+
+@app.get("/v1/meal-plans/{plan_id}/grocery-list")
+async def meal_plan_grocery_list(plan_id: str, user_id: str = Depends(current_user)):
+    return {"items": grocery_list(await _stored_plan(user_id, plan_id))}
+
+
+@app.get("/v1/meal-plans/{plan_id}/pdf")
+async def meal_plan_pdf(plan_id: str, user_id: str = Depends(current_user)):
+    plan = await _stored_plan(user_id, plan_id)
+    pdf = await run_in_threadpool(recommendations_to_pdf, plan_to_text(plan), plan.title)
+    return Response(pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": 'attachment; filename="meal_plan.pdf"'})
+
+
+@app.get("/v1/export")
+async def export_data(user_id: str = Depends(current_user)):
+    success, data, msg = await run_in_threadpool(get_profile_service().export_user_data, user_id)
+    if not success:
+        raise HTTPException(status_code=404, detail=msg)
+    return data
+
+
+@app.post("/v1/feedback", status_code=202)
+async def submit_feedback(request: FeedbackRequest, user_id: str = Depends(current_user)):
+    # Appending to the local spool is fast enough to do on the event loop
+    get_feedback_service().submit(
+        user_id=user_id,
+        timestamp=datetime.utcnow().isoformat(),
+        feedback=request.feedback.strip()
+    )
+    return {"message": "Thank you for your feedback!"}
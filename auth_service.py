@@ -12,50 +12,82 @@ from config import (
     ERROR_MESSAGES,
     SUCCESS_MESSAGES,
     VERIFICATION_TOKEN_EXPIRY,
-    RESET_TOKEN_EXPIRY
+    RESET_TOKEN_EXPIRY,
+    PASSWORD_HASH_WORKERS
 )
+from postgrest.exceptions import APIError
 from email_service import EmailService
+from email_dispatcher import EmailDispatcher
 from logging_service import LoggingService
-import secrets
-import logging
+from session_cache import session_cache
+from token_service import TokenService
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+UNIQUE_VIOLATION = "23505"  # PostgreSQL error code for a duplicate key
+
+# bcrypt releases the GIL; a bounded pool keeps a registration burst from
+# running more hashes at once than there are cores.
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+
+def validate_email(email: str) -> bool:
+    return bool(EMAIL_PATTERN.match(email or ""))
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
 
 class AuthService:
-    def __init__(self):
-        print("=== AuthService Initialization ===")
-        print(f"SUPABASE_URL: {SUPABASE_URL}")
-        print(f"SUPABASE_SERVICE_ROLE_KEY exists: {bool(SUPABASE_SERVICE_ROLE_KEY)}")
-        print(f"SUPABASE_SERVICE_ROLE_KEY length: {len(SUPABASE_SERVICE_ROLE_KEY) if SUPABASE_SERVICE_ROLE_KEY else 0}")
-        print(f"SUPABASE_SERVICE_ROLE_KEY first 10 chars: {SUPABASE_SERVICE_ROLE_KEY[:10] if SUPABASE_SERVICE_ROLE_KEY else 'None'}")
-        try:
-            print("Attempting to create Supabase client...")
-            self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-            print("Supabase client created successfully")
-            
-            # Test the connection with a simpler query
-            print("Testing Supabase connection...")
+    def __init__(self, supabase=None, email_service=None, email_dispatcher=None, write_buffer=None):
+        # A client can be passed in (e.g. local_supabase.LocalSupabase for benchmarks)
+        if supabase is None:
+            print("=== AuthService Initialization ===")
+            print(f"SUPABASE_URL: {SUPABASE_URL}")
+            print(f"SUPABASE_SERVICE_ROLE_KEY exists: {bool(SUPABASE_SERVICE_ROLE_KEY)}")
+            print(f"SUPABASE_SERVICE_ROLE_KEY length: {len(SUPABASE_SERVICE_ROLE_KEY) if SUPABASE_SERVICE_ROLE_KEY else 0}")
+            print(f"SUPABASE_SERVICE_ROLE_KEY first 10 chars: {SUPABASE_SERVICE_ROLE_KEY[:10] if SUPABASE_SERVICE_ROLE_KEY else 'None'}")
             try:
-                # Just try to get the auth configuration
-                auth_config = self.supabase.auth.get_session()
-                print("Connection test successful - Auth configuration retrieved")
-            except Exception as auth_error:
-                print(f"Auth test failed: {str(auth_error)}")
-                # Try a simple table query as fallback
+                print("Attempting to create Supabase client...")
+                self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+                print("Supabase client created successfully")
+            
+                # Test the connection with a simpler query
+                print("Testing Supabase connection...")
                 try:
-                    test_response = self.supabase.table("users").select("id").limit(1).execute()
-                    print("Connection test successful - Table query worked")
-                except Exception as table_error:
-                    print(f"Table test failed: {str(table_error)}")
-                    raise
-        except Exception as e:
-            print(f"Error creating Supabase client: {str(e)}")
-            print(f"Error type: {type(e)}")
-            if hasattr(e, 'response'):
-                print(f"Response status: {e.response.status_code if hasattr(e.response, 'status_code') else 'N/A'}")
-                print(f"Response body: {e.response.text if hasattr(e.response, 'text') else 'N/A'}")
-            raise
-        self.email_service = EmailService()
+                    # Just try to get the auth configuration
+                    auth_config = self.supabase.auth.get_session()
+                    print("Connection test successful - Auth configuration retrieved")
+                except Exception as auth_error:
+                    print(f"Auth test failed: {str(auth_error)}")
+                    # Try a simple table query as fallback
+                    try:
+                        test_response = self.supabase.table("users").select("id").limit(1).execute()
+                        print("Connection test successful - Table query worked")
+                    except Exception as table_error:
+                        print(f"Table test failed: {str(table_error)}")
+                        raise
+            except Exception as e:
+                print(f"Error creating Supabase client: {str(e)}")
+                print(f"Error type: {type(e)}")
+                if hasattr(e, 'response'):
+                    print(f"Response status: {e.response.status_code if hasattr(e.response, 'status_code') else 'N/A'}")
+                    print(f"Response body: {e.response.text if hasattr(e.response, 'text') else 'N/A'}")
+                raise
+        else:
+            self.supabase = supabase
+        self.email_service = email_service or EmailService()
+        self.email_dispatcher = email_dispatcher or EmailDispatcher()
+        self.write_buffer = write_buffer
         self.logger = LoggingService()
-        self._validate_config()
+        self.token_service = TokenService(self.supabase)
+        self.token_service.start_sweeper()
+        if supabase is None:
+            self._validate_config()
         print("=== AuthService Initialization Complete ===")
 
     def _validate_config(self):
@@ -63,8 +95,7 @@ class AuthService:
             raise ValueError("Supabase configuration is missing")
 
     def _validate_email(self, email: str) -> bool:
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, email))
+        return validate_email(email)
 
     def _validate_password(self, password: str) -> tuple[bool, str]:
         if len(password) < PASSWORD_MIN_LENGTH:
@@ -78,7 +109,7 @@ class AuthService:
         return True, ""
 
     def _hash_password(self, password: str) -> str:
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        return hash_password(password)
 
     def _verify_password(self, password: str, hashed: str) -> bool:
         return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
@@ -86,6 +117,8 @@ class AuthService:
     def _generate_session_token(self, user_id: str) -> str:
         payload = {
             'user_id': user_id,
+            'jti': uuid.uuid4().hex,
+            'iat': time.time(),
             'exp': datetime.utcnow() + timedelta(seconds=SESSION_TIMEOUT)
         }
         return jwt.encode(payload, SUPABASE_SERVICE_ROLE_KEY, algorithm='HS256')
@@ -103,39 +136,44 @@ class AuthService:
                 self.logger.log_auth_event('register', success=False, details={'error': 'invalid_password'})
                 return False, message
 
-            # Check if user exists
-            response = self.supabase.table("users").select("*").eq("email", email).execute()
-            if response.data:
+            # One round trip: the unique index on users.email rejects duplicates
+            user_id = str(uuid.uuid4())
+            hashed_pw = _hash_pool.submit(self._hash_password, password).result()
+            try:
+                self.supabase.table("users").insert({
+                    "id": user_id,
+                    "email": email,
+                    "password": hashed_pw,
+                    "email_verified": False,
+                    "created_at": datetime.utcnow().isoformat(),
+                    "last_login": None
+                }).execute()
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    raise
                 self.logger.log_auth_event('register', success=False, details={'error': 'user_exists'})
                 return False, ERROR_MESSAGES["user_exists"]
 
-            # Create user
-            user_id = str(uuid.uuid4())
-            hashed_pw = self._hash_password(password)
-            
-            self.supabase.table("users").insert({
-                "id": user_id,
-                "email": email,
-                "password": hashed_pw,
-                "email_verified": False,
-                "created_at": datetime.utcnow().isoformat(),
-                "last_login": None
-            }).execute()
-
-            # Send verification email
-            email_sent = self.email_service.send_verification_email(user_id, email)
-            if not email_sent:
-                self.logger.log_email_event('verification', email, success=False)
-                return False, ERROR_MESSAGES["email_send_failed"]
-
+            # Token and email are handled in the background, with retries
+            self.email_dispatcher.submit('verification', email, self._verification_job(user_id, email))
             self.logger.log_auth_event('register', user_id, success=True)
-            self.logger.log_email_event('verification', email, success=True)
             return True, SUCCESS_MESSAGES["registration"]
 
         except Exception as e:
             self.logger.log_auth_event('register', success=False, details={'error': str(e)})
             return False, f"Registration error: {str(e)}"
 
+    def _verification_job(self, user_id: str, email: str):
+        token = None
+
+        def send() -> bool:
+            nonlocal token
+            if token is None:  # issued once, reused by retries
+                token = self.token_service.issue("verification", email, user_id)
+            return self.email_service.send_verification_email(user_id, email, token)
+
+        return send
+
     def login_user(self, email: str, password: str) -> tuple[bool, dict, str]:
         try:
             # Validate email
@@ -164,10 +202,12 @@ class AuthService:
             # Generate session token
             session_token = self._generate_session_token(user["id"])
 
-            # Update last login
-            self.supabase.table("users").update({
-                "last_login": datetime.utcnow().isoformat()
-            }).eq("id", user["id"]).execute()
+            # Update last login; with a write buffer the login doesn't wait for it
+            last_login = {"last_login": datetime.utcnow().isoformat()}
+            if self.write_buffer is not None:
+                self.write_buffer.update("users", user["id"], last_login)
+            else:
+                self.supabase.table("users").update(last_login).eq("id", user["id"]).execute()
 
             self.logger.log_auth_event('login', user["id"], success=True)
             return True, {
@@ -207,10 +247,20 @@ class AuthService:
             return False, f"Password reset error: {str(e)}"
 
     def verify_session(self, session_token: str) -> tuple[bool, str]:
+        # Recently verified tokens are served from the in-process LRU
+        cached_user_id = session_cache.get(session_token)
+        if cached_user_id:
+            return True, cached_user_id
         try:
             payload = jwt.decode(session_token, SUPABASE_SERVICE_ROLE_KEY, algorithms=['HS256'])
-            self.logger.log_auth_event('session_verify', payload['user_id'], success=True)
-            return True, payload['user_id']
+            user_id = payload['user_id']
+            jti = payload.get('jti')
+            issued_at = payload.get('iat', 0)
+            if session_cache.is_revoked(user_id, jti, issued_at, payload['exp']):
+                self.logger.log_auth_event('session_verify', user_id, success=False, details={'error': 'session_revoked'})
+                return False, ERROR_MESSAGES["session_expired"]
+            session_cache.put(session_token, user_id, jti, issued_at, payload['exp'])
+            return True, user_id
         except jwt.ExpiredSignatureError:
             self.logger.log_auth_event('session_verify', success=False, details={'error': 'session_expired'})
             return False, ERROR_MESSAGES["session_expired"]
@@ -218,24 +268,48 @@ class AuthService:
             self.logger.log_auth_event('session_verify', success=False, details={'error': 'invalid_token'})
             return False, "Invalid session token"
 
+    def resume_session(self, session_token: str) -> tuple[bool, dict, str]:
+        """Restore a logged-in session from a previously issued token without a DB lookup."""
+        if not session_token:
+            return False, None, ERROR_MESSAGES["session_expired"]
+        success, result = self.verify_session(session_token)
+        if not success:
+            return False, None, result
+        return True, {"id": result, "session_token": session_token}, SUCCESS_MESSAGES["login"]
+
+    def logout(self, session_token: str) -> tuple[bool, str]:
+        try:
+            payload = jwt.decode(
+                session_token,
+                SUPABASE_SERVICE_ROLE_KEY,
+                algorithms=['HS256'],
+                options={'verify_exp': False}
+            )
+        except jwt.InvalidTokenError:
+            return False, "Invalid session token"
+        session_cache.revoke_token(session_token, payload['user_id'], payload.get('jti'), payload['exp'])
+        self.logger.log_auth_event('logout', payload['user_id'], success=True)
+        return True, "Logged out"
+
+    def revoke_user_sessions(self, user_id: str):
+        """Invalidate every session token issued to a user up to now."""
+        session_cache.revoke_user(user_id)
+        self.logger.log_auth_event('session_revoke_all', user_id, success=True)
+
     def verify_email(self, token: str) -> tuple[bool, str]:
         try:
-            logging.warning(f"TOKEN RECEIVED FOR VERIFICATION: {token}")
-            success, user_id, token_type = self.email_service.verify_token(token)
-            logging.warning(f"DECODED USER ID FROM TOKEN: {user_id}")
-            if not success or token_type != 'verification':
-                self.logger.log_auth_event('email_verify', success=False, details={'error': 'invalid_token'})
-                return False, ERROR_MESSAGES["invalid_token"]
-            # Update email_verified, do not assume response contains updated row
-            update_response = self.supabase.table("users").update({
+            success, record, message = self.token_service.consume(token, "verification")
+            if not success:
+                self.logger.log_auth_event('email_verify', success=False, details={'error': message})
+                return False, message
+            if record.get("verified"):
+                # Outcome replayed from the consumed-token cache; the user row is already updated
+                return True, SUCCESS_MESSAGES["email_verified"]
+            self.supabase.table("users").update({
                 "email_verified": True
-            }).eq("id", user_id).execute()
-            # Optionally, fetch the user to confirm
-            # user_row = self.supabase.table("users").select("email_verified").eq("id", user_id).single().execute()
-            # if not user_row.data or not user_row.data.get('email_verified'):
-            #     self.logger.log_auth_event('email_verify', user_id, success=False, details={'error': 'email_verified_not_set'})
-            #     return False, "Email verification error: could not set email_verified."
-            self.logger.log_auth_event('email_verify', user_id, success=True)
+            }).eq("id", record["user_id"]).execute()
+            self.token_service.remember_outcome(token, True, {**record, "verified": True}, "")
+            self.logger.log_auth_event('email_verify', record["user_id"], success=True)
             return True, SUCCESS_MESSAGES["email_verified"]
         except Exception as e:
             self.logger.log_auth_event('email_verify', success=False, details={'error': str(e)})
@@ -243,24 +317,18 @@ class AuthService:
 
     def change_password(self, token: str, new_password: str) -> tuple[bool, str]:
         try:
-            success, user_id, token_type = self.email_service.verify_token(token)
-            if not success or token_type != 'reset':
-                self.logger.log_auth_event('password_change', success=False, details={'error': 'invalid_token'})
-                return False, ERROR_MESSAGES["invalid_token"]
-
             # Validate new password
             is_valid, message = self._validate_password(new_password)
             if not is_valid:
                 self.logger.log_auth_event('password_change', success=False, details={'error': 'invalid_password'})
                 return False, message
 
-            # Update password
-            hashed_pw = self._hash_password(new_password)
-            self.supabase.table("users").update({
-                "password": hashed_pw
-            }).eq("id", user_id).execute()
+            success, message = self._reset_with_token(token, new_password)
+            if not success:
+                self.logger.log_auth_event('password_change', success=False, details={'error': message})
+                return False, message
 
-            self.logger.log_auth_event('password_change', user_id, success=True)
+            self.logger.log_auth_event('password_change', success=True)
             return True, SUCCESS_MESSAGES["password_changed"]
 
         except Exception as e:
@@ -269,14 +337,8 @@ class AuthService:
 
     def send_password_reset(self, email):
         try:
-            token = secrets.token_urlsafe(32)
-            expiry = datetime.utcnow() + timedelta(hours=1)
-            
-            # Save token to database
-            if not self.save_reset_token(email, token, expiry):
-                return False, "Failed to save reset token"
-            
-            reset_link = f"http://localhost:8501/?token={token}"
+            token = self.token_service.issue("reset", email)
+            reset_link = f"{os.getenv('APP_URL', 'http://localhost:8501')}/?token={token}"
             success = self.email_service.send_password_reset_email(email, reset_link)
             
             if success:
@@ -287,38 +349,53 @@ class AuthService:
             self.logger.log_auth_event('send_password_reset', success=False, details={'error': str(e)})
             return False, f"Error: {str(e)}"
 
+    def get_reset_token_record(self, token):
+        return self.token_service.lookup(token, "reset")
+
     def verify_reset_token(self, token):
-        # TODO: Retrieve token record from DB
         record = self.get_reset_token_record(token)
-        if record and record['expiry'] > datetime.utcnow():
+        if record:
             return True, record['email']
         return False, None
 
     def reset_password(self, token, new_password):
-        valid, email = self.verify_reset_token(token)
-        if not valid:
-            return False, "Invalid or expired token."
-        # TODO: Update user's password in DB
-        self.update_user_password(email, new_password)
-        # TODO: Delete token after use
-        self.delete_reset_token(token)
-        return True, "Password reset successful." 
-    
-    def save_reset_token(self, email, token, expiry):
+        is_valid, message = self._validate_password(new_password)
+        if not is_valid:
+            return False, message
+        success, message = self._reset_with_token(token, new_password)
+        if not success:
+            self.logger.log_auth_event('password_reset', success=False, details={'error': message})
+            return False, message
+        return True, "Password reset successful."
+
+    def _reset_with_token(self, token: str, new_password: str) -> tuple[bool, str]:
+        # Use up the token first: the conditional delete hands the row to exactly one
+        # caller, so two concurrent requests with the same link can't both set a password
+        success, record, message = self.token_service.consume(token, "reset", replay=False)
+        if not success:
+            return False, message
+        if not self.update_user_password(record["email"], new_password):
+            # A failed update gives the link back, so it can be retried
+            self.token_service.release(token, "reset", record)
+            return False, ERROR_MESSAGES["api_error"]
+        return True, ""
+
+    def update_user_password(self, email, new_password):
+        """Store a new password for ``email``; False if no user has that email or the update failed."""
         try:
-            print(f"Attempting to save reset token for email: {email}")
-            print(f"Using Supabase URL: {SUPABASE_URL}")
-            print(f"Using Supabase key length: {len(SUPABASE_SERVICE_ROLE_KEY) if SUPABASE_SERVICE_ROLE_KEY else 0}")
-            
-            response = self.supabase.table("password_resets").insert({
-                "email": email,
-                "token": token,
-                "expiry": expiry.isoformat()
-            }).execute()
-            
-            print(f"Reset token saved successfully: {response}")
+            response = self.supabase.table("users").update({
+                "password": self._hash_password(new_password)
+            }).eq("email", email).execute()
+            if not response.data:
+                self.logger.log_auth_event('password_reset', success=False, details={'error': 'user_not_found'})
+                return False
+            for user in response.data:
+                self.revoke_user_sessions(user["id"])
+            self.logger.log_auth_event('password_reset', response.data[0]["id"], success=True)
             return True
         except Exception as e:
-            print(f"Error saving reset token: {str(e)}")
-            self.logger.log_auth_event('save_reset_token', success=False, details={'error': str(e)})
-            raise
\ No newline at end of file
+            self.logger.log_auth_event('password_reset', success=False, details={'error': str(e)})
+            return False
+
+    def delete_reset_token(self, token):
+        return self.token_service.consume(token, "reset")
@@ -0,0 +1,195 @@
+"""Run a JSONL file of questions through the nutrition prompt.
+
+Each input line is an object with ``phase``, ``goal``, ``diet`` (list or
+comma-separated string) and ``question``, plus an optional ``id`` (the line
+number is used otherwise). Results are appended to the output JSONL as they
+finish; re-running with the same output skips records already answered, so
+an interrupted run resumes where it stopped.
+
+    python batch_runner.py questions.jsonl results.jsonl --concurrency 8 --rate 2
+    python batch_runner.py questions.jsonl results.jsonl --fake
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Dict, Iterator, Optional
+
+from fake_llm import FakeChatModel, approx_tokens
+from utils import build_llm_chain, build_chain_inputs
+
+
+class RateLimiter:
+    """Async token bucket: at most ``rate`` starts per second, bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record.setdefault("id", line_number)
+            if isinstance(record.get("diet"), list):
+                record["diet"] = ", ".join(record["diet"])
+            record.setdefault("diet", "")
+            record.setdefault("goal", "")
+            yield record
+
+
+def completed_ids(path: str) -> set:
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from an interrupted run
+                if result.get("error") is None:
+                    done.add(result["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+async def answer(runnable, record: Dict, retries: int, limiter: RateLimiter, timeout: float) -> Dict:
+    inputs = build_chain_inputs(record["phase"], record["goal"], record["diet"], record["question"])
+    error = None
+    for attempt in range(1, retries + 2):
+        await limiter.acquire()
+        started = time.perf_counter()
+        try:
+            message = await asyncio.wait_for(runnable.ainvoke(inputs), timeout)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempt <= retries:
+                await asyncio.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.5))
+            continue
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = getattr(message, "usage_metadata", None) or {}
+        return {
+            **record,
+            "answer": message.content,
+            "latency_ms": round(latency_ms, 1),
+            "prompt_tokens": usage.get("input_tokens", approx_tokens(str(inputs))),
+            "completion_tokens": usage.get("output_tokens", approx_tokens(message.content)),
+            "attempts": attempt,
+            "error": None
+        }
+    return {**record, "answer": None, "latency_ms": None, "prompt_tokens": 0,
+            "completion_tokens": 0, "attempts": retries + 1, "error": error}
+
+
+async def run_batch(input_path: str, output_path: str, runnable, concurrency: int = 4,
+                    rate: float = 0, retries: int = 3, timeout: float = 120) -> Dict:
+    done = completed_ids(output_path)
+    limiter = RateLimiter(rate, burst=concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = []
+    skipped = 0
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            while True:
+                record = await queue.get()
+                if record is None:
+                    return
+                result = await answer(runnable, record, retries, limiter, timeout)
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                results.append(result)
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        for record in read_records(input_path):
+            if record["id"] in done:
+                skipped += 1
+                continue
+            await queue.put(record)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+
+    return summarize(results, skipped, elapsed)
+
+
+def summarize(results, skipped: int, elapsed: float) -> Dict:
+    ok = [r for r in results if r["error"] is None]
+    latencies = sorted(r["latency_ms"] for r in ok)
+
+    def percentile(p: float) -> Optional[float]:
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        "processed": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "skipped_already_done": skipped,
+        "retried": sum(1 for r in results if r["attempts"] > 1),
+        "elapsed_s": round(elapsed, 2),
+        "records_per_s": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_ms_p50": statistics.median(latencies) if latencies else None,
+        "latency_ms_p95": percentile(0.95),
+        "latency_ms_p99": percentile(0.99),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in ok),
+        "completion_tokens": sum(r["completion_tokens"] for r in ok)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of questions through the nutrition prompt.")
+    parser.add_argument("input", help="JSONL with phase, goal, diet, question (and optional id)")
+    parser.add_argument("output", help="JSONL results; existing successful records are skipped")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="max requests started per second (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per attempt")
+    parser.add_argument("--summary", help="also write the summary report as JSON to this path")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model")
+    parser.add_argument("--fake-latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    chain = build_llm_chain(FakeChatModel(latency=args.fake_latency) if args.fake else None)
+    runnable = chain.prompt | chain.llm
+
+    summary = asyncio.run(run_batch(
+        args.input, args.output, runnable,
+        concurrency=args.concurrency, rate=args.rate, retries=args.retries, timeout=args.timeout
+    ))
+    report = json.dumps(summary, indent=2)
+    print(report)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
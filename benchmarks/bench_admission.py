@@ -0,0 +1,68 @@
+"""Show how the admission controller shares a tight LLM budget.
+
+A burst of guest calls arrives together with a trickle of logged-in calls
+against a budget of ``--rpm`` requests per minute. Reports admission wait
+per class and how many guest calls were shed.
+
+    python benchmarks/bench_admission.py --rpm 600 --guests 200 --users 40
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import (  # noqa: E402
+    PRIORITY_GUEST, PRIORITY_USER, AdmissionController, AdmissionRejected, LocalBudget
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--guests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--depth", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    controller = AdmissionController(LocalBudget(args.rpm, 10 ** 9), max_depth=args.depth, timeout=args.timeout)
+    controller.budget.requests = 0  # start with the burst allowance spent
+    waits = {PRIORITY_USER: [], PRIORITY_GUEST: []}
+    rejected = {PRIORITY_USER: 0, PRIORITY_GUEST: 0}
+    lock = threading.Lock()
+
+    def call(user_id, priority):
+        started = time.monotonic()
+        try:
+            controller.acquire(user_id, priority, tokens=1500)
+        except AdmissionRejected:
+            with lock:
+                rejected[priority] += 1
+            return
+        with lock:
+            waits[priority].append((time.monotonic() - started) * 1000)
+
+    arrivals = [(f"guest-{i % 20}", PRIORITY_GUEST) for i in range(args.guests)]
+    arrivals += [(f"user-{i}", PRIORITY_USER) for i in range(args.users)]
+    random.Random(3).shuffle(arrivals)
+    threads = [threading.Thread(target=call, args=arrival) for arrival in arrivals]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.002)
+    for thread in threads:
+        thread.join()
+
+    for priority, label in ((PRIORITY_USER, "logged-in"), (PRIORITY_GUEST, "guest")):
+        samples = sorted(waits[priority]) or [0.0]
+        print(f"{label:<10} admitted {len(waits[priority]):4d}   rejected/shed {rejected[priority]:4d}   "
+              f"wait p50 {statistics.median(samples):8.1f} ms   p95 {samples[int(len(samples) * 0.95)]:8.1f} ms")
+    print(controller.get_metrics())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare chat throughput of the HTTP API with the Streamlit path.
+
+Both paths run against the fake model (LLM_BACKEND=fake). The API is driven
+in-process through httpx's ASGI transport with auth bypassed and chats
+stored in the in-memory database; the Streamlit
+path submits the chat input through AppTest, which needs the app's usual
+.env to construct its services.
+
+    LLM_BACKEND=fake python benchmarks/bench_api_throughput.py --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+from local_supabase import LocalSupabase  # noqa: E402
+from profile_service import ProfileService  # noqa: E402
+
+PAYLOAD = {"phase": "Luteal", "goal": "More energy", "diet": ["Vegan"], "question": "What should I eat today?"}
+
+
+async def bench_api(total, concurrency):
+    profiles = ProfileService(supabase=LocalSupabase())
+    api.get_profile_service = lambda: profiles
+    api.app.dependency_overrides[api.current_user] = lambda: "bench-user"
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.post("/v1/chat", json=PAYLOAD)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    stored = len(profiles.supabase.tables["chat_history"])
+    assert stored == 2 * total, f"{stored} chat messages stored for {total} requests"
+    return total / elapsed
+
+
+def bench_streamlit(total):
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(ROOT)
+    at = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=60).run()
+    at = next(b for b in at.button if b.label == "Continue as Guest").click().run()
+    at = at.selectbox[1].select("Luteal").run()
+    started = time.perf_counter()
+    for _ in range(total):
+        at = at.chat_input[0].set_value(PAYLOAD["question"]).run()
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--skip-streamlit", action="store_true")
+    args = parser.parse_args()
+
+    print(f"api        {asyncio.run(bench_api(args.requests, args.concurrency)):8.1f} req/s "
+          f"({args.concurrency} concurrent)")
+    if not args.skip_streamlit:
+        streamlit_requests = max(1, args.requests // 10)
+        print(f"streamlit  {bench_streamlit(streamlit_requests):8.1f} req/s (one session, {streamlit_requests} reruns)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measure Streamlit script execution time per interaction type.
+
+Drives streamlit_app.py through AppTest in guest mode and times each kind of
+interaction; every step must finish without an exception or error element.
+AppTest always reruns the whole script, so interactions inside a fragment
+are timed there as full reruns. What a fragment rerun costs is measured
+separately by running the chat history region on its own with the same
+history. Needs the same .env / secrets as the app itself.
+
+    python benchmarks/bench_app_reruns.py --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+
+
+def _timed(label, results, action):
+    started = time.perf_counter()
+    at = action()
+    results.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+    problems = [exc.message for exc in at.exception] + [error.value for error in at.error]
+    assert not problems, f"{label}: {problems}"
+    return at
+
+
+def _history(length):
+    return [
+        ("user" if i % 2 == 0 else "assistant", f"message {i} " + "lorem ipsum " * 40)
+        for i in range(length)
+    ]
+
+
+def chat_region(history_length):
+    """The body of the app's chat fragment, run as a script of its own."""
+    # AppTest runs only this function's source, so it imports and builds what it needs
+    import streamlit as st
+    from chat_view import render_chat_history
+
+    history = [
+        ("user" if i % 2 == 0 else "assistant", f"message {i} " + "lorem ipsum " * 40)
+        for i in range(history_length)
+    ]
+    st.header("Chat History")
+    render_chat_history(history)
+
+
+def run_once(results, history_length):
+    os.chdir(ROOT)
+    at = AppTest.from_file(APP_PATH, default_timeout=30)
+    at = _timed("initial_load", results, at.run)
+    guest_button = next(b for b in at.button if b.label == "Continue as Guest")
+    at = _timed("enter_guest_mode", results, guest_button.click().run)
+    at.session_state["chat_history"] = _history(history_length)
+    at = _timed("select_support_goal", results, at.selectbox[0].select(at.selectbox[0].options[2]).run)
+    at = _timed("select_phase", results, at.selectbox[1].select("Luteal").run)
+    at = _timed("type_feedback", results, at.text_area(key="feedback_text").input("Nice app").run)
+    at = _timed("submit_feedback", results, at.button(key="submit_feedback").click().run)
+    assert at.text_area(key="feedback_text").value == "" and at.success, "feedback was not submitted"
+    if history_length > 20:
+        at = _timed("load_earlier_chat", results, at.button(key="load_earlier_chat").click().run)
+
+    region = AppTest.from_function(chat_region, args=(history_length,), default_timeout=30)
+    region = _timed("fragment:chat_region", results, region.run)
+    if history_length > 20:
+        _timed("fragment:load_earlier_chat", results, region.button(key="load_earlier_chat").click().run)
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--history", type=int, default=200, help="chat messages preloaded into the session")
+    args = parser.parse_args()
+
+    results = {}
+    for _ in range(args.repeat):
+        try:
+            run_once(results, args.history)
+        except AssertionError as e:
+            print(f"FAIL: {e}", file=sys.stderr)
+            return 1
+
+    print(f"{'interaction':<28}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for label, samples in results.items():
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{label:<28}{len(samples):>6}{statistics.median(samples):>10.1f}{p95:>10.1f}{samples[-1]:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
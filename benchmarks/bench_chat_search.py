@@ -0,0 +1,119 @@
+"""Chat history search: index size, build time and query latency.
+
+Fills one user's history in the in-memory database with synthetic
+assistant-style messages, then compares the inverted index with scanning
+the rows for each query (fetch the history, test every message). Phrase
+results are checked against the scan, and messages added afterwards must
+be searchable straight away.
+
+    python benchmarks/bench_chat_search.py --messages 10000 50000
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_search import ChatSearchService  # noqa: E402
+from local_supabase import LocalSupabase  # noqa: E402
+from profile_service import ProfileService  # noqa: E402
+
+USER_ID = "user-1"
+FOODS = ("flax seeds", "pumpkin seeds", "sesame seeds", "sunflower seeds", "lentils", "salmon", "spinach",
+         "dark chocolate", "sweet potato", "quinoa", "avocado", "broccoli", "walnuts", "oats", "kale",
+         "chickpeas", "berries", "eggs", "tofu", "brown rice", "ginger tea", "almonds", "beetroot")
+WORDS = ("your", "phase", "luteal", "follicular", "menstrual", "ovulatory", "energy", "hormone", "balance",
+         "iron", "magnesium", "zinc", "fibre", "protein", "support", "try", "eat", "more", "with", "and",
+         "the", "for", "during", "helps", "cravings", "cycle", "breakfast", "lunch", "dinner", "snack",
+         "week", "day", "warm", "raw", "cooked", "portion", "mood", "sleep", "digestion", "estrogen")
+# A long tail of rarer words, as real answers have, on top of the common ones
+TAIL = tuple(f"{a}{b}" for a in ("bal", "cor", "dem", "fen", "gol", "hum", "lin", "mor", "nub", "pra")
+             for b in ("ance", "ary", "ent", "ing", "ion", "ity", "ment", "ness", "ory", "ure"))
+QUERIES = ("seeds", "magnesium cravings", "dark chocolate luteal", '"pumpkin seeds"', '"sweet potato" dinner',
+           "ashwagandha")
+
+
+def message(rng):
+    words = [rng.choice(WORDS) if rng.random() < 0.6 else rng.choice(TAIL) + str(rng.randrange(20))
+             for _ in range(rng.randint(8, 80))]
+    for _ in range(rng.randint(0, 3)):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FOODS))
+    return " ".join(words)
+
+
+def seed(supabase, messages, rng, chunk=5000):
+    for start in range(0, messages, chunk):
+        supabase.table("chat_history").insert([
+            {"user_id": USER_ID, "role": "assistant" if i % 2 else "user", "message": message(rng),
+             "timestamp": f"2026-01-01T00:00:{i:06d}"}
+            for i in range(start, min(messages, start + chunk))
+        ]).execute()
+
+
+def scan(supabase, query):
+    """What search costs without an index: fetch everything, test each message."""
+    phrases = re.findall(r'"([^"]+)"', query)
+    words = re.sub(r'"[^"]+"', " ", query).split()
+    rows = supabase.table("chat_history").select("id, message").eq("user_id", USER_ID).execute().data
+    return [row["id"] for row in rows
+            if all(p in row["message"] for p in phrases)
+            and (phrases or any(w in row["message"] for w in words))]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, statistics.median(samples), samples[int(len(samples) * 0.99) - 1 if len(samples) > 1 else 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    ok = True
+    for messages in args.messages:
+        rng = random.Random(messages)
+        supabase = LocalSupabase()
+        seed(supabase, messages, rng)
+        search = ChatSearchService(supabase=supabase)
+        profiles = ProfileService(supabase=supabase, chat_search=search)
+
+        index, build_ms, _ = timed(lambda: search.get_index(USER_ID), 1)
+        text_bytes = sum(len(row["message"].encode()) for row in supabase.tables["chat_history"])
+        print(f"\n{messages} messages, {text_bytes / 1e6:.1f} MB of text: index built in {build_ms:.0f} ms, "
+              f"{index.nbytes / 1e6:.2f} MB postings ({index.nbytes / text_bytes:.0%} of the text), "
+              f"{len(index.postings)} terms")
+        print(f"  {'query':<24} {'scan p50':>10} {'index p50':>10} {'index p99':>10} {'hits':>6}")
+        for query in QUERIES:
+            matches, scan_ms, _ = timed(lambda: scan(supabase, query), 3)
+            _, index_ms, index_p99 = timed(lambda: index.search(query), args.repeat)
+            print(f"  {query:<24} {scan_ms:8.1f} ms {index_ms:8.2f} ms {index_p99:8.2f} ms {len(matches):>6}")
+            if query.startswith('"') and query.count('"') == 2:
+                every = {hit.message_id for hit in index.search(query, limit=messages)}
+                ok &= every == set(matches)
+
+        # New messages go through ProfileService and are found without a rebuild
+        started = time.perf_counter()
+        for i in range(200):
+            profiles.add_chat_message(USER_ID, "assistant", f"try ashwagandha tea number {i} before bed")
+        add_us = (time.perf_counter() - started) / 200 * 1e6
+        _, hits, _ = search.search(USER_ID, "ashwagandha", limit=500)
+        print(f"  200 messages added after the build ({add_us:.0f} µs each incl. insert): "
+              f"'ashwagandha' now has {len(hits)} hits")
+        ok &= len(hits) == 200
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Cost of logging a period as a user's history grows.
+
+record_period folds the new start into the stored statistics, so its cost
+should stay flat; recomputing from the full history (what the backfill
+path does) grows with it.
+
+    python benchmarks/bench_cycle_stats.py --history 10 100 1000 --db-latency 0.002
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_supabase import LocalSupabase  # noqa: E402
+from profile_service import ProfileService  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    for size in args.history:
+        supabase = LocalSupabase()
+        service = ProfileService(supabase=supabase)
+        user_id = f"user-{size}"
+        supabase.table("profiles").insert({"user_id": user_id}).execute()
+        period = date.today() - timedelta(days=30 * (size + args.samples + 1))
+        for _ in range(size):
+            period += timedelta(days=rng.randint(25, 33))
+            service.record_period(user_id, period)
+
+        supabase.latency = args.db_latency
+        incremental, requests = [], supabase.requests
+        for _ in range(args.samples):
+            period += timedelta(days=rng.randint(25, 33))
+            started = time.perf_counter()
+            service.record_period(user_id, period)
+            incremental.append((time.perf_counter() - started) * 1000)
+        requests = (supabase.requests - requests) / args.samples
+
+        started = time.perf_counter()
+        for _ in range(args.samples):
+            service._rebuild_cycle_stats(user_id, 0)
+        rebuild = (time.perf_counter() - started) * 1000 / args.samples
+
+        print(f"history {size:>5}   record_period {sorted(incremental)[len(incremental) // 2]:6.1f} ms "
+              f"({requests:.0f} queries)   full recompute {rebuild:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Send the daily digest to a seeded local user base over a local SMTP server.
+
+Runs a partial send (as if the process died part-way), then a full run for
+the same date, and checks that nobody got the email twice.
+
+    python benchmarks/bench_digest.py --users 5000 --rate 0 --connections 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from local_smtp import LocalSMTPServer  # noqa: E402
+from local_supabase import LocalSupabase  # noqa: E402
+
+
+def seed(supabase, users: int, today: date):
+    from config import DIETARY_OPTIONS, SUPPORT_OPTIONS
+    rng = random.Random(7)
+    supabase.table("users").insert([
+        {"id": f"user-{i:07d}", "email": f"user{i}@example.com", "email_verified": i % 10 != 0}
+        for i in range(users)
+    ]).execute()
+    supabase.table("profiles").insert([
+        {
+            "user_id": f"user-{i:07d}",
+            "phase": None,
+            "goal": rng.choice(SUPPORT_OPTIONS),
+            "diet": rng.sample(DIETARY_OPTIONS, rng.choice([0, 0, 1, 1, 2])),
+            "last_period": (today - timedelta(days=rng.randrange(0, 35))).isoformat()
+        }
+        for i in range(users)
+    ]).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=0, help="emails per second (0 = unthrottled)")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--smtp-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    smtp = LocalSMTPServer(latency=args.smtp_latency).start()
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(smtp.port), "SMTP_STARTTLS": "false",
+        "SMTP_USERNAME": "bench", "SMTP_PASSWORD": "bench", "SENDER_EMAIL": "noreply@example.com"
+    })
+    from digest_sender import DigestSender  # after SMTP settings are in the environment
+    from email_dispatcher import EmailDispatcher
+    from email_service import EmailService, SMTPConnectionPool
+    from knowledge_base import get_knowledge_base
+
+    today = date.today()
+    supabase = LocalSupabase()
+    seed(supabase, args.users, today)
+    state_dir = tempfile.mkdtemp(prefix="digest-")
+
+    def run(limit=None):
+        sender = DigestSender(
+            supabase,
+            SMTPConnectionPool(EmailService(), size=args.connections),
+            EmailDispatcher(workers=args.connections, rate=args.rate),
+            get_knowledge_base(),
+            state_dir=state_dir
+        )
+        return sender.run(today, limit=limit)
+
+    first = run(limit=args.users // 3)
+    print(f"interrupted run  sent {first['queued']:>6}  {first['emails_per_s']} emails/s  "
+          f"buckets {first['buckets']}  smtp connections {first['smtp_connections_opened']}")
+    second = run()
+    print(f"resumed run      sent {second['queued']:>6}  {second['emails_per_s']} emails/s  "
+          f"buckets {second['buckets']}  smtp connections {second['smtp_connections_opened']}  "
+          f"skipped already sent {second['already_sent']}")
+
+    per_recipient = Counter(r for _, recipients, _ in smtp.messages for r in recipients)
+    duplicates = sum(1 for count in per_recipient.values() if count > 1)
+    verified = sum(1 for i in range(args.users) if i % 10 != 0)
+    print(f"delivered {len(per_recipient)} of {verified} verified users, duplicates {duplicates}, "
+          f"smtp sessions {smtp.connections}")
+
+
+if __name__ == "__main__":
+    main()
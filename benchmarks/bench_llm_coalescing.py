@@ -0,0 +1,189 @@
+"""Upstream calls saved by coalescing identical in-flight prompts.
+
+Checks that N concurrent identical questions cost exactly one upstream
+call (answers, errors and streamed chunks all shared), that a waiter on a
+wedged leader times out on its own, and then replays a campaign burst:
+sessions clicking one of the suggested questions within seconds of each
+other, mixed with free-text questions.
+
+    python benchmarks/bench_llm_coalescing.py --burst 50 --sessions 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+
+from fake_llm import FakeChatModel  # noqa: E402
+from llm_resilience import ResilientChain  # noqa: E402
+from single_flight import SingleFlight, StreamFlight  # noqa: E402
+from utils import astream_chain, build_chain_inputs, build_llm_chain  # noqa: E402
+
+
+# The app's sidebar questions that go to the model
+SUGGESTED_QUESTIONS = [
+    "Give me a personal overview of foods for each of the 4 cycle phases to start experimenting with.",
+    "What foods are best for my current cycle phase?",
+    "Give me a 3-day breakfast plan.",
+    "Why is organic food important for my cycle?"
+]
+
+
+class UpstreamCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+
+def chain_with_counter(**model_args):
+    counter = UpstreamCounter()
+    return build_llm_chain(FakeChatModel(callbacks=[counter], **model_args)), counter
+
+
+def burst(run, inputs, n):
+    """``n`` threads released together, each asking the same question."""
+    gate = threading.Barrier(n)
+
+    def one(_):
+        gate.wait()
+        try:
+            return run(inputs)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(n) as pool:
+        return list(pool.map(one, range(n)))
+
+
+def check(label, ok):
+    print(f"{'ok  ' if ok else 'FAIL'} {label}")
+    return ok
+
+
+def identical_bursts(n):
+    inputs = build_chain_inputs("Luteal", "More energy", ["Vegetarian"], SUGGESTED_QUESTIONS[0])
+    results = []
+
+    chain, counter = chain_with_counter(latency=0.2)
+    answers = burst(ResilientChain(chain, hedge=False, coalesce=False).run, inputs, n)
+    results.append(check(f"without coalescing: {n} identical questions -> {counter.calls} upstream calls",
+                         counter.calls == n))
+
+    chain, counter = chain_with_counter(latency=0.2)
+    resilient = ResilientChain(chain, hedge=False)
+    answers = burst(resilient.run, inputs, n)
+    results.append(check(f"with coalescing: {n} identical questions -> {counter.calls} upstream call, "
+                         f"{len(set(answers))} distinct answer", counter.calls == 1 and len(set(answers)) == 1))
+    print(f"     {resilient.flight.get_metrics()}")
+
+    failing_inputs = dict(inputs, context="None")  # no knowledge-base fallback either
+    chain, counter = chain_with_counter(latency=0.2, error_ratio=1.0)
+    answers = burst(ResilientChain(chain, hedge=False, max_retries=0).run, failing_inputs, n)
+    results.append(check(f"upstream error: {counter.calls} upstream call, every caller gets the error "
+                         f"({answers[0]!r})", counter.calls == 1 and len(set(answers)) == 1 and "Error" in answers[0]))
+
+    flight = SingleFlight()
+    release = threading.Event()
+    outcomes = []
+
+    def wedged():
+        release.wait(5)
+        return "late"
+
+    def waiter():
+        try:
+            outcomes.append(flight.do("key", wedged, timeout=0.2)[0])
+        except TimeoutError:
+            outcomes.append("timeout")
+
+    leader = threading.Thread(target=waiter)
+    leader.start()
+    time.sleep(0.05)
+    waiters = [threading.Thread(target=waiter) for _ in range(5)]
+    for thread in waiters:
+        thread.start()
+    for thread in waiters:
+        thread.join()
+    release.set()
+    leader.join()
+    results.append(check(f"wedged leader: waiters time out after 0.2 s, leader still answers "
+                         f"({sorted(outcomes)})", sorted(outcomes) == ["late"] + ["timeout"] * 5))
+
+    async def streams():
+        chain, counter = chain_with_counter(latency=0.2)
+        flight = StreamFlight(idle_timeout=5)
+
+        async def subscriber(delay):
+            await asyncio.sleep(delay)
+            parts = []
+            async for chunk in flight.subscribe("q", lambda: astream_chain(chain, inputs)):
+                parts.append(chunk)
+            return "".join(parts)
+
+        # Half join while the upstream is still thinking, half after chunks have started
+        texts = await asyncio.gather(*(subscriber(0.25 if i % 2 else 0) for i in range(n)))
+        return counter.calls, texts, flight.get_metrics()
+
+    calls, texts, metrics = asyncio.run(streams())
+    results.append(check(f"streaming fan-out: {n} subscribers -> {calls} upstream stream, "
+                         f"{len(set(texts))} distinct text", calls == 1 and len(set(texts)) == 1 and texts[0]))
+    print(f"     {metrics}")
+    return all(results)
+
+
+def campaign(sessions, window, latency, concurrency, coalesce):
+    """Sessions arriving over ``window`` seconds; 80% click a suggested question."""
+    rng = random.Random(5)
+    chain, counter = chain_with_counter(latency=latency)
+    resilient = ResilientChain(chain, hedge=False, coalesce=coalesce)
+    jobs = []
+    for i in range(sessions):
+        question = rng.choice(SUGGESTED_QUESTIONS) if rng.random() < 0.8 else f"free text question {i}"
+        jobs.append((rng.uniform(0, window), build_chain_inputs("Follicular", "More energy", [], question)))
+    jobs.sort(key=lambda job: job[0])
+
+    started = time.perf_counter()
+
+    def one(job):
+        at, inputs = job
+        time.sleep(max(0.0, at - (time.perf_counter() - started)))
+        resilient.run(inputs)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, jobs))
+    return counter.calls, time.perf_counter() - started, resilient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--window", type=float, default=10.0, help="seconds over which the sessions arrive")
+    parser.add_argument("--latency", type=float, default=1.5, help="fake upstream seconds per answer")
+    parser.add_argument("--concurrency", type=int, default=256)
+    args = parser.parse_args()
+
+    passed = identical_bursts(args.burst)
+
+    print(f"\ncampaign: {args.sessions} sessions over {args.window:.0f} s, {args.latency} s per upstream answer")
+    for coalesce in (False, True):
+        calls, elapsed, resilient = campaign(args.sessions, args.window, args.latency, args.concurrency, coalesce)
+        ratio = resilient.flight.get_metrics()["coalescing_ratio"] if resilient.flight else 0.0
+        print(f"  coalescing {'on ' if coalesce else 'off'}  upstream calls {calls:>5}  "
+              f"coalescing ratio {ratio:6.1%}  wall {elapsed:5.1f} s")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Compare answer latency with and without the resilience layer.
+
+Runs the same questions through the plain chain and through ResilientChain,
+both backed by the fake model with a share of injected slow responses, and
+then through a simulated outage to show the circuit breaker failing fast.
+
+    python benchmarks/bench_llm_tail.py --calls 400 --slow-ratio 0.03 --slow-latency 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import FakeChatModel  # noqa: E402
+from llm_resilience import CircuitBreaker, ResilientChain  # noqa: E402
+from utils import build_chain_inputs, build_llm_chain  # noqa: E402
+
+
+def timed_calls(run, inputs, calls, concurrency):
+    def one(_):
+        started = time.perf_counter()
+        try:
+            run(inputs)
+        except Exception:
+            pass
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = sorted(pool.map(one, range(calls)))
+    return samples
+
+
+def report(label, samples):
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))]  # noqa: E731
+    print(f"{label:<28} p50 {statistics.median(samples):8.1f} ms   p95 {pick(0.95):8.1f} ms   "
+          f"p99 {pick(0.99):8.1f} ms   max {samples[-1]:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--slow-ratio", type=float, default=0.03)
+    args = parser.parse_args()
+
+    inputs = build_chain_inputs("Luteal", "More energy", ["Vegetarian"], "What should I eat for dinner?")
+    model = FakeChatModel(latency=args.latency, slow_latency=args.slow_latency, slow_ratio=args.slow_ratio)
+    chain = build_llm_chain(model)
+
+    report("plain chain", timed_calls(chain.run, inputs, args.calls, args.concurrency))
+
+    resilient = ResilientChain(chain, deadline=10, hedge_min_delay=args.latency * 2)
+    timed_calls(resilient.run, inputs, 50, args.concurrency)  # warm the latency window
+    report("deadline + retry + hedge", timed_calls(resilient.run, inputs, args.calls, args.concurrency))
+    print(f"  {resilient.metrics}")
+
+    outage = ResilientChain(build_llm_chain(FakeChatModel(latency=args.latency, error_ratio=1.0)),
+                            deadline=10, breaker=CircuitBreaker(failure_threshold=5, cooldown=60))
+    report("upstream outage (breaker)", timed_calls(outage.run, inputs, args.calls, args.concurrency))
+    print(f"  {outage.metrics}  breaker={outage.breaker.state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""LLM calls per meal-plan conversation: free text vs a stored structured plan.
+
+Replays the same conversation both ways against the fake model: ask for a
+plan, then a shopping list, a swap, a vegan version and a PDF, and later
+ask for the same plan again. Free text needs a generation per turn; with a
+stored plan only the first request reaches the model.
+
+    python benchmarks/bench_meal_plans.py --latency 1.0 --users 50
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+
+from fake_llm import FakeChatModel  # noqa: E402
+from knowledge_base import get_knowledge_base  # noqa: E402
+from local_supabase import LocalSupabase  # noqa: E402
+from meal_plan_service import (  # noqa: E402
+    MealPlan,
+    MealPlanService,
+    filter_plan,
+    format_grocery_list,
+    grocery_list,
+    parse_meal_plan,
+    parse_plan_followup,
+    parse_plan_request,
+    plan_chain_inputs,
+    plan_to_text,
+    profile_key,
+    swap_meal
+)
+from pdf_export import recommendations_to_pdf  # noqa: E402
+from utils import build_chain_inputs, build_llm_chain, build_meal_plan_chain  # noqa: E402
+
+CONVERSATION = [
+    "Give me a 3-day breakfast plan.",
+    "Can I get a shopping list for that?",
+    "Swap day 2 breakfast please",
+    "Make it vegan",
+    "Download this as a PDF",
+    "Give me a 3-day breakfast plan."
+]
+PROFILE = ("Luteal", "More energy", [])
+
+
+class UpstreamCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage", {})
+        with self._lock:
+            self.tokens += usage.get("total_tokens", 0)
+
+
+def free_text(chain, user_id):
+    for question in CONVERSATION:
+        chain.run(build_chain_inputs(*PROFILE, question))
+
+
+def structured(chain, service, user_id):
+    phase, goal, diet = PROFILE
+    plan, plan_id, local_ms = None, None, []
+    for question in CONVERSATION:
+        started = time.perf_counter()
+        followup = parse_plan_followup(question) if plan is not None else None
+        if followup is not None:
+            action, args = followup
+            if action == "grocery":
+                format_grocery_list(grocery_list(plan))
+            elif action == "swap":
+                plan = swap_meal(plan, args["day"], args["meal"], diet)[0]
+            elif action == "filter":
+                plan = filter_plan(plan, args["dietary_preferences"])[0]
+            else:
+                recommendations_to_pdf(plan_to_text(plan), plan.title)
+            if action in ("swap", "filter"):
+                service.update_plan(user_id, plan_id, plan)
+            local_ms.append((time.perf_counter() - started) * 1000)
+            continue
+        request = parse_plan_request(question)
+        profile = profile_key(phase, goal, diet)
+        _, row, _ = service.get_plan(user_id, profile, request)
+        if row is not None:
+            plan, plan_id = MealPlan.model_validate(row["plan"]), row["id"]
+            local_ms.append((time.perf_counter() - started) * 1000)
+            continue
+        context = get_knowledge_base().context_for(question, phase, goal, diet)
+        plan = parse_meal_plan(chain.run(plan_chain_inputs(request, phase, goal, diet, context)))
+        assert plan is not None, "fake model returned an invalid plan"
+        plan_id = service.save_plan(user_id, profile, request, plan, phase)[1]["id"]
+    return local_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=1.0, help="fake upstream seconds per answer")
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    counter = UpstreamCounter()
+    chain = build_llm_chain(FakeChatModel(latency=args.latency, callbacks=[counter]))
+    started = time.perf_counter()
+    for i in range(args.users):
+        free_text(chain, f"user-{i}")
+    elapsed = time.perf_counter() - started
+    print(f"free text        {counter.calls:>5} LLM calls  {counter.tokens:>8} tokens  "
+          f"{elapsed / args.users:6.2f} s per conversation")
+
+    counter = UpstreamCounter()
+    chain = build_meal_plan_chain(FakeChatModel(latency=args.latency, callbacks=[counter]))
+    service = MealPlanService(supabase=LocalSupabase())
+    local_ms = []
+    started = time.perf_counter()
+    for i in range(args.users):
+        local_ms += structured(chain, service, f"user-{i}")
+    elapsed = time.perf_counter() - started
+    local_ms.sort()
+    print(f"structured plan  {counter.calls:>5} LLM calls  {counter.tokens:>8} tokens  "
+          f"{elapsed / args.users:6.2f} s per conversation")
+    print(f"  follow-ups answered locally: {len(local_ms)}, p50 {local_ms[len(local_ms) // 2]:.1f} ms, "
+          f"max {local_ms[-1]:.1f} ms (PDF included)")
+    return 0 if counter.calls == args.users else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
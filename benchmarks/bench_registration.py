@@ -0,0 +1,83 @@
+"""Measure registration latency against a local database and SMTP stand-in.
+
+Compares the previous request-thread flow (existence check, hash, insert,
+token insert and SMTP send all inline) with AuthService.register_user,
+which does one insert plus hashing and leaves the email to the dispatcher.
+
+    python benchmarks/bench_registration.py --users 40 --db-latency 0.01 --smtp-latency 0.3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_smtp import LocalSMTPServer  # noqa: E402
+from local_supabase import LocalSupabase  # noqa: E402
+
+
+def inline_register(auth, email, password):
+    """The registration flow as it was: every step on the request thread."""
+    if auth.supabase.table("users").select("*").eq("email", email).execute().data:
+        return False
+    user_id = str(uuid.uuid4())
+    auth.supabase.table("users").insert({
+        "id": user_id, "email": email, "password": auth._hash_password(password),
+        "email_verified": False, "created_at": datetime.utcnow().isoformat(), "last_login": None
+    }).execute()
+    token = auth.token_service.issue("verification", email, user_id)
+    return auth.email_service.send_verification_email(user_id, email, token)
+
+
+def timed(fn, emails, concurrency):
+    def one(email):
+        started = time.perf_counter()
+        fn(email)
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return sorted(pool.map(one, emails))
+
+
+def report(label, samples):
+    print(f"{label:<22} p50 {statistics.median(samples):8.1f} ms   p95 {samples[int(len(samples) * 0.95)]:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--smtp-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    smtp = LocalSMTPServer(latency=args.smtp_latency).start()
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(smtp.port), "SMTP_STARTTLS": "false",
+        "SMTP_USERNAME": "bench", "SMTP_PASSWORD": "bench", "SENDER_EMAIL": "noreply@example.com"
+    })
+    from auth_service import AuthService  # after SMTP settings are in the environment
+
+    password = "Benchmark123"
+    old = AuthService(supabase=LocalSupabase(latency=args.db_latency))
+    report("inline (before)", timed(lambda e: inline_register(old, e, password),
+                                    [f"old{i}@example.com" for i in range(args.users)], args.concurrency))
+
+    new = AuthService(supabase=LocalSupabase(latency=args.db_latency))
+    emails = [f"new{i}@example.com" for i in range(args.users)]
+    report("register_user", timed(lambda e: new.register_user(e, password), emails, args.concurrency))
+    report("duplicate email", timed(lambda e: new.register_user(e, password), emails[:10], args.concurrency))
+
+    started = time.perf_counter()
+    new.email_dispatcher.drain(120)
+    print(f"emails delivered {len(smtp.messages)} (dispatcher drained {time.perf_counter() - started:.1f} s after the last "
+          f"registration returned)  {new.email_dispatcher.get_metrics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Measure knowledge-base retrieval latency and prompt size.
+
+Builds a synthetic corpus by repeating the shipped food knowledge with
+varied wording, then times filtered top-k searches and reports how large
+the retrieved context is compared with pasting the whole corpus.
+
+    python benchmarks/bench_retrieval.py --documents 100000 --queries 500
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CYCLE_PHASES, DIETARY_OPTIONS, KNOWLEDGE_BASE_PATH, SUPPORT_OPTIONS  # noqa: E402
+from knowledge_base import KnowledgeBase  # noqa: E402
+
+QUERIES = [
+    "What foods are best for my current cycle phase?",
+    "Give me a 3-day breakfast plan.",
+    "Which foods help with cramps?",
+    "Snacks with iron and vitamin C",
+    "What can I eat for more energy in the afternoon?",
+    "Warm dinner ideas that are easy to digest",
+]
+
+
+def synthetic_corpus(size: int):
+    with open(KNOWLEDGE_BASE_PATH, "r", encoding="utf-8") as f:
+        seed = json.load(f)
+    rng = random.Random(7)
+    words = [w for doc in seed for w in doc["text"].split()]
+    corpus = []
+    for i in range(size):
+        doc = dict(seed[i % len(seed)])
+        doc["id"] = f"{doc['id']}-{i}"
+        doc["text"] = doc["text"] + " " + " ".join(rng.choice(words) for _ in range(12))
+        corpus.append(doc)
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.documents)
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        vector_path = os.path.join(tmp, "vectors.f32")
+        started = time.perf_counter()
+        kb = KnowledgeBase(corpus, vector_path)
+        build_s = time.perf_counter() - started
+        started = time.perf_counter()
+        KnowledgeBase(corpus, vector_path)
+        reload_s = time.perf_counter() - started
+
+        samples, context_chars = [], []
+        for _ in range(args.queries):
+            query = rng.choice(QUERIES)
+            phase = rng.choice(CYCLE_PHASES)
+            goal = rng.choice(SUPPORT_OPTIONS)
+            diet = rng.sample(DIETARY_OPTIONS, rng.randint(0, 2))
+            started = time.perf_counter()
+            context = kb.context_for(query, phase, goal, diet, k=args.k)
+            samples.append((time.perf_counter() - started) * 1000)
+            context_chars.append(len(context))
+        del kb
+
+    samples.sort()
+    corpus_chars = sum(len(doc["text"]) for doc in corpus)
+    print(f"documents              {args.documents}")
+    print(f"index build            {build_s:8.2f} s")
+    print(f"reload (memmap)        {reload_s:8.2f} s")
+    print(f"search p50             {statistics.median(samples):8.2f} ms")
+    print(f"search p99             {samples[int(len(samples) * 0.99)]:8.2f} ms")
+    print(f"context chars (mean)   {statistics.mean(context_chars):8.0f}  (whole corpus: {corpus_chars})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Measure per-session memory accounting and spilling with many sessions.
+
+Creates ``--sessions`` simulated session states with chat histories of
+varying length, accounts them, then runs the reaper as if some minutes and
+then hours had passed: first the memory budget forces the least recently
+used sessions out, then every idle session is spilled to the store.
+
+    python benchmarks/bench_session_memory.py --sessions 5000 --budget-mb 64
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_memory import SessionMemoryManager  # noqa: E402
+from session_store import SQLiteSessionStore, SessionSync  # noqa: E402
+
+
+def new_state(rng):
+    chat = []
+    for i in range(rng.randint(0, 40)):
+        chat.append(("user", f"question {i} " + "about food " * rng.randint(2, 10)))
+        chat.append(("assistant", "Here are some ideas: " + "lentils, greens, seeds. " * rng.randint(10, 60)))
+    return {
+        "logged_in": rng.random() < 0.4,
+        "guest_mode": False,
+        "personalization_completed": True,
+        "phase": "Luteal",
+        "support_goal": "More energy",
+        "dietary_preferences": ["Vegetarian"],
+        "chat_history": chat,
+        "recommendations_response": chat[1][1] if len(chat) > 1 else None,
+        "last_activity": datetime.now(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--budget-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        sync = SessionSync(SQLiteSessionStore(os.path.join(tmp, "sessions.db")))
+        manager = SessionMemoryManager(sync, budget_bytes=args.budget_mb * 1024 * 1024)
+
+        # Per-rerun accounting cost, timed without tracemalloc's allocation hooks
+        touches = []
+        timing = SessionMemoryManager(sync)
+        for i in range(1000):
+            state = new_state(rng)
+            started = time.perf_counter()
+            timing.touch(f"t{i}", state)
+            touches.append((time.perf_counter() - started) * 1e6)
+
+        tracemalloc.start()
+        states = {f"s{i}": new_state(rng) for i in range(args.sessions)}
+        for session_id, state in states.items():
+            sync.persist(session_id, state)
+            manager.touch(session_id, state)
+        resident = tracemalloc.get_traced_memory()[0]
+        accounted = manager.total_bytes()
+
+        started = time.perf_counter()
+        budget = manager.reap(datetime.now() + timedelta(minutes=10))
+        budget_s = time.perf_counter() - started
+        after_budget = tracemalloc.get_traced_memory()[0]
+
+        started = time.perf_counter()
+        idle = manager.reap(datetime.now() + timedelta(hours=2))
+        idle_s = time.perf_counter() - started
+        after_idle = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # A spilled session comes back intact on its next rerun
+        sample_id = next(s for s, state in states.items() if "chat_history" not in state)
+        restored = {}
+        sync.restore(sample_id, restored)
+
+    mb = 1024 * 1024
+    touches.sort()
+    print(f"sessions                    {args.sessions}")
+    print(f"accounted state             {accounted / mb:8.1f} MB   (traced heap {resident / mb:.1f} MB)")
+    print(f"touch per rerun             p50 {statistics.median(touches):6.1f} us   p99 {touches[int(len(touches) * 0.99)]:6.1f} us")
+    print(f"budget reap ({args.budget_mb} MB)        spilled {budget['budget']:5d} in {budget_s:5.2f} s -> heap {after_budget / mb:.1f} MB")
+    print(f"idle reap (SESSION_TIMEOUT) spilled {idle['idle']:5d} in {idle_s:5.2f} s -> heap {after_idle / mb:.1f} MB")
+    print(f"restored sample messages    {len(restored.get('chat_history') or [])}")
+
+
+if __name__ == "__main__":
+    main()
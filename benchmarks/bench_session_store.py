@@ -0,0 +1,72 @@
+"""Measure session-state read/write overhead per rerun.
+
+Simulates reruns of many sessions against the SQLite store: each rerun does
+the persist pass the app runs at the start and end of the script, and every
+few reruns a chat exchange changes the state.
+
+    python benchmarks/bench_session_store.py --sessions 500 --reruns 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SQLiteSessionStore, SessionSync  # noqa: E402
+
+
+def _new_state():
+    return {
+        "logged_in": True,
+        "guest_mode": False,
+        "user_id": "0b6f6f2e-1f4c-4c55-a0a0-7d1b0d6f1c11",
+        "personalization_completed": True,
+        "phase": "Luteal",
+        "support_goal": "More energy",
+        "dietary_preferences": ["Vegetarian", "Gluten free"],
+        "chat_history": [],
+        "recommendations_response": None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--chat-every", type=int, default=4, help="reruns between chat exchanges")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sync = SessionSync(SQLiteSessionStore(os.path.join(tmp, "sessions.db")))
+        states = {f"s{i}": _new_state() for i in range(args.sessions)}
+        unchanged, changed, restores = [], [], []
+
+        for rerun in range(args.reruns):
+            for session_id, state in states.items():
+                if rerun % args.chat_every == 0:
+                    state["chat_history"].append(("user", f"question {rerun}"))
+                    state["chat_history"].append(("assistant", "answer " + "lorem ipsum " * 60))
+                    bucket = changed
+                else:
+                    bucket = unchanged
+                started = time.perf_counter()
+                sync.persist(session_id, state)
+                sync.persist(session_id, state)
+                bucket.append((time.perf_counter() - started) * 1e6)
+
+        # A different worker picking the sessions up from scratch
+        for session_id in states:
+            started = time.perf_counter()
+            sync.restore(session_id, {})
+            restores.append((time.perf_counter() - started) * 1e6)
+
+    for label, samples in (("rerun, no change", unchanged), ("rerun, chat appended", changed), ("restore on new worker", restores)):
+        samples.sort()
+        print(f"{label:<24} p50 {statistics.median(samples):8.1f} us   p99 {samples[int(len(samples) * 0.99)]:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Login latency and database writes with and without the write buffer.
+
+Replays sessions against the in-memory database: each user logs in, then
+changes their personalization widget by widget (goal, a few diet options one
+at a time, phase), and some log in again. Without the buffer every login and
+every change is a blocking write. With it, both only queue, and the
+flusher's batched upserts must leave the same rows behind.
+
+    python benchmarks/bench_write_buffer.py --users 300 --db-latency 0.01
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import bcrypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth_service import AuthService  # noqa: E402
+from config import CYCLE_PHASES, DIETARY_OPTIONS, SUPPORT_OPTIONS  # noqa: E402
+from local_supabase import LocalSupabase  # noqa: E402
+from profile_service import ProfileService  # noqa: E402
+from write_buffer import WriteBuffer  # noqa: E402
+
+PASSWORD = "Benchmark123"
+
+
+def seed(supabase, users):
+    hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(4)).decode()  # cheap rounds: time the writes
+    supabase.table("users").insert([
+        {"id": f"user-{i}", "email": f"user{i}@example.com", "password": hashed, "email_verified": True,
+         "created_at": datetime.utcnow().isoformat(), "last_login": None}
+        for i in range(users)
+    ]).execute()
+    supabase.table("profiles").insert([
+        {"user_id": f"user-{i}", "phase": None, "goal": None, "diet": [], "updated_at": None}
+        for i in range(users)
+    ]).execute()
+
+
+def session_script(rng, i):
+    """The changes one session makes, as ("login", None) or ("profile", fields) steps."""
+    steps = [("login", None)]
+    for _ in range(rng.randint(1, 3)):
+        steps.append(("profile", {"goal": rng.choice(SUPPORT_OPTIONS)}))
+    diet = []
+    for option in rng.sample(DIETARY_OPTIONS, rng.randint(0, 3)):
+        diet.append(option)
+        steps.append(("profile", {"diet": list(diet)}))
+    steps.append(("profile", {"phase": rng.choice(CYCLE_PHASES)}))
+    if rng.random() < 0.3:
+        steps.append(("login", None))
+    return steps
+
+
+def replay(auth, scripts, concurrency, save):
+    login_ms, change_ms = [], []
+
+    def one(item):
+        i, steps = item
+        for kind, fields in steps:
+            started = time.perf_counter()
+            if kind == "login":
+                assert auth.login_user(f"user{i}@example.com", PASSWORD)[0]
+                login_ms.append((time.perf_counter() - started) * 1000)
+            else:
+                assert save(f"user-{i}", dict(fields))[0]
+                change_ms.append((time.perf_counter() - started) * 1000)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, enumerate(scripts)))
+    return sorted(login_ms), sorted(change_ms)
+
+
+def state(supabase):
+    profiles = {row["user_id"]: (row["phase"], row["goal"], row["diet"]) for row in supabase.tables["profiles"]}
+    logged_in = {row["id"] for row in supabase.tables["users"] if row["last_login"]}
+    return profiles, logged_in
+
+
+def report(label, login_ms, change_ms, writes):
+    print(f"{label:<14} login p50 {statistics.median(login_ms):6.1f} ms  "
+          f"widget change p50 {statistics.median(change_ms):7.3f} ms  database writes {writes:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--interval", type=float, default=1.0, help="write buffer flush interval in seconds")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    scripts = [session_script(rng, i) for i in range(args.users)]
+    updates = sum(len(steps) for steps in scripts)
+    print(f"{args.users} sessions, {updates} logins and widget changes, {args.db_latency * 1000:.0f} ms per query")
+
+    direct_db = LocalSupabase(latency=args.db_latency)
+    seed(direct_db, args.users)
+    auth = AuthService(supabase=direct_db)
+    profiles = ProfileService(supabase=direct_db)
+    before = direct_db.requests
+    login_ms, change_ms = replay(auth, scripts, args.concurrency, profiles.update_profile)
+    # Each login also reads the user; count only the writes
+    report("direct", login_ms, change_ms, direct_db.requests - before - len(login_ms))
+
+    buffered_db = LocalSupabase(latency=args.db_latency)
+    seed(buffered_db, args.users)
+    buffer = WriteBuffer(supabase=buffered_db, interval=args.interval)
+    auth = AuthService(supabase=buffered_db, write_buffer=buffer)
+    profiles = ProfileService(supabase=buffered_db, write_buffer=buffer)
+    before = buffered_db.requests
+    login_ms, change_ms = replay(auth, scripts, args.concurrency, profiles.queue_personalization)
+    buffer.close()
+    report("write buffer", login_ms, change_ms, buffered_db.requests - before - len(login_ms))
+    metrics = buffer.get_metrics()
+    print(f"  coalescing ratio {metrics['coalescing_ratio']:.1%}: {metrics['updates_total']} updates, "
+          f"{metrics['rows_written']} rows in {metrics['batches']} upserts")
+
+    same = state(direct_db) == state(buffered_db)
+    print("same final rows" if same else "FAIL: final rows differ")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""Export users, profiles, chat history and feedback as gzip-compressed NDJSON.
+
+Each table is read in keyset order (``WHERE key > last_key ORDER BY key
+LIMIT page``), so every page is an index range scan however deep the
+export is. The next page is fetched while the current one is compressed,
+so memory holds a few pages at most, whatever the table size. Rows are
+written to shards of BULK_EXPORT_SHARD_ROWS lines:
+
+    <out>/<run>/<table>-00000.ndjson.gz
+    <out>/<run>/manifest.json      # written last: rows, shards, rows/s per table
+
+A shard only gets its final name once it is complete. ``--incremental``
+exports just the rows whose watermark column (``updated_at``,
+``timestamp``, ...) falls after the previous run's cut-off, which is kept
+in ``<out>/watermarks.json`` and only advanced when a run finishes. Rows
+written while a full export runs may show up again in the next incremental
+one, so consumers should keep the last row per key.
+
+    python bulk_export.py --out exports
+    python bulk_export.py --out exports --incremental
+    python bulk_export.py --out /tmp/exports --local 5000     # against a seeded in-memory database
+"""
+import argparse
+import gzip
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from config import (
+    BULK_EXPORT_DIR,
+    BULK_EXPORT_PAGE_SIZE,
+    BULK_EXPORT_SHARD_ROWS,
+    BULK_EXPORT_CLOCK_SKEW
+)
+from logging_service import LoggingService
+
+
+class ExportTable(NamedTuple):
+    key: str  # unique, indexed column the pages are ordered by
+    watermark: str  # last-changed column used by incremental exports
+    columns: str = "*"
+
+
+EXPORT_TABLES = {
+    # Password hashes stay out of exports; users have no last-changed column, so
+    # incremental runs pick up new users but not changed logins
+    "users": ExportTable("id", "created_at", "id, email, email_verified, created_at, last_login"),
+    "profiles": ExportTable("user_id", "updated_at"),
+    "chat_history": ExportTable("id", "timestamp"),
+    "feedback": ExportTable("id", "timestamp"),
+}
+
+
+class ShardWriter:
+    """NDJSON lines into numbered gzip shards, each renamed into place when full."""
+
+    def __init__(self, directory: str, table: str, shard_rows: int, compresslevel: int):
+        self.directory = directory
+        self.table = table
+        self.shard_rows = shard_rows
+        self.compresslevel = compresslevel
+        self.shards: List[Dict] = []
+        self._file = None
+        self._rows = 0
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"{self.table}-{len(self.shards):05d}.ndjson.gz")
+
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            if self._file is None:
+                self._file = gzip.open(self._path() + ".tmp", "wt", encoding="utf-8", compresslevel=self.compresslevel)
+            self._file.write(json.dumps(row, separators=(",", ":"), ensure_ascii=False, default=str) + "\n")
+            self._rows += 1
+            if self._rows >= self.shard_rows:
+                self._close()
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        path = self._path()
+        os.replace(path + ".tmp", path)
+        self.shards.append({"file": os.path.basename(path), "rows": self._rows, "bytes": os.path.getsize(path)})
+        self._file = None
+        self._rows = 0
+
+    def close(self) -> List[Dict]:
+        self._close()
+        return self.shards
+
+
+class BulkExporter:
+    def __init__(self, supabase, out_dir: str = BULK_EXPORT_DIR, page_size: int = BULK_EXPORT_PAGE_SIZE,
+                 shard_rows: int = BULK_EXPORT_SHARD_ROWS, compresslevel: int = 6,
+                 tables: Optional[Dict[str, ExportTable]] = None, progress=print,
+                 clock: Callable[[], datetime] = datetime.utcnow):
+        self.supabase = supabase
+        self.clock = clock
+        self.out_dir = out_dir
+        self.page_size = page_size
+        self.shard_rows = shard_rows
+        self.compresslevel = compresslevel
+        self.tables = tables or EXPORT_TABLES
+        self.progress = progress
+        self.logger = LoggingService()
+
+    @property
+    def watermark_path(self) -> str:
+        return os.path.join(self.out_dir, "watermarks.json")
+
+    def load_watermarks(self) -> Dict[str, str]:
+        if not os.path.exists(self.watermark_path):
+            return {}
+        with open(self.watermark_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_watermarks(self, watermarks: Dict[str, str]):
+        tmp_path = self.watermark_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(watermarks, f, indent=2)
+        os.replace(tmp_path, self.watermark_path)
+
+    def pages(self, table: str, spec: ExportTable, since: Optional[str] = None,
+              until: Optional[str] = None) -> Iterator[List[Dict]]:
+        """Pages of ``table`` in key order; with ``since``, only rows changed in [since, until)."""
+        last_key = None
+        while True:
+            query = self.supabase.table(table).select(spec.columns)
+            if since is not None:
+                query = query.gte(spec.watermark, since)
+            if until is not None:
+                query = query.lt(spec.watermark, until)
+            if last_key is not None:
+                query = query.gt(spec.key, last_key)
+            rows = query.order(spec.key).limit(self.page_size).execute().data
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            last_key = rows[-1][spec.key]
+
+    def _prefetched(self, pages: Iterator[List[Dict]]) -> Iterator[List[Dict]]:
+        """Fetch the next page on a thread while the caller writes the current one."""
+        handoff = queue.Queue(maxsize=1)
+        done = object()
+
+        def fetch():
+            try:
+                for page in pages:
+                    handoff.put(page)
+                handoff.put(done)
+            except BaseException as e:
+                handoff.put(e)
+
+        threading.Thread(target=fetch, name="export-fetch", daemon=True).start()
+        while True:
+            item = handoff.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def export_table(self, run_dir: str, table: str, since: Optional[str] = None,
+                     until: Optional[str] = None) -> Dict:
+        spec = self.tables[table]
+        writer = ShardWriter(run_dir, table, self.shard_rows, self.compresslevel)
+        started = time.perf_counter()
+        rows = 0
+        for page in self._prefetched(self.pages(table, spec, since, until)):
+            writer.write(page)
+            rows += len(page)
+        shards = writer.close()
+        elapsed = time.perf_counter() - started
+        report = {
+            "rows": rows,
+            "shards": shards,
+            "bytes": sum(shard["bytes"] for shard in shards),
+            "seconds": round(elapsed, 3),
+            "rows_per_s": round(rows / elapsed) if elapsed else None,
+            "since": since,
+            "until": until
+        }
+        self.progress(f"{table:<14} {rows:>10} rows  {len(shards):>3} shards  {report['bytes'] / 1e6:8.1f} MB  "
+                      f"{report['rows_per_s'] or 0:>8} rows/s")
+        return report
+
+    def run(self, tables: Optional[List[str]] = None, incremental: bool = False,
+            since: Optional[str] = None) -> Dict:
+        """Export ``tables`` (default: all) into a new run directory and return its manifest.
+
+        Incremental runs start from the stored watermark of each table (or
+        ``since``); every run stops at its start time minus
+        BULK_EXPORT_CLOCK_SKEW, so rows written during the run fall into the
+        next one instead of being missed.
+        """
+        tables = tables or list(self.tables)
+        unknown = set(tables) - set(self.tables)
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+        started_at = self.clock()
+        run_id = started_at.strftime("%Y%m%dT%H%M%SZ") + ("-incremental" if incremental else "-full")
+        run_dir = os.path.join(self.out_dir, run_id)
+        os.makedirs(run_dir, exist_ok=True)
+        until = (started_at - timedelta(seconds=BULK_EXPORT_CLOCK_SKEW)).isoformat()
+        watermarks = self.load_watermarks()
+
+        started = time.perf_counter()
+        manifest = {"run": run_id, "started_at": started_at.isoformat(), "incremental": incremental, "tables": {}}
+        for table in tables:
+            table_since = (since or watermarks.get(table)) if incremental else None
+            manifest["tables"][table] = self.export_table(run_dir, table, table_since, until if incremental else None)
+            # A full export covers every row up to now as well
+            watermarks[table] = until
+        elapsed = time.perf_counter() - started
+        rows = sum(report["rows"] for report in manifest["tables"].values())
+        manifest.update(rows=rows, seconds=round(elapsed, 3), rows_per_s=round(rows / elapsed) if elapsed else None)
+
+        with open(os.path.join(run_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        self._save_watermarks(watermarks)
+        self.logger.log_app_event('bulk_export', {'run': run_id, 'rows': rows, 'rows_per_s': manifest["rows_per_s"]})
+        return manifest
+
+
+def read_shards(run_dir: str, table: str) -> Iterator[Dict]:
+    """Rows of one table from a finished run, in export order."""
+    with open(os.path.join(run_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        shards = json.load(f)["tables"][table]["shards"]
+    for shard in shards:
+        with gzip.open(os.path.join(run_dir, shard["file"]), "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def seed_local(supabase, users: int, chats_per_user: int = 10, feedback_every: int = 5, chunk: int = 1000):
+    """Fill a LocalSupabase with synthetic rows for trying the exporter."""
+    now = datetime.utcnow()
+    for start in range(0, users, chunk):
+        ids = range(start, min(users, start + chunk))
+        stamp = lambda i, n=0: (now - timedelta(days=30, minutes=i * 7 + n)).isoformat()  # noqa: E731
+        supabase.table("users").insert([
+            {"id": f"user-{i:08d}", "email": f"user{i}@example.com", "password": "x", "email_verified": i % 3 != 0,
+             "created_at": stamp(i), "last_login": None}
+            for i in ids
+        ]).execute()
+        supabase.table("profiles").insert([
+            {"user_id": f"user-{i:08d}", "phase": "Luteal", "goal": "More energy", "diet": ["Vegetarian"],
+             "updated_at": stamp(i)}
+            for i in ids
+        ]).execute()
+        supabase.table("chat_history").insert([
+            {"id": i * chats_per_user + n, "user_id": f"user-{i:08d}", "role": "user" if n % 2 == 0 else "assistant",
+             "message": f"message {n} " + "lorem ipsum " * 20, "timestamp": stamp(i, n)}
+            for i in ids for n in range(chats_per_user)
+        ]).execute()
+        supabase.table("feedback").insert([
+            {"id": i, "user_id": f"user-{i:08d}", "feedback": "Nice app", "timestamp": stamp(i)}
+            for i in ids if i % feedback_every == 0
+        ]).execute()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export users, profiles, chat history and feedback as NDJSON shards.")
+    parser.add_argument("--out", default=BULK_EXPORT_DIR)
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES), help="default: all")
+    parser.add_argument("--incremental", action="store_true", help="only rows changed since the last run")
+    parser.add_argument("--since", help="with --incremental: ISO timestamp to start from instead of the stored watermark")
+    parser.add_argument("--page-size", type=int, default=BULK_EXPORT_PAGE_SIZE)
+    parser.add_argument("--shard-rows", type=int, default=BULK_EXPORT_SHARD_ROWS)
+    parser.add_argument("--compresslevel", type=int, default=6, choices=range(1, 10))
+    parser.add_argument("--local", type=int, metavar="USERS",
+                        help="export from an in-memory database seeded with this many synthetic users")
+    args = parser.parse_args(argv)
+
+    if args.local is not None:
+        from local_supabase import LocalSupabase
+        supabase = LocalSupabase()
+        seed_local(supabase, args.local)
+    else:
+        from supabase import create_client
+        from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+    exporter = BulkExporter(supabase, args.out, page_size=args.page_size, shard_rows=args.shard_rows,
+                            compresslevel=args.compresslevel)
+    manifest = exporter.run(args.tables, incremental=args.incremental, since=args.since)
+    print(f"{manifest['rows']} rows in {manifest['seconds']:.1f} s ({manifest['rows_per_s']} rows/s) "
+          f"-> {os.path.join(args.out, manifest['run'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
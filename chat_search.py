@@ -0,0 +1,321 @@
+"""Per-user full-text search over persisted chat messages.
+
+A user's ``chat_history`` is indexed in memory the first time they search,
+then kept current: messages added through ``ProfileService`` are indexed
+as they are stored, and rows written by other processes are picked up by a
+keyset catch-up on ``id`` at most every ``CHAT_SEARCH_REFRESH`` seconds.
+
+Postings are kept compact. Each term has one byte stream of
+varint(document delta), varint(term frequency) pairs and a second stream of
+varint(position delta) runs, so keyword queries never decode positions.
+Results are ranked with BM25; ``"quoted phrases"`` must match word for word.
+
+    hits = ChatSearchService().search(user_id, '"pumpkin seeds" luteal')
+"""
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, islice
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from supabase import create_client
+
+from config import (
+    SUPABASE_URL,
+    SUPABASE_SERVICE_ROLE_KEY,
+    CHAT_SEARCH_MAX_USERS,
+    CHAT_SEARCH_LIMIT,
+    CHAT_SEARCH_REFRESH,
+    CHAT_SEARCH_PAGE_SIZE
+)
+from logging_service import LoggingService
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_CHARS = 160
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PHRASE = re.compile(r'"([^"]+)"')
+_MARKUP = re.compile(r"[*_`#>|]+|\s+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have i if in is it its me my no not of on or so "
+    "that the their them there these they this to was we were what when which will with you your".split()
+)
+
+
+def _normalize(word: str) -> str:
+    """Fold simple plurals so "seeds" finds "seed" and "berries" finds "berry"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[Tuple[int, str]]:
+    """(position, term) pairs; stopwords are dropped but still take a position."""
+    return [(i, _normalize(word)) for i, word in enumerate(_WORD.findall(text.lower())) if word not in STOPWORDS]
+
+
+def _put_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _varints(data: bytes) -> List[int]:
+    values, value, shift = [], 0, 0
+    append = values.append
+    for byte in data:
+        if byte < 0x80:
+            append(value | (byte << shift))
+            value = shift = 0
+        else:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+    return values
+
+
+class _Postings:
+    __slots__ = ("docs", "positions", "last_doc", "df")
+
+    def __init__(self):
+        self.docs = bytearray()
+        self.positions = bytearray()
+        self.last_doc = -1
+        self.df = 0
+
+    def add(self, doc: int, positions: List[int]):
+        _put_varint(self.docs, doc - self.last_doc)
+        _put_varint(self.docs, len(positions))
+        previous = -1
+        for position in positions:
+            _put_varint(self.positions, position - previous)
+            previous = position
+        self.last_doc = doc
+        self.df += 1
+
+    def frequencies(self) -> Iterator[Tuple[int, int]]:
+        """(doc, term frequency) for every document containing the term."""
+        values = _varints(self.docs)
+        return zip(islice(accumulate(values[0::2], initial=-1), 1, None), values[1::2])
+
+    def with_positions(self) -> Iterator[Tuple[int, List[int]]]:
+        """(doc, positions) for every document containing the term."""
+        deltas = _varints(self.positions)
+        start = 0
+        for doc, tf in self.frequencies():
+            yield doc, list(islice(accumulate(deltas[start:start + tf], initial=-1), 1, None))
+            start += tf
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.docs) + len(self.positions)
+
+
+class SearchHit(NamedTuple):
+    message_id: int
+    score: float
+
+
+class UserChatIndex:
+    """Inverted index over one user's messages, appended to in ``id`` order."""
+
+    def __init__(self):
+        self.message_ids = array("q")
+        self.lengths = array("I")
+        self.total_length = 0
+        self.postings: Dict[str, _Postings] = {}
+        self.last_id = 0
+        self.refreshed_at = 0.0
+        self.lock = threading.Lock()
+        self._norms = None
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def add(self, message_id: int, text: str) -> bool:
+        """Index one message; ids at or below the last indexed one are skipped."""
+        if message_id <= self.last_id:
+            return False
+        doc = len(self.message_ids)
+        terms: Dict[str, List[int]] = {}
+        for position, term in tokenize(text or ""):
+            terms.setdefault(term, []).append(position)
+        for term, positions in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.add(doc, positions)
+        length = sum(len(positions) for positions in terms.values())
+        self.message_ids.append(message_id)
+        self.lengths.append(length)
+        self.total_length += length
+        self.last_id = message_id
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the postings and per-message arrays, without dict overhead."""
+        return (sum(p.nbytes for p in self.postings.values()) + sum(len(t) for t in self.postings)
+                + self.message_ids.itemsize * len(self.message_ids) + self.lengths.itemsize * len(self.lengths))
+
+    def search(self, query: str, limit: int = CHAT_SEARCH_LIMIT) -> List[SearchHit]:
+        """Messages ranked by BM25 over every query term, newest first on ties.
+
+        Quoted phrases are required; when there are none, any term may match.
+        """
+        phrases = [tokenize(phrase) for phrase in _PHRASE.findall(query)]
+        phrases = [phrase for phrase in phrases if phrase]
+        terms = {term for _, term in tokenize(_PHRASE.sub(" ", query))}
+        terms.update(term for phrase in phrases for _, term in phrase)
+        if not terms or not self.message_ids:
+            return []
+        if any(term not in self.postings for phrase in phrases for _, term in phrase):
+            return []
+
+        candidates = None
+        for phrase in phrases:
+            matches = self._phrase_docs(phrase)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        docs = len(self.message_ids)
+        norms = self._length_norms()
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            weight = math.log(1 + (docs - postings.df + 0.5) / (postings.df + 0.5)) * (BM25_K1 + 1)
+            for doc, tf in postings.frequencies():
+                if candidates is None or doc in candidates:
+                    scores[doc] = get(doc, 0.0) + weight * tf / (tf + norms[doc])
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [SearchHit(self.message_ids[doc], round(score, 4)) for doc, score in best]
+
+    def _length_norms(self) -> List[float]:
+        """BM25's per-message length term, recomputed only after messages were added."""
+        if self._norms is None or len(self._norms) != len(self.lengths):
+            average = self.total_length / len(self.lengths) or 1.0
+            scale = BM25_K1 * BM25_B / average
+            self._norms = [BM25_K1 * (1 - BM25_B) + scale * length for length in self.lengths]
+        return self._norms
+
+    def _phrase_docs(self, phrase: List[Tuple[int, str]]) -> set:
+        """Documents where the phrase's terms sit at the same relative offsets."""
+        # Start from the rarest term, then check the others at their offsets
+        ordered = sorted(phrase, key=lambda item: self.postings[item[1]].df)
+        anchor_offset, anchor_term = ordered[0]
+        starts = {doc: {p - anchor_offset for p in positions}
+                  for doc, positions in self.postings[anchor_term].with_positions()}
+        for offset, term in ordered[1:]:
+            narrowed = {}
+            for doc, positions in self.postings[term].with_positions():
+                if doc in starts:
+                    remaining = starts[doc] & {p - offset for p in positions}
+                    if remaining:
+                        narrowed[doc] = remaining
+            starts = narrowed
+            if not starts:
+                break
+        return set(starts)
+
+
+def snippet(text: str, query: str, width: int = SNIPPET_CHARS) -> str:
+    """The part of ``text`` around the first query term, on one line, with matches in bold."""
+    text = _MARKUP.sub(lambda m: " " if m.group().isspace() else "", text).strip()
+    terms = {term for _, term in tokenize(query.replace('"', " "))}
+    words = [(m.start(), m.end()) for m in _WORD.finditer(text.lower())
+             if _normalize(m.group()) in terms]
+    start = max(0, words[0][0] - width // 3) if words else 0
+    end = min(len(text), start + width)
+    parts, cursor = [], start
+    for word_start, word_end in words:
+        if word_start < start or word_end > end:
+            continue
+        parts += [text[cursor:word_start], f"**{text[word_start:word_end]}**"]
+        cursor = word_end
+    parts.append(text[cursor:end])
+    return ("…" if start else "") + "".join(parts).strip() + ("…" if end < len(text) else "")
+
+
+class ChatSearchService:
+    """Keeps the indexes of the most recently searching users in memory."""
+
+    def __init__(self, supabase=None, max_users: int = CHAT_SEARCH_MAX_USERS,
+                 refresh: float = CHAT_SEARCH_REFRESH, page_size: int = CHAT_SEARCH_PAGE_SIZE):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.max_users = max_users
+        self.refresh = refresh
+        self.page_size = page_size
+        self._indexes: "OrderedDict[str, UserChatIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.logger = LoggingService()
+
+    def index_message(self, user_id: str, row: Dict):
+        """Add a stored message to its user's index, if that index is loaded."""
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is not None and row.get("id") is not None:
+            with index.lock:
+                index.add(row["id"], row.get("message"))
+
+    def drop(self, user_id: str):
+        """Forget a user's index, e.g. after their history is cleared."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def get_index(self, user_id: str) -> UserChatIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = self._indexes[user_id] = UserChatIndex()
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(user_id)
+        with index.lock:
+            if time.monotonic() - index.refreshed_at >= self.refresh:
+                self._catch_up(user_id, index)
+        return index
+
+    def _catch_up(self, user_id: str, index: UserChatIndex):
+        """Index rows newer than the last indexed id, a keyset page at a time."""
+        while True:
+            rows = self.supabase.table("chat_history").select("id, message").eq("user_id", user_id) \
+                .gt("id", index.last_id).order("id").limit(self.page_size).execute().data
+            for row in rows:
+                index.add(row["id"], row["message"])
+            if len(rows) < self.page_size:
+                break
+        index.refreshed_at = time.monotonic()
+
+    def search(self, user_id: str, query: str, limit: int = CHAT_SEARCH_LIMIT) -> Tuple[bool, List[Dict], str]:
+        """Matching messages, best first, each with a ``score`` and a ``snippet``."""
+        try:
+            index = self.get_index(user_id)
+            with index.lock:
+                hits = index.search(query, limit)
+            if not hits:
+                return True, [], "No matching messages"
+            response = self.supabase.table("chat_history").select("id, role, message, timestamp") \
+                .eq("user_id", user_id).in_("id", [hit.message_id for hit in hits]).execute()
+            rows = {row["id"]: row for row in response.data}
+            results = [
+                dict(rows[hit.message_id], score=hit.score, snippet=snippet(rows[hit.message_id]["message"], query))
+                for hit in hits if hit.message_id in rows
+            ]
+            self.logger.log_db_event('chat_search', 'chat_history', True, {'hits': len(results)})
+            return True, results, "Search completed"
+
+        except Exception as e:
+            self.logger.log_db_event('chat_search', 'chat_history', False, {'error': str(e)})
+            return False, [], f"Error searching chat history: {str(e)}"
@@ -0,0 +1,60 @@
+import hashlib
+import streamlit as st
+from config import CHAT_WINDOW_SIZE, CHAT_CHUNK_SIZE
+
+CHAT_STYLE = (
+    "<style>"
+    ".chat-bubble-user{background:#2d2d2d;color:#fff;border-radius:16px 16px 4px 16px;padding:1rem;"
+    "margin-bottom:.5rem;margin-left:20%;margin-right:0;text-align:right;box-shadow:0 2px 8px rgba(0,0,0,.04)}"
+    ".chat-bubble-assistant{background:#232323;color:#fff;border-radius:16px 16px 16px 4px;padding:1rem;"
+    "margin-bottom:1.5rem;margin-right:20%;margin-left:0;text-align:left;box-shadow:0 2px 8px rgba(0,0,0,.04)}"
+    ".speaker-label{font-weight:bold;font-size:.95em;margin-bottom:.2em;color:#e07a5f}"
+    "</style>"
+)
+# Per-session HTML of the chunks rendered last time, keyed by a hash of their messages
+CHUNK_CACHE_KEY = "_chat_chunk_html"
+
+
+def _bubble_html(role: str, msg: str) -> str:
+    if role == "user":
+        return f'<div class="chat-bubble-user"><div class="speaker-label">You</div>{msg}</div>'
+    return f'<div class="chat-bubble-assistant"><div class="speaker-label">Assistant</div>{msg}</div>'
+
+
+def _chunk_html(messages: tuple, cache: dict) -> tuple:
+    key = hashlib.blake2b(repr(messages).encode("utf-8"), digest_size=16).digest()
+    html = cache.get(key)
+    if html is None:
+        html = "".join(_bubble_html(role, msg) for role, msg in messages)
+    return key, html
+
+
+def render_chat_history(chat_history: list):
+    """Render the most recent messages of a conversation.
+
+    Messages are grouped into fixed chunks aligned on their absolute position,
+    so the number of elements per rerun stays constant however long the chat
+    gets, and only the last chunk changes when a message is added. The HTML
+    of unchanged chunks is reused from this session's own cache (only the
+    visible chunks are kept), so a rerun formats at most the last one. Each
+    chunk is still sent to the browser every rerun: Streamlit's message cache
+    skips only messages above ``global.minCachedMessageSize`` (10 kB).
+    """
+    total = len(chat_history)
+    visible = st.session_state.get("chat_visible_messages", CHAT_WINDOW_SIZE)
+    start = max(0, total - visible)
+    start -= start % CHAT_CHUNK_SIZE
+
+    if start > 0:
+        if st.button(f"Load earlier messages ({start} hidden)", key="load_earlier_chat"):
+            st.session_state.chat_visible_messages = visible + CHAT_WINDOW_SIZE
+            st.rerun()
+
+    st.markdown(CHAT_STYLE, unsafe_allow_html=True)
+    cache = st.session_state.get(CHUNK_CACHE_KEY, {})
+    rendered = {}
+    for chunk_start in range(start, total, CHAT_CHUNK_SIZE):
+        key, html = _chunk_html(tuple(chat_history[chunk_start:chunk_start + CHAT_CHUNK_SIZE]), cache)
+        rendered[key] = html
+        st.markdown(html, unsafe_allow_html=True)
+    st.session_state[CHUNK_CACHE_KEY] = rendered
@@ -41,8 +41,127 @@ MAX_LOGIN_ATTEMPTS = 3
 PASSWORD_MIN_LENGTH = 8
 VERIFICATION_TOKEN_EXPIRY = 24 * 3600  # 24 hours in seconds
 RESET_TOKEN_EXPIRY = 1 * 3600  # 1 hour in seconds
+PASSWORD_HASH_WORKERS = os.cpu_count() or 2  # bcrypt runs off the request thread, at most this many at once
+
+# Outgoing email
+EMAIL_DISPATCH_WORKERS = 2
+EMAIL_SEND_RETRIES = 5  # attempts per email before giving up
+TEMPLATE_DIR = "templates"
+
+# Daily tips digest
+DIGEST_PAGE_SIZE = 1000  # users read per query
+DIGEST_SEND_RATE = 10  # emails per second
+DIGEST_SMTP_CONNECTIONS = 4
+DIGEST_STATE_DIR = os.getenv("DIGEST_STATE_DIR", "spool/digest")
+
+# Phase-transition notifications
+# Off by default: every process that runs it sends its own emails. Set it to true in exactly one
+# app process, or leave it off everywhere and run `python phase_scheduler.py` as that one process.
+PHASE_SCHEDULER_ENABLED = os.getenv("PHASE_SCHEDULER_ENABLED", "false").lower() == "true"
+PHASE_SCHEDULER_STATE_PATH = os.getenv("PHASE_SCHEDULER_STATE_PATH", "spool/phase_scheduler.tsv")
+PHASE_SCHEDULER_SNAPSHOT_INTERVAL = 300  # seconds between queue snapshots while it has changes
+PHASE_SCHEDULER_SYNC_INTERVAL = 60  # seconds between re-reads of profiles changed by other processes
+PHASE_SCHEDULER_RECONCILE_INTERVAL = 3600  # seconds between full user-id scans that drop deleted profiles
+PHASE_SCHEDULER_CLOCK_SKEW = 60  # seconds of overlap between syncs, for app servers' clocks and slow commits
+PHASE_TRANSITION_HOUR = 7  # UTC hour at which a new phase is announced
+PHASE_TRANSITION_GRACE = 6 * 3600  # seconds; transitions missed by longer (e.g. downtime) are not announced late
+MIN_CYCLE_LENGTH = 11  # days; shorter gaps are treated as a data-entry mistake
+MAX_CYCLE_LENGTH = 90
+RECENT_CYCLES = 6  # cycle lengths averaged for phase prediction
+
+# Rerun profiling (off unless a session opts in with ?profile=<token> or a rerun is sampled)
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_TOP_N = 25
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+
+# Session state store ("sqlite" for one host, "redis" for workers on several hosts)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "data/sessions.db")
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+SESSION_STORE_TTL = 7 * 24 * 3600  # 7 days in seconds
+SESSION_STORE_PURGE_INTERVAL = 3600  # seconds between sweeps of expired rows (sqlite backend)
+SESSION_REVOCATION_REFRESH = 5  # seconds a cached session token is trusted before revocations are re-read
+
+# Login cookie (HttpOnly, set by the API so the session token never appears in a URL)
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")  # as reached from the browser
+APP_ORIGIN = os.getenv("APP_ORIGIN", "http://localhost:8501")  # the Streamlit app, allowed to call the API with cookies
+SESSION_COOKIE_NAME = "hfc_session"
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "false").lower() == "true"  # true behind HTTPS
+
+# Per-process session memory
+SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "512"))
+SESSION_MEMORY_MIN_IDLE = 120  # seconds; sessions used more recently than this are never spilled
+SESSION_REAP_INTERVAL = 60  # seconds between idle-session sweeps
+
+# LLM call resilience
+LLM_DEADLINE = 30  # seconds per answer, retries and hedges included
+LLM_MAX_RETRIES = 2
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_MIN_DELAY = 1.0  # seconds; never hedge sooner than this
+LLM_BREAKER_FAILURES = 5  # consecutive failures before failing fast
+LLM_BREAKER_COOLDOWN = 30  # seconds before a trial request is let through
+# Identical prompts in flight at the same time share one upstream call
+LLM_COALESCE_ENABLED = os.getenv("LLM_COALESCE_ENABLED", "true").lower() == "true"
+
+# LLM admission control (shared OpenAI rate limit)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "300000"))
+LLM_EXPECTED_COMPLETION_TOKENS = 400  # budgeted per call until the real count is known
+LLM_QUEUE_MAX_DEPTH = 64  # waiting calls before guests are shed
+LLM_QUEUE_TIMEOUT = 15  # seconds a call may wait for budget
+# "local" budgets per process; "redis" shares one budget across processes via SESSION_STORE_URL
+LLM_ADMISSION_BACKEND = os.getenv("LLM_ADMISSION_BACKEND", "local")
+
+# LLM usage accounting
+LLM_USAGE_DB_PATH = os.getenv("LLM_USAGE_DB_PATH", "data/llm_usage.db")
+LLM_USAGE_FLUSH_INTERVAL = 5  # seconds between writes of buffered records
+LLM_USAGE_RAW_RETENTION_HOURS = 48  # per-question rows; hourly rollups are kept longer
+LLM_USAGE_ROLLUP_RETENTION_DAYS = 90
+# USD per 1K (prompt, completion) tokens
+LLM_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-0613": (0.03, 0.06),
+    "fake-gpt-4": (0.03, 0.06),  # priced like the model it stands in for
+}
+
+# Structured meal plans
+MEAL_PLAN_DEFAULT_DAYS = 3
+MEAL_PLAN_MAX_DAYS = 7
+MEAL_PLAN_ALTERNATIVES = 2  # spare meals per meal type, for swaps and diet filtering
+
+# Bulk data export (bulk_export.py)
+BULK_EXPORT_DIR = os.getenv("BULK_EXPORT_DIR", "exports")
+BULK_EXPORT_PAGE_SIZE = 1000  # rows per keyset page
+BULK_EXPORT_SHARD_ROWS = 100000  # NDJSON lines per gzip shard
+BULK_EXPORT_CLOCK_SKEW = 60  # seconds; incremental runs stop this far before their start
+
+# Coalesced writes of last_login and personalization (write_buffer.py)
+WRITE_BUFFER_FLUSH_INTERVAL = 5  # seconds between batched upserts
+WRITE_BUFFER_MAX_ROWS = 500  # flush early once this many rows are pending
+
+# Chat history search (chat_search.py)
+CHAT_SEARCH_MAX_USERS = 200  # per-user indexes kept in memory, least recently searched evicted
+CHAT_SEARCH_LIMIT = 10  # results per search
+CHAT_SEARCH_REFRESH = 30  # seconds before an index re-checks the table for other processes' writes
+CHAT_SEARCH_PAGE_SIZE = 1000  # rows per keyset page while building an index
+
+# Food knowledge base used to ground answers
+KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", "data/food_knowledge.json")
+KNOWLEDGE_VECTORS_PATH = os.getenv("KNOWLEDGE_VECTORS_PATH", "data/food_knowledge.vectors.f32")
+
+# Feedback spool
+FEEDBACK_SPOOL_DIR = os.getenv("FEEDBACK_SPOOL_DIR", "spool")
+FEEDBACK_FSYNC_INTERVAL = 0.2  # seconds; fsync at least this often while records are pending
+FEEDBACK_FSYNC_BATCH = 32  # or as soon as this many records are unsynced
+FEEDBACK_FLUSH_INTERVAL = 5  # seconds between bulk inserts into Supabase
+FEEDBACK_FLUSH_BATCH = 200
+FEEDBACK_FLUSH_RETRIES = 5
 
 # UI Constants
+CHAT_WINDOW_SIZE = 20  # most recent messages shown before "Load earlier messages"
+CHAT_CHUNK_SIZE = 10  # messages rendered per chat element
 SUPPORT_OPTIONS = [
     "Nothing specific",
     "Hormonal balance and regular cycle",
@@ -76,7 +195,12 @@ ERROR_MESSAGES = {
     "user_exists": "An account with this email already exists",
     "invalid_credentials": "Invalid email or password",
     "session_expired": "Your session has expired. Please log in again",
-    "api_error": "An error occurred. Please try again later"
+    "invalid_token": "This link is invalid or has already been used",
+    "token_expired": "This link has expired. Please request a new one",
+    "email_send_failed": "We could not send the email. Please try again later",
+    "email_verification_required": "Please verify your email address before logging in",
+    "api_error": "An error occurred. Please try again later",
+    "llm_unavailable": "The assistant is busy right now, so here is a shorter answer. Please try again in a minute"
 }
 
 # Success Messages
@@ -84,5 +208,7 @@ SUCCESS_MESSAGES = {
     "registration": "Registration successful! Please check your email to verify your account",
     "login": "Login successful!",
     "settings_saved": "Your preferences have been saved successfully",
-    "password_reset": "Password reset instructions have been sent to your email"
+    "password_reset": "Password reset instructions have been sent to your email",
+    "email_verified": "Your email has been verified. You can now log in",
+    "password_changed": "Your password has been changed. You can now log in"
 } 
\ No newline at end of file
@@ -0,0 +1,118 @@
+import math
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from config import MIN_CYCLE_LENGTH, MAX_CYCLE_LENGTH, RECENT_CYCLES
+
+DEFAULT_CYCLE_LENGTH = 28
+
+# Last day (counted from the period start, day 0) of each phase
+PHASE_BOUNDARIES = (
+    (5, "Menstrual"),
+    (14, "Follicular"),
+    (21, "Ovulatory"),
+)
+
+
+def detect_phase(days_since_last: int) -> str:
+    """Phase for a number of days since the start of the most recent period."""
+    for last_day, phase in PHASE_BOUNDARIES:
+        if days_since_last <= last_day:
+            return phase
+    return "Luteal"
+
+
+def phase_on(day: date, last_period: Optional[date], cycle_length: Optional[int] = None) -> Optional[str]:
+    """Phase on ``day``, rolling the last known period forward by whole cycles."""
+    if last_period is None:
+        return None
+    if isinstance(last_period, str):
+        last_period = date.fromisoformat(last_period[:10])
+    cycle_length = cycle_length or DEFAULT_CYCLE_LENGTH
+    return detect_phase((day - last_period).days % cycle_length)
+
+
+def phase_starts(cycle_length: int):
+    """(day offset, phase) at which each phase begins, for phases that fit the cycle."""
+    offsets = [0] + [last_day + 1 for last_day, _ in PHASE_BOUNDARIES]
+    phases = [phase for _, phase in PHASE_BOUNDARIES] + ["Luteal"]
+    return [(offset, phase) for offset, phase in zip(offsets, phases) if offset < cycle_length]
+
+
+def next_transition(day: int, last_period: int, cycle_length: Optional[int] = None) -> Tuple[int, str]:
+    """First phase change strictly after ``day``, as (day, phase). Days are date ordinals."""
+    cycle_length = cycle_length or DEFAULT_CYCLE_LENGTH
+    into_cycle = (day - last_period) % cycle_length
+    for offset, phase in phase_starts(cycle_length):
+        if offset > into_cycle:
+            return day - into_cycle + offset, phase
+    return day - into_cycle + cycle_length, PHASE_BOUNDARIES[0][1]
+
+
+class CycleStats:
+    """Running cycle-length statistics, updated in O(1) per logged period.
+
+    Mean and variance use Welford's method; ``recent`` keeps the last few
+    cycle lengths, which drive the prediction so it follows recent changes.
+    Gaps outside MIN/MAX_CYCLE_LENGTH (a skipped month, a typo) move
+    ``last_period`` forward without counting as a cycle.
+    """
+
+    def __init__(self, last_period: Optional[date] = None, count: int = 0, mean: float = 0.0,
+                 m2: float = 0.0, recent=None, version: int = 0):
+        self.last_period = date.fromisoformat(last_period[:10]) if isinstance(last_period, str) else last_period
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.recent = list(recent or [])
+        self.version = version
+
+    @classmethod
+    def from_row(cls, row: Optional[Dict]) -> "CycleStats":
+        if not row:
+            return cls()
+        return cls(row.get("last_period"), row.get("cycle_count", 0), row.get("mean_length", 0.0),
+                   row.get("m2", 0.0), row.get("recent_lengths"), row.get("version", 0))
+
+    def to_row(self) -> Dict:
+        return {
+            "last_period": self.last_period.isoformat() if self.last_period else None,
+            "cycle_count": self.count,
+            "mean_length": self.mean,
+            "m2": self.m2,
+            "recent_lengths": self.recent,
+            "cycle_length": self.cycle_length,
+            "version": self.version
+        }
+
+    def add(self, period_start: date) -> bool:
+        """Fold in the next period start. Returns False if it is not after the last one."""
+        if self.last_period is not None:
+            if period_start <= self.last_period:
+                return False
+            length = (period_start - self.last_period).days
+            if MIN_CYCLE_LENGTH <= length <= MAX_CYCLE_LENGTH:
+                self.count += 1
+                delta = length - self.mean
+                self.mean += delta / self.count
+                self.m2 += delta * (length - self.mean)
+                self.recent = (self.recent + [length])[-RECENT_CYCLES:]
+        self.last_period = period_start
+        return True
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def cycle_length(self) -> int:
+        if not self.recent:
+            return DEFAULT_CYCLE_LENGTH
+        return round(sum(self.recent) / len(self.recent))
+
+    def phase_on(self, day: date) -> Optional[str]:
+        return phase_on(day, self.last_period, self.cycle_length)
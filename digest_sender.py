@@ -0,0 +1,235 @@
+"""Send every verified user a daily email for their cycle phase.
+
+Users and profiles are read in pages, each user's phase for the day is
+computed from their last period (falling back to the phase saved in their
+profile), and the tips are rendered once per (phase, goal, diet) bucket.
+Emails go out over pooled SMTP connections at ``--rate`` per second.
+
+Each delivered email is appended to ``<state dir>/digest-<date>.sent``;
+re-running for the same date after a crash skips those users.
+
+    python digest_sender.py
+    python digest_sender.py --date 2025-06-01 --rate 20 --connections 8
+    python digest_sender.py --dry-run
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from config import (
+    DIGEST_PAGE_SIZE,
+    DIGEST_SEND_RATE,
+    DIGEST_SMTP_CONNECTIONS,
+    DIGEST_STATE_DIR,
+    TEMPLATE_DIR
+)
+from cycle import phase_on
+from logging_service import LoggingService
+
+PHASE_INTROS = {
+    "Menstrual": "Your energy is at its lowest. Warm, iron-rich meals help you replenish.",
+    "Follicular": "Energy is rising. Fresh, light foods and fermented sides support the build-up.",
+    "Ovulatory": "You are at your peak. Fibre and antioxidants help your body process the hormone surge.",
+    "Luteal": "Progesterone rises and cravings may follow. Complex carbs and magnesium keep you steady.",
+    "General": "A balanced, colourful plate supports your energy every day."
+}
+
+
+@lru_cache(maxsize=None)
+def template_env() -> Environment:
+    # Templates are parsed once per process and kept in the environment's cache
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=False
+    )
+
+
+class SentLog:
+    """Append-only record of users already emailed for one digest date."""
+
+    def __init__(self, path: str, fsync_every: int = 100):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = None
+
+    def load(self) -> set:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def append(self, user_id: str):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(user_id + "\n")
+            # Flushed per line so a process crash loses nothing; fsync batches cover power loss
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+class DigestSender:
+    def __init__(self, supabase, smtp_pool=None, dispatcher=None, knowledge_base=None,
+                 state_dir: str = DIGEST_STATE_DIR, page_size: int = DIGEST_PAGE_SIZE,
+                 app_url: Optional[str] = None):
+        self.supabase = supabase
+        self.smtp_pool = smtp_pool
+        self.dispatcher = dispatcher
+        self.knowledge_base = knowledge_base
+        self.state_dir = state_dir
+        self.page_size = page_size
+        self.app_url = app_url or os.getenv("APP_URL", "http://localhost:8501")
+        self._bodies: Dict[Tuple, str] = {}
+        self.logger = LoggingService()
+
+    def iter_recipients(self) -> Iterator[Tuple[Dict, Dict]]:
+        """Verified users with their profile, paged by id."""
+        last_id = ""
+        while True:
+            users = self.supabase.table("users").select("id, email, email_verified") \
+                .gt("id", last_id).order("id").limit(self.page_size).execute().data
+            if not users:
+                return
+            last_id = users[-1]["id"]
+            users = [u for u in users if u.get("email_verified")]
+            if not users:
+                continue
+            profiles = {
+                p["user_id"]: p
+                for p in self.supabase.table("profiles").select("*")
+                .in_("user_id", [u["id"] for u in users]).execute().data
+            }
+            for user in users:
+                yield user, profiles.get(user["id"], {})
+
+    @staticmethod
+    def bucket_for(profile: Dict, today: date) -> Optional[Tuple]:
+        phase = phase_on(today, profile.get("last_period"), profile.get("cycle_length")) or profile.get("phase")
+        if not phase:
+            return None
+        return phase, profile.get("goal") or "", tuple(sorted(profile.get("diet") or []))
+
+    def render_body(self, bucket: Tuple) -> str:
+        """Tips for a bucket, rendered once and shared by every user in it."""
+        body = self._bodies.get(bucket)
+        if body is None:
+            phase, goal, diet = bucket
+            tips = []
+            if self.knowledge_base is not None:
+                tips = self.knowledge_base.search(f"{goal} daily foods {phase}", phase, goal, list(diet), k=3)
+            body = template_env().get_template("digest_body.html").render(
+                phase=phase, goal=goal, diet=diet, tips=tips, intro=PHASE_INTROS.get(phase, "")
+            )
+            self._bodies[bucket] = body
+        return body
+
+    def render_email(self, bucket: Tuple, email: str) -> str:
+        return template_env().get_template("digest_email.html").render(
+            body=self.render_body(bucket), email=email, app_url=self.app_url
+        )
+
+    def run(self, today: Optional[date] = None, limit: Optional[int] = None, dry_run: bool = False) -> Dict:
+        today = today or date.today()
+        sent_log = SentLog(os.path.join(self.state_dir, f"digest-{today.isoformat()}.sent"))
+        already_sent = sent_log.load()
+        counts = {"recipients": 0, "queued": 0, "already_sent": 0, "no_phase": 0}
+        started = time.perf_counter()
+
+        for user, profile in self.iter_recipients():
+            if limit is not None and counts["queued"] >= limit:
+                break
+            counts["recipients"] += 1
+            if user["id"] in already_sent:
+                counts["already_sent"] += 1
+                continue
+            bucket = self.bucket_for(profile, today)
+            if bucket is None:
+                counts["no_phase"] += 1
+                continue
+            counts["queued"] += 1
+            if dry_run:
+                self.render_email(bucket, user["email"])
+                continue
+            # Bound the backlog so memory stays flat however many users there are
+            while self.dispatcher.pending() > 2 * self.page_size:
+                time.sleep(0.05)
+            self.dispatcher.submit("digest", user["email"], self._job(user, bucket, today, sent_log))
+
+        if not dry_run:
+            self.dispatcher.drain(timeout=24 * 3600)
+            sent_log.close()
+            self.smtp_pool.close()
+        elapsed = time.perf_counter() - started
+        report = {
+            **counts,
+            "date": today.isoformat(),
+            "buckets": len(self._bodies),
+            "elapsed_s": round(elapsed, 2),
+            "emails_per_s": round(counts["queued"] / elapsed, 1) if elapsed else None
+        }
+        if not dry_run:
+            report["delivery"] = self.dispatcher.get_metrics()
+            report["smtp_connections_opened"] = self.smtp_pool.opened
+        self.logger.log_app_event('digest_run', report)
+        return report
+
+    def _job(self, user: Dict, bucket: Tuple, today: date, sent_log: SentLog):
+        def send() -> bool:
+            html = self.render_email(bucket, user["email"])
+            self.smtp_pool.send(user["email"], f"Your {bucket[0]} phase tips for {today:%A}", html)
+            sent_log.append(user["id"])
+            return True
+
+        return send
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send the daily phase-aware tips digest.")
+    parser.add_argument("--date", type=date.fromisoformat, help="digest date (default: today)")
+    parser.add_argument("--rate", type=float, default=DIGEST_SEND_RATE, help="emails per second")
+    parser.add_argument("--connections", type=int, default=DIGEST_SMTP_CONNECTIONS, help="pooled SMTP connections")
+    parser.add_argument("--limit", type=int, help="stop after queueing this many emails")
+    parser.add_argument("--dry-run", action="store_true", help="render everything but send nothing")
+    args = parser.parse_args(argv)
+
+    from supabase import create_client
+    from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+    from knowledge_base import get_knowledge_base
+
+    pool = dispatcher = None
+    if not args.dry_run:
+        from email_dispatcher import EmailDispatcher
+        from email_service import EmailService, SMTPConnectionPool
+        pool = SMTPConnectionPool(EmailService(), size=args.connections)
+        dispatcher = EmailDispatcher(workers=args.connections, rate=args.rate)
+
+    sender = DigestSender(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY), pool, dispatcher, get_knowledge_base())
+    print(json.dumps(sender.run(args.date, args.limit, args.dry_run), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
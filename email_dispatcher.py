@@ -0,0 +1,120 @@
+import atexit
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Callable, Dict
+
+from config import (
+    EMAIL_DISPATCH_WORKERS,
+    EMAIL_SEND_RETRIES,
+    ERROR_MESSAGES
+)
+from logging_service import LoggingService
+
+
+class EmailDispatcher:
+    """Sends emails on background workers so requests don't wait on SMTP.
+
+    A job is a callable returning True once the email is sent. Failed jobs
+    are retried with jittered exponential backoff up to ``max_attempts``
+    times; jobs still queued when the process exits are drained for a few
+    seconds at shutdown and otherwise lost, so anything a user can't
+    recover from (e.g. verification) should also be re-sendable.
+
+    ``rate`` caps sends per second across all workers, for bulk jobs that
+    would otherwise trip the provider's limits.
+    """
+
+    def __init__(self, workers: int = EMAIL_DISPATCH_WORKERS, max_attempts: int = EMAIL_SEND_RETRIES,
+                 rate: float = 0):
+        self.max_attempts = max_attempts
+        self.rate = rate
+        self._next_slot = 0.0
+        self._rate_lock = threading.Lock()
+        self._jobs = []  # heap of (due, seq, attempt, kind, recipient, send)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self.metrics = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+        self.logger = LoggingService()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"email-dispatch-{i}", daemon=True).start()
+        atexit.register(self.drain, 5.0)
+
+    def submit(self, kind: str, recipient: str, send: Callable[[], bool]):
+        with self._cond:
+            heapq.heappush(self._jobs, (time.monotonic(), next(self._seq), 1, kind, recipient, send))
+            self.metrics["queued"] += 1
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._jobs) + self._in_flight
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Wait until every queued job has been sent or given up on."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._jobs or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def get_metrics(self) -> Dict:
+        with self._cond:
+            return {**self.metrics, "pending": len(self._jobs) + self._in_flight}
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._jobs:
+                    wait = self._jobs[0][0] - time.monotonic()
+                    if wait <= 0:
+                        self._in_flight += 1
+                        return heapq.heappop(self._jobs)
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _throttle(self):
+        if not self.rate:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        time.sleep(slot - now)
+
+    def _work(self):
+        while True:
+            _, _, attempt, kind, recipient, send = self._next_job()
+            self._throttle()
+            try:
+                sent = send()
+                error = None if sent else "send returned False"
+            except Exception as e:
+                sent, error = False, str(e)
+            with self._cond:
+                self._in_flight -= 1
+                if sent:
+                    self.metrics["sent"] += 1
+                elif attempt < self.max_attempts:
+                    self.metrics["retried"] += 1
+                    due = time.monotonic() + min(300, 2 ** attempt) * random.uniform(0.5, 1.5)
+                    heapq.heappush(self._jobs, (due, next(self._seq), attempt + 1, kind, recipient, send))
+                else:
+                    self.metrics["failed"] += 1
+                self._cond.notify_all()
+            if sent:
+                self.logger.log_email_event(kind, recipient, success=True, details={'attempt': attempt})
+            else:
+                self.logger.log_email_event(kind, recipient, success=False, details={
+                    'attempt': attempt,
+                    'error': error,
+                    'final': attempt >= self.max_attempts,
+                    'message': ERROR_MESSAGES["email_send_failed"] if attempt >= self.max_attempts else None
+                })
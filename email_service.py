@@ -1,4 +1,6 @@
+import queue
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
@@ -24,6 +26,8 @@ class EmailService:
         self.smtp_username = os.getenv("SMTP_USERNAME")
         self.smtp_password = os.getenv("SMTP_PASSWORD")
         self.sender_email = os.getenv("SENDER_EMAIL")
+        # Off only for a local relay without TLS, e.g. local_smtp.py
+        self.use_starttls = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
         self._validate_config()
 
     def _validate_config(self):
@@ -49,23 +53,30 @@ class EmailService:
         }
         return jwt.encode(payload, SUPABASE_SERVICE_ROLE_KEY, algorithm='HS256')
 
+    def connect(self) -> smtplib.SMTP:
+        """A logged-in SMTP connection to the configured server."""
+        if self.smtp_port == 465:
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+            if self.use_starttls:
+                server.starttls()
+        server.login(self.smtp_username, self.smtp_password)
+        return server
+
+    def build_message(self, to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.sender_email
+        msg['To'] = to_email
+        msg.attach(MIMEText(html_content, 'html'))
+        return msg
+
     def _send_email(self, to_email: str, subject: str, html_content: str) -> bool:
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = to_email
-            msg.attach(MIMEText(html_content, 'html'))
-
-            if self.smtp_port == 465:
-                with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as server:
-                    server.login(self.smtp_username, self.smtp_password)
-                    server.send_message(msg)
-            else:
-                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                    server.starttls()
-                    server.login(self.smtp_username, self.smtp_password)
-                    server.send_message(msg)
+            msg = self.build_message(to_email, subject, html_content)
+            with self.connect() as server:
+                server.send_message(msg)
             return True
         except Exception as e:
             print(f"Error sending email: {str(e)}")
@@ -73,8 +84,9 @@ class EmailService:
             traceback.print_exc()
             return False
 
-    def send_verification_email(self, user_id: str, email: str) -> bool:
-        token = self._create_verification_token(user_id)
+    def send_verification_email(self, user_id: str, email: str, token: str = None) -> bool:
+        if token is None:
+            token = self._create_verification_token(user_id)
         verification_url = f"{os.getenv('APP_URL', 'http://localhost:8501')}/verify?token={token}"
         
         html_content = f"""
@@ -121,6 +133,28 @@ class EmailService:
             html_content
         )
 
+    def send_phase_transition_email(self, email: str, phase: str) -> bool:
+        app_url = os.getenv('APP_URL', 'http://localhost:8501')
+
+        html_content = f"""
+        <html>
+          <body>
+            <h2>You are entering your {phase} phase</h2>
+            <p>Hello,</p>
+            <p>Based on your cycle data, your {phase.lower()} phase starts today.</p>
+            <p><a href=\"{app_url}\">See what to eat in your {phase.lower()} phase</a></p>
+            <br>
+            <p>Best regards,<br>The Cycle Nutrition Assistant Team</p>
+          </body>
+        </html>
+        """
+
+        return self._send_email(
+            email,
+            f"Your {phase} phase starts today - Cycle Nutrition Assistant",
+            html_content
+        )
+
     def verify_token(self, token: str) -> tuple[bool, str, str]:
         try:
             payload = jwt.decode(token, SUPABASE_SERVICE_ROLE_KEY, algorithms=['HS256'])
@@ -133,4 +167,65 @@ class EmailService:
     def send_password_reset_email(self, to_email, reset_link):
         subject = "Password Reset Request"
         body = f"Click the following link to reset your password: {reset_link}\n\nIf you did not request this, ignore this email."
-        return self._send_email(to_email, subject, body) 
\ No newline at end of file
+        return self._send_email(to_email, subject, body)
+
+
+class SMTPConnectionPool:
+    """Reuses logged-in SMTP connections across messages for bulk sends.
+
+    Connections are opened lazily up to ``size``; a connection the server has
+    dropped is replaced and the message retried once on the new one.
+    """
+
+    def __init__(self, email_service: EmailService, size: int = 4, max_messages_per_connection: int = 500):
+        self.email_service = email_service
+        self.size = size
+        self.max_messages = max_messages_per_connection
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+
+    def send(self, to_email: str, subject: str, html_content: str) -> bool:
+        msg = self.email_service.build_message(to_email, subject, html_content)
+        with self._slots:
+            for attempt in range(2):
+                server, sent_count = self._checkout()
+                try:
+                    server.send_message(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                    self._discard(server)
+                    if attempt == 1:
+                        raise
+                    continue
+                except smtplib.SMTPException:
+                    # Refused message; the connection itself is still good
+                    self._idle.put((server, sent_count + 1))
+                    raise
+                if sent_count + 1 >= self.max_messages:
+                    self._discard(server)
+                else:
+                    self._idle.put((server, sent_count + 1))
+                return True
+        return False
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(server)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            self.opened += 1
+            return self.email_service.connect(), 0
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.quit()
+        except Exception:
+            pass
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for when the model reports none."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline stand-in for ChatOpenAI with configurable latency and failures.
+
+    Select it for the app, the API and the batch tools with ``LLM_BACKEND=fake``.
+    A fraction ``slow_ratio`` of calls take ``slow_latency`` instead of
+    ``latency`` seconds, and a fraction ``error_ratio`` raise, to reproduce
+    upstream tail latency and outages.
+    """
+
+    latency: float = 0.05
+    slow_latency: float = 2.0
+    slow_ratio: float = 0.0
+    error_ratio: float = 0.0
+    model_name: str = "fake-gpt-4"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _pick_latency(self) -> float:
+        if random.random() < self.error_ratio:
+            raise RuntimeError("fake upstream error")
+        return self.slow_latency if random.random() < self.slow_ratio else self.latency
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content if messages else ""
+        if "Return only JSON" in prompt:
+            return self._meal_plan(prompt)
+        question = prompt.split("Question:")[-1].split("Answer:")[0].strip()
+        return (
+            f"Here are some suggestions for: {question}\n"
+            "- Leafy greens and legumes for iron\n"
+            "- Pumpkin and flax seeds\n"
+            "- Warm, cooked meals with whole grains"
+        )
+
+    def _meal_plan(self, prompt: str) -> str:
+        days = int(re.search(r"Number of days: (\d+)", prompt).group(1))
+        meal_types = re.search(r"Meals per day: (.+)", prompt).group(1).split(", ")
+        dishes = [
+            ("Oat porridge with pumpkin seeds", [("rolled oats", 50, "g", ["gluten"]), ("pumpkin seeds", 15, "g", []),
+                                                ("oat milk", 200, "ml", [])]),
+            ("Greek yogurt with berries", [("greek yogurt", 150, "g", ["dairy"]), ("blueberries", 80, "g", []),
+                                           ("walnuts", 15, "g", ["nuts"])]),
+            ("Lentil and spinach stew", [("red lentils", 70, "g", []), ("spinach", 100, "g", []),
+                                         ("coconut milk", 100, "ml", [])]),
+            ("Salmon with quinoa", [("salmon fillet", 120, "g", ["fish"]), ("quinoa", 60, "g", []),
+                                    ("broccoli", 150, "g", [])])
+        ]
+
+        def meal(meal_type, n):
+            title, ingredients = dishes[n % len(dishes)]
+            return {"meal": meal_type, "title": f"{title} ({meal_type} {n + 1})", "instructions": "Combine and enjoy.",
+                    "ingredients": [{"name": name, "quantity": quantity, "unit": unit, "contains": contains}
+                                    for name, quantity, unit, contains in ingredients]}
+
+        return json.dumps({
+            "title": f"Your {days}-day {' and '.join(meal_types)} plan",
+            "days": [{"day": day, "meals": [meal(meal_type, day - 1 + i) for i, meal_type in enumerate(meal_types)]}
+                     for day in range(1, days + 1)],
+            "alternatives": [meal(meal_type, days + len(meal_types) + n) for meal_type in meal_types for n in range(2)]
+        })
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        text = self._answer(messages)
+        prompt_tokens = sum(approx_tokens(m.content) for m in messages)
+        completion_tokens = approx_tokens(text)
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={
+                "model_name": self.model_name,
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._pick_latency())
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._pick_latency())
+        return self._result(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._pick_latency())
+        for word in self._answer(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._pick_latency())
+        for word in self._answer(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,328 @@
+import atexit
+import fcntl
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from postgrest.exceptions import APIError
+from supabase import create_client
+from config import (
+    SUPABASE_URL,
+    SUPABASE_SERVICE_ROLE_KEY,
+    FEEDBACK_SPOOL_DIR,
+    FEEDBACK_FSYNC_INTERVAL,
+    FEEDBACK_FSYNC_BATCH,
+    FEEDBACK_FLUSH_INTERVAL,
+    FEEDBACK_FLUSH_BATCH,
+    FEEDBACK_FLUSH_RETRIES
+)
+from logging_service import LoggingService
+
+# Per-process spools, plus the shared feedback.jsonl written before spools were split
+_SPOOL_NAME = re.compile(r"feedback(-\d+)?\.jsonl")
+DEAD_LETTER_NAME = "feedback.dead.jsonl"
+# SQLSTATE classes worth retrying: connection, transaction rollback, resources, operator intervention
+_TRANSIENT_SQLSTATE = ("08", "40", "53", "57")
+
+
+def _offset_path(spool_path: str) -> str:
+    return spool_path[:-len(".jsonl")] + ".offset"
+
+
+def _is_rejection(error: Exception) -> bool:
+    """True if the database refused the rows themselves, so resending them cannot succeed."""
+    if not isinstance(error, APIError):
+        return False
+    code = str(error.code or "")
+    return bool(code) and not code.startswith(_TRANSIENT_SQLSTATE) and not code.startswith("PGRST00")
+
+
+class FeedbackService:
+    """Durable feedback ingestion.
+
+    Submissions are appended to a local JSONL spool and fsync'ed in groups by a
+    background syncer, so the click handler only pays for a buffered write.
+    A background flusher bulk-inserts spooled records into the Supabase
+    ``feedback`` table and advances a committed offset once a batch is stored.
+
+    Every process has its own spool, ``feedback-<pid>.jsonl``, and holds an
+    exclusive flock on it while it runs, so no process truncates records
+    another one has not sent yet. Spools whose process has exited are drained
+    by whichever process flushes next. Rows the database rejects outright are
+    moved to ``feedback.dead.jsonl`` instead of blocking the spool. Delivery
+    is at least once: a crash between insert and offset commit resends rows.
+    """
+
+    def __init__(self, spool_dir: str = FEEDBACK_SPOOL_DIR, supabase=None):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.logger = LoggingService()
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir = spool_dir
+        self.spool_path = os.path.join(spool_dir, f"feedback-{os.getpid()}.jsonl")
+        self.offset_path = _offset_path(self.spool_path)
+        self.dead_letter_path = os.path.join(spool_dir, DEAD_LETTER_NAME)
+
+        self._lock = threading.Lock()
+        self._sync_needed = threading.Condition(self._lock)
+        self._unsynced = 0
+        self._stopped = False
+        self._flush_lock = threading.Lock()
+        self._spool = open(self.spool_path, "ab")
+        # Released when the process exits, however it exits
+        fcntl.flock(self._spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._offset = self._read_offset(self.spool_path)
+        self._depth = self._count_pending()
+        self.metrics = {
+            "spool_depth": self._depth,
+            "submitted_total": 0,
+            "flushed_total": 0,
+            "dead_lettered_total": 0,
+            "flush_failures": 0,
+            "last_flush_latency_ms": 0.0,
+            "max_flush_latency_ms": 0.0
+        }
+
+        self._syncer = threading.Thread(target=self._sync_loop, name="feedback-fsync", daemon=True)
+        self._flusher = threading.Thread(target=self._flush_loop, name="feedback-flusher", daemon=True)
+        self._syncer.start()
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def submit(self, user_id: str, timestamp: str, feedback: str) -> bool:
+        record = {"user_id": user_id, "timestamp": timestamp, "feedback": feedback}
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            self._spool.write(line)
+            self._spool.flush()
+            self._unsynced += 1
+            self._depth += 1
+            self.metrics["spool_depth"] = self._depth
+            self.metrics["submitted_total"] += 1
+            if self._unsynced >= FEEDBACK_FSYNC_BATCH:
+                self._sync_needed.notify()
+        return True
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics["spool_bytes"] = os.path.getsize(self.spool_path) - self._offset
+        return metrics
+
+    def flush(self) -> int:
+        """Send everything currently spooled to Supabase, including spools of exited processes.
+
+        Returns the number of records stored or dead-lettered.
+        """
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                batch, next_offset = self._read_batch(self.spool_path, self._offset)
+                if not batch:
+                    break
+                started = time.perf_counter()
+                if not self._store(batch):
+                    break
+                latency_ms = (time.perf_counter() - started) * 1000
+                self._commit(next_offset, len(batch), latency_ms)
+                flushed += len(batch)
+            flushed += self._drain_orphans()
+        return flushed
+
+    def close(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._sync_needed.notify()
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._spool.flush()
+                os.fsync(self._spool.fileno())
+                if self._offset == self._spool.tell():
+                    # Nothing left to send; don't leave an empty spool per process behind
+                    os.remove(self.spool_path)
+                    if os.path.exists(self.offset_path):
+                        os.remove(self.offset_path)
+                self._spool.close()
+
+    def _sync_loop(self):
+        while True:
+            with self._lock:
+                self._sync_needed.wait_for(
+                    lambda: self._stopped or self._unsynced >= FEEDBACK_FSYNC_BATCH,
+                    timeout=FEEDBACK_FSYNC_INTERVAL
+                )
+                if self._stopped:
+                    return
+                if not self._unsynced:
+                    continue
+                self._unsynced = 0
+                fileno = self._spool.fileno()
+            # One fsync covers every record written since the last one
+            try:
+                os.fsync(fileno)
+            except OSError:
+                return  # spool closed underneath us during shutdown
+
+    def _flush_loop(self):
+        while not self._stopped:
+            time.sleep(FEEDBACK_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.log_db_event('feedback_flush', 'feedback', False, {'error': str(e)})
+
+    def _read_batch(self, spool_path: str, start: int) -> tuple[List[Dict], int]:
+        batch = []
+        with open(spool_path, "rb") as spool:
+            spool.seek(start)
+            offset = start
+            for raw in spool:
+                if not raw.endswith(b"\n"):
+                    break  # partially written record, picked up on the next pass
+                offset += len(raw)
+                try:
+                    batch.append(json.loads(raw))
+                except json.JSONDecodeError:
+                    self.logger.log_db_event('feedback_flush', 'feedback', False, {'error': 'corrupt_spool_record'})
+                if len(batch) >= FEEDBACK_FLUSH_BATCH:
+                    break
+        return batch, offset
+
+    def _store(self, batch: List[Dict]) -> bool:
+        """Insert ``batch``, moving rows the database rejects to the dead-letter file.
+
+        A rejected batch is split in halves until the offending rows are found,
+        so the rows around them are still stored. Returns False if the database
+        could not be reached; the batch then stays spooled for the next pass.
+        """
+        error = self._insert_with_retry(batch)
+        if error is None:
+            return True
+        if not _is_rejection(error):
+            return False
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            return self._store(batch[:middle]) and self._store(batch[middle:])
+        self._dead_letter(batch[0], error)
+        return True
+
+    def _insert_with_retry(self, batch: List[Dict]) -> Optional[Exception]:
+        """None once ``batch`` is stored, else the last error. Rejections are not retried."""
+        error = None
+        for attempt in range(FEEDBACK_FLUSH_RETRIES):
+            try:
+                self.supabase.table("feedback").insert(batch).execute()
+                return None
+            except Exception as e:
+                error = e
+                with self._lock:
+                    self.metrics["flush_failures"] += 1
+                self.logger.log_db_event('feedback_flush', 'feedback', False, {'error': str(e), 'attempt': attempt + 1})
+                if _is_rejection(e):
+                    return e
+                if attempt + 1 < FEEDBACK_FLUSH_RETRIES:
+                    time.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.5))
+        return error
+
+    def _dead_letter(self, record: Dict, error: Exception):
+        entry = {"record": record, "error": str(error), "failed_at": datetime.utcnow().isoformat()}
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        # Shared by every process: one locked append per record keeps lines whole
+        with open(self.dead_letter_path, "ab") as dead:
+            fcntl.flock(dead.fileno(), fcntl.LOCK_EX)
+            dead.write(line)
+            dead.flush()
+            os.fsync(dead.fileno())
+        with self._lock:
+            self.metrics["dead_lettered_total"] += 1
+        self.logger.log_db_event('feedback_dead_letter', 'feedback', False,
+                                 {'error': str(error), 'user_id': record.get('user_id')})
+
+    def _drain_orphans(self) -> int:
+        """Send and remove the spools of processes that have exited."""
+        drained = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if not _SPOOL_NAME.fullmatch(name) or path == self.spool_path:
+                continue
+            try:
+                with open(path, "rb") as orphan:
+                    try:
+                        fcntl.flock(orphan.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # its process is still running
+                    # Another process may have drained and removed it while we waited
+                    if os.fstat(orphan.fileno()).st_ino != os.stat(path).st_ino:
+                        continue
+                    drained += self._drain(path)
+            except FileNotFoundError:
+                continue
+        return drained
+
+    def _drain(self, spool_path: str) -> int:
+        offset = self._read_offset(spool_path)
+        drained = 0
+        while True:
+            batch, next_offset = self._read_batch(spool_path, offset)
+            if not batch:
+                break
+            if not self._store(batch):
+                return drained
+            offset = next_offset
+            self._write_offset(_offset_path(spool_path), offset)
+            drained += len(batch)
+            with self._lock:
+                self.metrics["flushed_total"] += len(batch)
+        # Spool first: a leftover offset file on its own is harmless, a reset one resends
+        os.remove(spool_path)
+        if os.path.exists(_offset_path(spool_path)):
+            os.remove(_offset_path(spool_path))
+        self.logger.log_db_event('feedback_flush', 'feedback', True,
+                                 {'records': drained, 'orphaned_spool': os.path.basename(spool_path)})
+        return drained
+
+    def _commit(self, next_offset: int, count: int, latency_ms: float):
+        with self._lock:
+            self._offset = next_offset
+            self._depth = max(0, self._depth - count)
+            self.metrics["spool_depth"] = self._depth
+            self.metrics["flushed_total"] += count
+            self.metrics["last_flush_latency_ms"] = latency_ms
+            self.metrics["max_flush_latency_ms"] = max(self.metrics["max_flush_latency_ms"], latency_ms)
+            fully_flushed = self._offset == self._spool.tell()
+            if fully_flushed:
+                self._offset = 0
+            # Persist the offset before truncating: a crash in between replays
+            # already-stored records rather than dropping new ones
+            self._write_offset(self.offset_path, self._offset)
+            if fully_flushed:
+                self._spool.truncate(0)
+                self._spool.seek(0)
+        self.logger.log_db_event('feedback_flush', 'feedback', True, {'records': count, 'latency_ms': round(latency_ms, 1)})
+
+    def _read_offset(self, spool_path: str) -> int:
+        try:
+            with open(_offset_path(spool_path), "r") as f:
+                return min(int(f.read().strip() or 0), os.path.getsize(spool_path))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset_path: str, offset: int):
+        tmp_path = offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, offset_path)
+
+    def _count_pending(self) -> int:
+        with open(self.spool_path, "rb") as spool:
+            spool.seek(self._offset)
+            return sum(1 for raw in spool if raw.endswith(b"\n"))
@@ -0,0 +1,349 @@
+"""Bulk-import users from a CSV or JSONL file.
+
+Each record needs ``email`` and either ``password`` (plaintext, hashed here
+across a process pool) or ``password_hash`` (an existing bcrypt hash, used
+as is). Optional columns: ``phase``, ``goal``, ``diet`` (list, or separated
+by ";"), ``email_verified`` and ``created_at``.
+
+Users and profiles are inserted in chunks. Progress is checkpointed after
+every chunk, so re-running the same command after an interruption resumes
+where it stopped; users already present (by email) are skipped.
+
+    python import_users.py users.csv --workers 4 --chunk-size 500
+    python import_users.py users.jsonl --send-verification --email-rate 5
+    python import_users.py users.csv --local      # dry run against an in-memory database
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+from auth_service import UNIQUE_VIOLATION, hash_password, validate_email
+from config import CYCLE_PHASES, DIETARY_OPTIONS, SUPPORT_OPTIONS
+
+BCRYPT_HASH = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+# Imported user ids are derived from the email, so a resumed chunk maps to the same rows
+IMPORT_NAMESPACE = uuid.UUID("6f1c2b0e-4a57-4f7e-9a53-2b1f0c7d9e41")
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson", ".json")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    return [hash_password(p) for p in passwords]
+
+
+def _split_list(value) -> List[str]:
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in (value or "").split(";") if item.strip()]
+
+
+def normalize(record: Dict) -> Tuple[Optional[Dict], str]:
+    """Validated user fields for a record, or (None, reason)."""
+    email = (record.get("email") or "").strip()
+    if not validate_email(email):
+        return None, "invalid_email"
+    password_hash = (record.get("password_hash") or "").strip()
+    password = record.get("password") or ""
+    if password_hash and not BCRYPT_HASH.match(password_hash):
+        return None, "invalid_password_hash"
+    if not password_hash and not password:
+        return None, "missing_password"
+    diet = [d for d in _split_list(record.get("diet")) if d in DIETARY_OPTIONS]
+    verified = str(record.get("email_verified", "")).strip().lower() in ("1", "true", "yes")
+    return {
+        "email": email,
+        "password": password_hash or None,
+        "plaintext": None if password_hash else password,
+        "email_verified": verified,
+        "created_at": record.get("created_at") or datetime.utcnow().isoformat(),
+        "phase": record.get("phase") if record.get("phase") in CYCLE_PHASES else None,
+        "goal": record.get("goal") if record.get("goal") in SUPPORT_OPTIONS else None,
+        "diet": diet
+    }, ""
+
+
+class UserImporter:
+    def __init__(self, supabase, chunk_size: int = 500, workers: int = os.cpu_count() or 1,
+                 checkpoint_path: Optional[str] = None, mark_verified: bool = False,
+                 email_dispatcher=None, email_job=None, progress=print):
+        self.supabase = supabase
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+        self.mark_verified = mark_verified
+        self.email_dispatcher = email_dispatcher
+        self.email_job = email_job  # (user_id, email, on_sent) -> callable for the dispatcher
+        self.progress = progress
+        self.pending_emails: Dict[str, str] = {}  # user_id -> email, queued but not yet sent
+        self._pending_lock = threading.Lock()
+        self.counts = {"records": 0, "inserted": 0, "resumed": 0, "skipped_existing": 0,
+                       "invalid": 0, "emails_queued": 0}
+        self.invalid_reasons: Dict[str, int] = {}
+
+    # --- checkpoint ---
+    def _load_checkpoint(self) -> int:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.counts.update(state.get("counts", {}))
+        self.invalid_reasons.update(state.get("invalid_reasons", {}))
+        for user_id, email in state.get("pending_emails", []):
+            self._queue_email(user_id, email, count=False)
+        return state["records"]
+
+    def _save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        with self._pending_lock:
+            pending_emails = sorted(self.pending_emails.items())
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "records": self.counts["records"],
+                "counts": self.counts,
+                "invalid_reasons": self.invalid_reasons,
+                "pending_emails": pending_emails
+            }, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # --- pipeline ---
+    def run(self, input_path: str) -> Dict:
+        skip = self._load_checkpoint()
+        started = time.perf_counter()
+        processed_this_run = 0
+        seen = set()
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            pending = None
+            for chunk in self._chunks(input_path, skip):
+                # Hash this chunk on the pool while the previous one is being inserted
+                prepared = self._prepare(chunk, seen, pool)
+                if pending is not None:
+                    processed_this_run += self._commit(pending)
+                    self._report(processed_this_run, started)
+                pending = prepared
+            if pending is not None:
+                processed_this_run += self._commit(pending)
+                self._report(processed_this_run, started)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.perf_counter() - started
+        return {
+            **self.counts,
+            "invalid_reasons": self.invalid_reasons,
+            "resumed_from_record": skip,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_s": round(processed_this_run / elapsed, 1) if elapsed else None
+        }
+
+    def _chunks(self, input_path: str, skip: int) -> Iterator[List[Dict]]:
+        chunk = []
+        for index, record in enumerate(read_records(input_path)):
+            if index < skip:
+                continue
+            chunk.append(record)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _prepare(self, chunk: List[Dict], seen: set, pool) -> Dict:
+        users = []
+        for record in chunk:
+            user, reason = normalize(record)
+            if user is None:
+                self.invalid_reasons[reason] = self.invalid_reasons.get(reason, 0) + 1
+                continue
+            if user["email"] in seen:
+                self.invalid_reasons["duplicate_in_file"] = self.invalid_reasons.get("duplicate_in_file", 0) + 1
+                continue
+            seen.add(user["email"])
+            users.append(user)
+        plaintext = [u for u in users if u["plaintext"] is not None]
+        futures = []
+        if plaintext and pool is not None:
+            size = -(-len(plaintext) // self.workers)
+            futures = [pool.submit(hash_passwords, [u["plaintext"] for u in plaintext[i:i + size]])
+                       for i in range(0, len(plaintext), size)]
+        return {"records": len(chunk), "users": users, "plaintext": plaintext, "futures": futures}
+
+    def _commit(self, prepared: Dict) -> int:
+        plaintext = prepared["plaintext"]
+        if prepared["futures"]:
+            hashes = [h for future in prepared["futures"] for h in future.result()]
+        else:
+            hashes = hash_passwords([u["plaintext"] for u in plaintext])
+        for user, hashed in zip(plaintext, hashes):
+            user["password"] = hashed
+
+        rows = [{
+            "id": str(uuid.uuid5(IMPORT_NAMESPACE, user["email"])),
+            "email": user["email"],
+            "password": user["password"],
+            "email_verified": self.mark_verified or user["email_verified"],
+            "created_at": user["created_at"],
+            "last_login": None
+        } for user in prepared["users"]]
+        inserted, resumed = self._insert_users(rows) if rows else ([], [])
+        imported = {row["id"] for row in inserted + resumed}
+        profiles = [{
+            "user_id": row["id"],
+            "phase": user["phase"],
+            "goal": user["goal"],
+            "diet": user["diet"],
+            "updated_at": datetime.utcnow().isoformat()
+        } for row, user in zip(rows, prepared["users"]) if row["id"] in imported]
+        if profiles:
+            self.supabase.table("profiles").upsert(profiles, on_conflict="user_id").execute()
+
+        if self.email_dispatcher is not None:
+            for row in inserted:
+                if not row["email_verified"]:
+                    self._queue_email(row["id"], row["email"])
+
+        self.counts["records"] += prepared["records"]
+        self.counts["inserted"] += len(inserted)
+        self.counts["resumed"] += len(resumed)
+        self.counts["skipped_existing"] += len(rows) - len(inserted) - len(resumed)
+        self.counts["invalid"] = sum(self.invalid_reasons.values())
+        self._save_checkpoint()
+        return prepared["records"]
+
+    def _insert_users(self, rows: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Insert a chunk; returns (inserted, already imported by an earlier run)."""
+        try:
+            self.supabase.table("users").insert(rows).execute()
+            return rows, []
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+        existing = {
+            r["email"]: r["id"]
+            for r in self.supabase.table("users").select("id, email").in_("email", [r["email"] for r in rows]).execute().data
+        }
+        fresh = [r for r in rows if r["email"] not in existing]
+        resumed = [r for r in rows if existing.get(r["email"]) == r["id"]]
+        if fresh:
+            self.supabase.table("users").insert(fresh).execute()
+        return fresh, resumed
+
+    def _queue_email(self, user_id: str, email: str, count: bool = True):
+        def sent():
+            with self._pending_lock:
+                self.pending_emails.pop(user_id, None)
+
+        with self._pending_lock:
+            self.pending_emails[user_id] = email
+        self.email_dispatcher.submit("verification", email, self.email_job(user_id, email, sent))
+        if count:
+            self.counts["emails_queued"] += 1
+
+    def _report(self, processed: int, started: float):
+        elapsed = time.perf_counter() - started
+        self.progress(
+            f"{self.counts['records']} records: {self.counts['inserted']} inserted, "
+            f"{self.counts['skipped_existing']} already existed, {self.counts['invalid']} invalid "
+            f"({processed / elapsed if elapsed else 0:.0f} rows/s)"
+        )
+
+
+def verification_job_factory(supabase):
+    """Jobs that issue a verification token and send the email, once per user."""
+    from email_service import EmailService
+    from token_service import TokenService
+    email_service = EmailService()
+    token_service = TokenService(supabase)
+
+    def job(user_id: str, email: str, on_sent):
+        token = None
+
+        def send() -> bool:
+            nonlocal token
+            if token is None:
+                token = token_service.issue("verification", email, user_id)
+            ok = email_service.send_verification_email(user_id, email, token)
+            if ok:
+                on_sent()
+            return ok
+
+        return send
+
+    return job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-import users from a CSV or JSONL file.")
+    parser.add_argument("input", help="CSV or JSONL with email and password or password_hash")
+    parser.add_argument("--checkpoint", help="progress file (default: <input>.checkpoint)")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes for password hashing")
+    parser.add_argument("--verified", action="store_true", help="mark every imported email as verified")
+    parser.add_argument("--send-verification", action="store_true", help="email unverified users a verification link")
+    parser.add_argument("--email-rate", type=float, default=5, help="verification emails per second")
+    parser.add_argument("--local", action="store_true", help="import into an in-memory database (dry run)")
+    parser.add_argument("--report", help="also write the final report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    if args.local:
+        from local_supabase import LocalSupabase
+        supabase = LocalSupabase()
+    else:
+        from supabase import create_client
+        from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+    dispatcher = job = None
+    if args.send_verification:
+        from email_dispatcher import EmailDispatcher
+        dispatcher = EmailDispatcher(rate=args.email_rate)
+        job = verification_job_factory(supabase)
+
+    importer = UserImporter(
+        supabase,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint or args.input + ".checkpoint",
+        mark_verified=args.verified,
+        email_dispatcher=dispatcher,
+        email_job=job
+    )
+    report = importer.run(args.input)
+    if dispatcher is not None:
+        print(f"Waiting for {dispatcher.pending()} verification emails...")
+        while not dispatcher.drain(10):
+            importer._save_checkpoint()
+            print(f"  {dispatcher.pending()} emails still queued")
+        importer._save_checkpoint()
+        report["emails"] = dispatcher.get_metrics()
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    CYCLE_PHASES,
+    DIETARY_OPTIONS,
+    SUPPORT_OPTIONS,
+    KNOWLEDGE_BASE_PATH,
+    KNOWLEDGE_VECTORS_PATH
+)
+
+# Ingredients each dietary option rules out; a document's "contains" tags are
+# matched against these to build its exclusion bitmask.
+DIET_EXCLUSIONS = {
+    "Vegan": {"meat", "fish", "dairy", "egg", "honey"},
+    "Vegetarian": {"meat", "fish"},
+    "Nut allergy": {"nuts"},
+    "Gluten free": {"gluten"},
+    "Lactose intolerance": {"dairy"}
+}
+
+VECTOR_DIM = 256
+BM25_K1 = 1.2
+BM25_B = 0.75
+DENSE_WEIGHT = 0.5
+GOAL_BOOST = 0.2
+
+# Seed-syncing lookups, e.g. "What nutritional seeds support my phase (seed syncing)?" or
+# "Which seeds should I eat in my luteal phase?". Only asking which seeds to eat counts;
+# anything else about seeds ("Which seeds should I avoid ...", "Is seed syncing proven?")
+# goes to the model.
+_MY_PHASE = r"(?:my|the|this)\s+(?:(?P<{name}>[a-z]+)\s+)?phase"
+_SEED_SYNCING = r"seed[ -]?sync(?:ing)?"
+_SEED_LOOKUP = re.compile(
+    r"(?:(?:which|what)\s+(?:nutritional\s+)?seeds?\s+"
+    r"(?:should\s+i\s+(?:eat|have|add)|do\s+i\s+(?:eat|need)|are\s+(?:good|best)\s+for|support|suit|for|to\s+eat)"
+    r"\s+(?:(?:in|during|for)\s+)?" + _MY_PHASE.format(name="phase") +
+    r"|(?:what\s+(?:is|are)\s+)?(?:my\s+)?seeds?\s+for\s+" + _MY_PHASE.format(name="seeds_phase") +
+    r"|(?:(?:which|what)\s+seeds?\s+(?:for|in)\s+)?" + _SEED_SYNCING +
+    r"(?:\s+(?:for|in|during)\s+" + _MY_PHASE.format(name="syncing_phase") + r")?)"
+    r"(?:\s*\(" + _SEED_SYNCING + r"\))?\s*[?.!]*",
+    re.IGNORECASE
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "best", "by", "can", "do", "for", "from", "give", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "should", "that", "the", "this", "to", "what",
+    "which", "with", "you", "your"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+    # Crude plural folding so "seeds" matches "seed"
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+
+
+def embed(tokens: List[str], dim: int = VECTOR_DIM) -> np.ndarray:
+    """Signed feature-hashing embedding of unigrams and bigrams, L2-normalised."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def diet_mask(dietary_preferences) -> int:
+    mask = 0
+    for preference in dietary_preferences or []:
+        if preference in DIETARY_OPTIONS:
+            mask |= 1 << DIETARY_OPTIONS.index(preference)
+    return mask
+
+
+def phase_mask(phases) -> int:
+    mask = 0
+    for phase in phases or []:
+        if phase in CYCLE_PHASES:
+            mask |= 1 << CYCLE_PHASES.index(phase)
+    return mask
+
+
+def goal_mask(goals) -> int:
+    mask = 0
+    for goal in goals or []:
+        if goal in SUPPORT_OPTIONS:
+            mask |= 1 << SUPPORT_OPTIONS.index(goal)
+    return mask
+
+
+class KnowledgeBase:
+    """Food knowledge keyed by cycle phase, goal and dietary restrictions.
+
+    Retrieval combines BM25 over precomputed per-posting weights with a dense
+    hashed-embedding index held in a memory-mapped float32 matrix. Phase and
+    diet filtering are bitmask operations over NumPy arrays.
+    """
+
+    def __init__(self, documents: List[Dict], vector_path: str = KNOWLEDGE_VECTORS_PATH, source_mtime: float = 0.0):
+        self.documents = documents
+        self.source_mtime = source_mtime
+        n = len(documents)
+        # Which dietary options each document violates, and which phases and goals it fits
+        self.diet_masks = np.zeros(n, dtype=np.uint8)
+        self.phase_masks = np.zeros(n, dtype=np.uint8)
+        self.goal_masks = np.zeros(n, dtype=np.uint8)
+        for i, doc in enumerate(documents):
+            contains = set(doc.get("contains", []))
+            self.diet_masks[i] = sum(
+                1 << DIETARY_OPTIONS.index(option)
+                for option, excluded in DIET_EXCLUSIONS.items()
+                if contains & excluded
+            )
+            self.phase_masks[i] = phase_mask(doc.get("phases"))
+            self.goal_masks[i] = goal_mask(doc.get("goals"))
+
+        tokenized = [tokenize(f"{doc.get('food', '')} {doc.get('category', '')} {doc['text']}") for doc in documents]
+        self._build_bm25(tokenized)
+        self.vectors = self._load_or_build_vectors(tokenized, vector_path)
+
+    @classmethod
+    def from_file(cls, path: str = KNOWLEDGE_BASE_PATH, vector_path: str = KNOWLEDGE_VECTORS_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), vector_path, os.path.getmtime(path))
+
+    def _build_bm25(self, tokenized: List[List[str]]):
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        postings = defaultdict(lambda: ([], []))
+        for doc_id, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+        n = len(tokenized)
+        self.postings = {}
+        for term, (doc_ids, tfs) in postings.items():
+            doc_ids = np.array(doc_ids, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (n - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / (avg_length or 1))
+            self.postings[term] = (doc_ids, (idf * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32))
+
+    def _load_or_build_vectors(self, tokenized: List[List[str]], vector_path: str) -> np.ndarray:
+        shape = (len(tokenized), VECTOR_DIM)
+        expected_bytes = shape[0] * shape[1] * 4
+        if vector_path and os.path.exists(vector_path) and os.path.getsize(vector_path) == expected_bytes \
+                and os.path.getmtime(vector_path) >= self.source_mtime:
+            return np.memmap(vector_path, dtype=np.float32, mode="r", shape=shape)
+        if not vector_path:
+            return np.stack([embed(tokens) for tokens in tokenized]) if tokenized else np.zeros(shape, np.float32)
+        os.makedirs(os.path.dirname(vector_path) or ".", exist_ok=True)
+        vectors = np.memmap(vector_path, dtype=np.float32, mode="w+", shape=shape)
+        for i, tokens in enumerate(tokenized):
+            vectors[i] = embed(tokens)
+        vectors.flush()
+        del vectors
+        return np.memmap(vector_path, dtype=np.float32, mode="r", shape=shape)
+
+    def search(self, query: str, phase: Optional[str] = None, goal: Optional[str] = None,
+               dietary_preferences=None, k: int = 5) -> List[Dict]:
+        tokens = tokenize(query)
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in set(tokens):
+            if term in self.postings:
+                doc_ids, weights = self.postings[term]
+                scores[doc_ids] += weights
+        if scores.max(initial=0) > 0:
+            scores /= scores.max()
+        scores += DENSE_WEIGHT * (self.vectors @ embed(tokens))
+        if goal in SUPPORT_OPTIONS:
+            scores += GOAL_BOOST * ((self.goal_masks & goal_mask([goal])) != 0)
+
+        allowed = (self.diet_masks & diet_mask(dietary_preferences)) == 0
+        if phase in CYCLE_PHASES:
+            allowed &= (self.phase_masks & phase_mask([phase])) != 0
+        scores = np.where(allowed, scores, -np.inf)
+
+        k = min(k, int(allowed.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.documents[i] for i in top if scores[i] > 0]
+
+    def context_for(self, question: str, phase: Optional[str], goal: Optional[str], dietary_preferences, k: int = 4) -> str:
+        """Retrieved snippets, formatted for the prompt."""
+        return "\n".join(f"- {doc['food']}: {doc['text']}" for doc in self.search(question, phase, goal, dietary_preferences, k))
+
+    def answer_factual(self, question: str, phase: Optional[str], dietary_preferences) -> Optional[str]:
+        """Answer lookups the knowledge base covers completely, without an LLM call."""
+        match = _SEED_LOOKUP.fullmatch((question or "").strip())
+        if phase not in CYCLE_PHASES or not match:
+            return None
+        # "... for my luteal phase" while in another phase is a different lookup; leave it to the model
+        named = match.group("phase") or match.group("seeds_phase") or match.group("syncing_phase")
+        if named and named.lower() != phase.lower():
+            return None
+        allowed = ((self.diet_masks & diet_mask(dietary_preferences)) == 0) & \
+                  ((self.phase_masks & phase_mask([phase])) != 0)
+        seeds = [self.documents[i] for i in np.flatnonzero(allowed) if self.documents[i].get("category") == "seed"]
+        if not seeds:
+            return None
+        lines = [f"For seed syncing in your **{phase}** phase, these seeds support you:"]
+        lines += [f"- **{doc['food']}**: {doc['text']}" for doc in seeds]
+        lines.append("Would you like a breakfast idea that includes them?")
+        return "\n".join(lines)
+
+
+@lru_cache(maxsize=None)
+def get_knowledge_base() -> KnowledgeBase:
+    return KnowledgeBase.from_file()
@@ -0,0 +1,301 @@
+"""Token, latency and cost accounting for LLM questions.
+
+Every answered question is recorded once: its category (``free_text``,
+``suggested_<index>``, ``api``), model, prompt and completion tokens summed
+over its finished upstream attempts (retries and hedges cost money too),
+end-to-end latency, time to first token for streamed answers, and whether
+it was served from a cache or shared an identical in-flight call
+(``coalesced``, at no token cost). Records are buffered in memory and written by a
+background thread to a local SQLite file:
+
+- ``llm_calls`` keeps raw rows for LLM_USAGE_RAW_RETENTION_HOURS;
+- ``llm_usage_hourly`` is updated on every write with per-hour totals and
+  log-bucketed latency histograms, so percentiles over any window are
+  computed without the raw rows, and is kept for LLM_USAGE_ROLLUP_RETENTION_DAYS.
+
+    python llm_accounting.py report --hours 24 --by category
+    python llm_accounting.py report --hours 168 --by model
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import (
+    LLM_PRICES,
+    LLM_USAGE_DB_PATH,
+    LLM_USAGE_FLUSH_INTERVAL,
+    LLM_USAGE_RAW_RETENTION_HOURS,
+    LLM_USAGE_ROLLUP_RETENTION_DAYS
+)
+from fake_llm import approx_tokens
+from logging_service import LoggingService
+
+# Upper bounds of the latency histogram buckets: 10 ms growing by 25% to about 75 s
+LATENCY_BUCKETS_MS = tuple(round(10 * 1.25 ** i, 1) for i in range(41))
+
+
+def bucket_index(ms: float) -> int:
+    return bisect_left(LATENCY_BUCKETS_MS, ms)  # len(LATENCY_BUCKETS_MS) is the overflow bucket
+
+
+def histogram_percentile(counts: List[int], p: float) -> Optional[float]:
+    total = sum(counts)
+    if not total:
+        return None
+    rank, seen = p * total, 0
+    for i, count in enumerate(counts):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS_MS[min(i, len(LATENCY_BUCKETS_MS) - 1)]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+def cost_of(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = LLM_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Collects model, token usage and first-token time over one question's upstream calls."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token = None
+        self.model = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._prompt_estimate = 0
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        # Used when the response carries no usage (e.g. some streamed responses)
+        self._prompt_estimate = sum(approx_tokens(str(m.content)) for m in messages[0]) if messages else 0
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def on_llm_end(self, response, **kwargs):
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        if prompt_tokens is None:
+            # Streamed responses report usage on the message, if at all
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens = metadata.get("input_tokens", self._prompt_estimate)
+            completion_tokens = metadata.get("output_tokens", approx_tokens(generation.text if generation else ""))
+        with self._lock:
+            self.model = output.get("model_name") or self.model
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        return (self.first_token - self.started) * 1000 if self.first_token is not None else None
+
+
+class LLMUsageStore:
+    def __init__(self, path: str = LLM_USAGE_DB_PATH, flush_interval: float = LLM_USAGE_FLUSH_INTERVAL,
+                 raw_retention_hours: int = LLM_USAGE_RAW_RETENTION_HOURS,
+                 rollup_retention_days: int = LLM_USAGE_ROLLUP_RETENTION_DAYS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.raw_retention = raw_retention_hours * 3600
+        self.rollup_retention = rollup_retention_days * 86400
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._last_prune = 0.0
+        self.logger = LoggingService()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_calls ("
+                "ts INTEGER NOT NULL, category TEXT NOT NULL, model TEXT, prompt_tokens INTEGER NOT NULL, "
+                "completion_tokens INTEGER NOT NULL, cost REAL NOT NULL, latency_ms REAL NOT NULL, ttft_ms REAL, "
+                "cache TEXT NOT NULL, outcome TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_calls_ts ON llm_calls (ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_usage_hourly ("
+                "hour INTEGER NOT NULL, category TEXT NOT NULL, model TEXT NOT NULL, cache TEXT NOT NULL, "
+                "calls INTEGER NOT NULL, errors INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+                "completion_tokens INTEGER NOT NULL, cost REAL NOT NULL, latency_hist TEXT NOT NULL, "
+                "ttft_hist TEXT NOT NULL, PRIMARY KEY (hour, category, model, cache)) WITHOUT ROWID"
+            )
+        threading.Thread(target=self._flush_loop, name="llm-usage-flusher", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, category: str, model: Optional[str] = None, prompt_tokens: int = 0, completion_tokens: int = 0,
+               latency_ms: float = 0.0, ttft_ms: Optional[float] = None, cache: str = "miss", outcome: str = "ok"):
+        """Buffer one question's usage; ``cache`` is "hit", "miss" or "coalesced", ``outcome`` "ok", "fallback" or "error"."""
+        row = (int(time.time()), category, model, prompt_tokens, completion_tokens,
+               cost_of(model, prompt_tokens, completion_tokens), latency_ms, ttft_ms, cache, outcome)
+        with self._lock:
+            self._pending.append(row)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                self._write(rows)
+            except Exception as e:
+                self.logger.log_db_event('llm_usage_flush', 'llm_usage', False, {'error': str(e), 'rows': len(rows)})
+                with self._lock:
+                    self._pending[:0] = rows
+
+    def _write(self, rows: List[tuple]):
+        rollups = {}
+        for ts, category, model, prompt_tokens, completion_tokens, cost, latency_ms, ttft_ms, cache, outcome in rows:
+            key = (ts - ts % 3600, category, model or "", cache)
+            rollup = rollups.setdefault(key, [0, 0, 0, 0, 0.0, defaultdict(int), defaultdict(int)])
+            rollup[0] += 1
+            rollup[1] += outcome != "ok"
+            rollup[2] += prompt_tokens
+            rollup[3] += completion_tokens
+            rollup[4] += cost
+            rollup[5][bucket_index(latency_ms)] += 1
+            if ttft_ms is not None:
+                rollup[6][bucket_index(ttft_ms)] += 1
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                for key, (calls, errors, prompt_tokens, completion_tokens, cost, latency, ttft) in rollups.items():
+                    existing = conn.execute(
+                        "SELECT latency_hist, ttft_hist FROM llm_usage_hourly "
+                        "WHERE hour = ? AND category = ? AND model = ? AND cache = ?", key
+                    ).fetchone()
+                    latency_hist, ttft_hist = (json.loads(existing[0]), json.loads(existing[1])) if existing else ([], [])
+                    conn.execute(
+                        "INSERT INTO llm_usage_hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (hour, category, model, cache) DO UPDATE SET "
+                        "calls = calls + excluded.calls, errors = errors + excluded.errors, "
+                        "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                        "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                        "cost = cost + excluded.cost, latency_hist = excluded.latency_hist, ttft_hist = excluded.ttft_hist",
+                        (*key, calls, errors, prompt_tokens, completion_tokens, cost,
+                         json.dumps(_merge(latency_hist, latency)), json.dumps(_merge(ttft_hist, ttft)))
+                    )
+                now = time.time()
+                if now - self._last_prune > 3600:
+                    conn.execute("DELETE FROM llm_calls WHERE ts < ?", (now - self.raw_retention,))
+                    conn.execute("DELETE FROM llm_usage_hourly WHERE hour < ?", (now - self.rollup_retention,))
+                    self._last_prune = now
+        finally:
+            conn.close()
+
+    def _flush_loop(self):
+        while not self._wake.wait(self.flush_interval):
+            self.flush()
+
+    def report(self, hours: float = 24, by: str = "category") -> List[Dict]:
+        """Totals and latency percentiles per ``by`` (category, model, cache or hour) from the hourly rollups."""
+        self.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT hour, category, model, cache, calls, errors, prompt_tokens, completion_tokens, cost, "
+                "latency_hist, ttft_hist FROM llm_usage_hourly WHERE hour >= ?",
+                (int(time.time() - hours * 3600) // 3600 * 3600,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        groups = {}
+        for hour, category, model, cache, calls, errors, prompt_tokens, completion_tokens, cost, latency, ttft in rows:
+            key = {"category": category, "model": model or "-", "cache": cache,
+                   "hour": time.strftime("%Y-%m-%d %H:00", time.gmtime(hour))}[by]
+            group = groups.setdefault(key, {"calls": 0, "errors": 0, "hits": 0, "coalesced": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "cost": 0.0, "latency": [], "ttft": []})
+            group["calls"] += calls
+            group["errors"] += errors
+            group["hits"] += calls if cache == "hit" else 0
+            group["coalesced"] += calls if cache == "coalesced" else 0
+            group["prompt_tokens"] += prompt_tokens
+            group["completion_tokens"] += completion_tokens
+            group["cost"] += cost
+            group["latency"] = _merge(group["latency"], json.loads(latency))
+            group["ttft"] = _merge(group["ttft"], json.loads(ttft))
+
+        report = []
+        for key, group in sorted(groups.items()):
+            report.append({
+                by: key,
+                "calls": group["calls"],
+                "cache_hit_rate": round(group["hits"] / group["calls"], 3),
+                "coalesced_rate": round(group["coalesced"] / group["calls"], 3),
+                "error_rate": round(group["errors"] / group["calls"], 3),
+                "latency_ms_p50": histogram_percentile(group["latency"], 0.5),
+                "latency_ms_p99": histogram_percentile(group["latency"], 0.99),
+                "ttft_ms_p50": histogram_percentile(group["ttft"], 0.5),
+                "prompt_tokens": group["prompt_tokens"],
+                "completion_tokens": group["completion_tokens"],
+                "cost": round(group["cost"], 4),
+                "cost_per_call": round(group["cost"] / group["calls"], 5)
+            })
+        return report
+
+
+def _merge(histogram: List[int], counts) -> List[int]:
+    """Add ``counts`` ({bucket: n} or a list) into a histogram list, growing it as needed."""
+    items = counts.items() if isinstance(counts, dict) else enumerate(counts)
+    merged = list(histogram)
+    for index, count in items:
+        if index >= len(merged):
+            merged.extend([0] * (index + 1 - len(merged)))
+        merged[index] += count
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report LLM latency, token and cost breakdowns.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report")
+    report.add_argument("--hours", type=float, default=24)
+    report.add_argument("--by", choices=["category", "model", "cache", "hour"], default="category")
+    report.add_argument("--json", action="store_true")
+    report.add_argument("--db", default=LLM_USAGE_DB_PATH)
+    args = parser.parse_args(argv)
+
+    rows = LLMUsageStore(args.db).report(args.hours, args.by)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    print(f"{args.by:<18} {'calls':>6} {'hit%':>5} {'coal%':>5} {'err%':>5} {'p50 ms':>8} {'p99 ms':>8} {'ttft p50':>8} "
+          f"{'prompt tok':>10} {'compl tok':>10} {'cost $':>9} {'$/call':>8}")
+    for row in rows:
+        ttft = f"{row['ttft_ms_p50']:.0f}" if row["ttft_ms_p50"] is not None else "-"
+        print(f"{str(row[args.by]):<18} {row['calls']:>6} {row['cache_hit_rate']:>5.0%} {row['coalesced_rate']:>5.0%} {row['error_rate']:>5.0%} "
+              f"{row['latency_ms_p50'] or 0:>8.0f} {row['latency_ms_p99'] or 0:>8.0f} {ttft:>8} "
+              f"{row['prompt_tokens']:>10} {row['completion_tokens']:>10} {row['cost']:>9.4f} {row['cost_per_call']:>8.5f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from admission import AdmissionRejected, PRIORITY_USER
+from config import (
+    ERROR_MESSAGES,
+    LLM_EXPECTED_COMPLETION_TOKENS,
+    LLM_DEADLINE,
+    LLM_MAX_RETRIES,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_COOLDOWN,
+    LLM_COALESCE_ENABLED
+)
+from fake_llm import approx_tokens
+from llm_accounting import UsageCallback
+from logging_service import LoggingService
+from single_flight import SingleFlight, prompt_key
+
+# Upstream calls run on this pool so a hung request only ever pins a worker
+# thread, never the session waiting on it.
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures; after
+    ``cooldown`` seconds one trial call is let through (half-open), and its
+    outcome closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self):
+        """End a call that gave no verdict, e.g. one its caller abandoned."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of upstream latencies for choosing the hedge delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class ResilientChain:
+    """Wraps an LLMChain with a deadline, retries, hedging and a circuit breaker.
+
+    ``run(inputs)`` has the same shape as ``LLMChain.run`` and always returns
+    within ``deadline`` seconds. While the upstream is failing it returns the
+    last good answer for the same inputs, or a short answer built from the
+    retrieved knowledge-base context.
+
+    With an ``admission`` controller every upstream request first waits for
+    budget; hedges are only sent when budget is free right away. With a
+    ``usage`` store (llm_accounting.LLMUsageStore) each question's tokens,
+    latency and outcome are recorded under its ``category``.
+
+    Identical prompts asked while one is already in flight share that call
+    (see single_flight.py): one upstream request, one answer or one error.
+
+    ``astream`` is the streaming counterpart of ``run``, for the HTTP API.
+    """
+
+    def __init__(self, chain, deadline: float = LLM_DEADLINE, max_retries: int = LLM_MAX_RETRIES,
+                 hedge: bool = LLM_HEDGE_ENABLED, hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 breaker: Optional[CircuitBreaker] = None, cache_size: int = 256, admission=None, usage=None,
+                 coalesce: bool = LLM_COALESCE_ENABLED):
+        self.chain = chain
+        self.flight = SingleFlight() if coalesce else None
+        self.admission = admission
+        self.usage = usage
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = LatencyTracker()
+        self.cache_size = cache_size
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "fallbacks": 0,
+                        "rejected": 0, "coalesced": 0}
+        self.logger = LoggingService()
+
+    # Delegate everything else (prompt, llm, ainvoke, ...) to the wrapped chain
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
+
+    def run(self, inputs: Dict, user_id: str = "anonymous", priority: int = PRIORITY_USER,
+            category: str = "free_text") -> str:
+        self._count("calls")
+        started = time.monotonic()
+        if self.flight is None:
+            return self._run(inputs, user_id, priority, category, started)[0]
+        led = []
+
+        def lead():
+            led.append(True)
+            return self._run(inputs, user_id, priority, category, started)
+
+        try:
+            # The leader returns within its deadline; the timeout only guards against a wedged one
+            (answer, outcome), shared = self.flight.do(prompt_key(self._render(inputs)), lead, timeout=self.deadline + 1.0)
+        except Exception as e:
+            if led:
+                raise
+            # A waiter gets the leader's error, or the fallback if the leader never answered
+            self._count("coalesced")
+            try:
+                if not isinstance(e, TimeoutError):
+                    raise
+                answer, _ = self._fallback(inputs)
+            except Exception:
+                self._account(category, UsageCallback(), started, "coalesced", "error")
+                raise
+            self._account(category, UsageCallback(), started, "coalesced", "fallback")
+            return answer
+        if shared:
+            self._count("coalesced")
+            self._account(category, UsageCallback(), started, "coalesced", outcome)
+        return answer
+
+    async def astream(self, inputs: Dict, user_id: str = "anonymous", priority: int = PRIORITY_USER,
+                      category: str = "free_text") -> AsyncIterator[str]:
+        """The answer as text chunks, under the same breaker, admission and accounting as ``run``.
+
+        ``deadline`` bounds the wait for the first chunk and every gap after it.
+        A failure before the first chunk is answered with the fallback; after
+        that the error is raised, as part of the answer is already out. Streams
+        are not retried or hedged.
+        """
+        self._count("calls")
+        started = time.monotonic()
+        usage = UsageCallback()
+        parts = []
+        error = None
+        finished = False
+        try:
+            if not self.breaker.allow():
+                raise CircuitOpenError("circuit open")
+            caller = (user_id, priority, self._estimate_tokens(inputs))
+            ticket = await asyncio.to_thread(self._admit, caller, self.deadline)
+            chunks = self._chunks(inputs, usage)
+            try:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+            finally:
+                await chunks.aclose()
+                if ticket is not None:
+                    answer = "".join(parts)
+                    self.admission.settle(ticket, ticket.tokens - LLM_EXPECTED_COMPLETION_TOKENS + approx_tokens(answer))
+            finished = True
+        except CircuitOpenError as e:
+            error = e
+        except AdmissionRejected as e:
+            error = e
+            self._count("rejected")
+        except Exception as e:
+            error = e
+            self.breaker.record_failure()
+        finally:
+            if not finished and error is None:
+                # Abandoned by the caller: chunks prove the upstream works, no chunks prove nothing
+                if parts:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.release()
+                self._account(category, usage, started, "miss", "error")
+        if finished:
+            self.breaker.record_success()
+            self._remember(inputs, "".join(parts))
+            self._account(category, usage, started, "miss", "ok")
+            return
+        self.logger.log_app_event('llm_call_failed', {
+            'error': str(error),
+            'breaker': self.breaker.state,
+            'elapsed': round(time.monotonic() - started, 3),
+            'streamed_chunks': len(parts)
+        }, level='ERROR')
+        if parts:
+            self._account(category, usage, started, "miss", "error")
+            raise error
+        try:
+            answer, cached = self._fallback(inputs)
+        except RuntimeError:
+            self._account(category, usage, started, "miss", "error")
+            raise
+        self._account(category, usage, started, "hit" if cached else "miss", "fallback")
+        yield answer
+
+    async def _chunks(self, inputs: Dict, usage: UsageCallback) -> AsyncIterator[str]:
+        stream = (self.chain.prompt | self.chain.llm).astream(inputs, config={"callbacks": [usage]})
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), self.deadline)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self._count("timeouts")
+                    raise TimeoutError(f"no chunk within {self.deadline}s") from None
+                yield chunk.content
+        finally:
+            await stream.aclose()
+
+    def _run(self, inputs: Dict, user_id: str, priority: int, category: str, started: float) -> Tuple[str, str]:
+        """The answer and its outcome ("ok" or "fallback"), with retries, hedging and fallback."""
+        caller = (user_id, priority, self._estimate_tokens(inputs))
+        usage = UsageCallback()
+        deadline = started + self.deadline
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                error = CircuitOpenError("circuit open")
+                break
+            try:
+                answer = self._attempt(inputs, deadline, caller, usage)
+            except AdmissionRejected as e:
+                # Our own overload, not an upstream failure: don't trip the breaker or retry
+                error = e
+                self._count("rejected")
+                break
+            except Exception as e:
+                error = e
+                self.breaker.record_failure()
+                backoff = min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                if attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+                    break
+                self._count("retries")
+                time.sleep(backoff)
+                continue
+            self.breaker.record_success()
+            self._remember(inputs, answer)
+            self._account(category, usage, started, "miss", "ok")
+            return answer, "ok"
+        self.logger.log_app_event('llm_call_failed', {
+            'error': str(error),
+            'breaker': self.breaker.state,
+            'elapsed': round(time.monotonic() - started, 3)
+        }, level='ERROR')
+        try:
+            answer, cached = self._fallback(inputs)
+        except RuntimeError:
+            self._account(category, usage, started, "miss", "error")
+            raise
+        self._account(category, usage, started, "hit" if cached else "miss", "fallback")
+        return answer, "fallback"
+
+    def _attempt(self, inputs: Dict, deadline: float, caller, usage: UsageCallback) -> str:
+        futures = [self._submit(inputs, self._admit(caller, deadline - time.monotonic()), usage)]
+        delay = self._hedge_delay()
+        if delay is not None:
+            done, _ = wait(futures, timeout=min(delay, max(0.0, deadline - time.monotonic())), return_when=FIRST_COMPLETED)
+            if not done and time.monotonic() < deadline:
+                try:
+                    ticket = self._admit(caller, 0)
+                except AdmissionRejected:
+                    ticket = False
+                if ticket is not False:
+                    self._count("hedges")
+                    futures.append(self._submit(inputs, ticket, usage))
+        pending = set(futures)
+        last_error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                self._count("timeouts")
+                raise TimeoutError(f"no answer within {self.deadline}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count("hedge_wins")
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
+
+    def _admit(self, caller, timeout: float):
+        if self.admission is None:
+            return None
+        user_id, priority, tokens = caller
+        return self.admission.acquire(user_id, priority, tokens, timeout=max(0.0, timeout))
+
+    def _render(self, inputs: Dict) -> str:
+        try:
+            return self.chain.prompt.format(**inputs)
+        except Exception:
+            return json.dumps(inputs, sort_keys=True, default=str)
+
+    def _estimate_tokens(self, inputs: Dict) -> int:
+        return approx_tokens(self._render(inputs)) + LLM_EXPECTED_COMPLETION_TOKENS
+
+    def _submit(self, inputs: Dict, ticket=None, usage: Optional[UsageCallback] = None):
+        started = time.monotonic()
+
+        def record(future):
+            # Losing hedges still report their latency, so the p95 stays honest
+            if future.exception() is None:
+                self.latencies.add(time.monotonic() - started)
+            if ticket is not None:
+                answer = future.result() if future.exception() is None else ""
+                used = ticket.tokens - LLM_EXPECTED_COMPLETION_TOKENS + approx_tokens(answer)
+                self.admission.settle(ticket, used)
+
+        future = _executor.submit(self.chain.run, inputs, callbacks=[usage] if usage is not None else None)
+        future.add_done_callback(record)
+        return future
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        p95 = self.latencies.percentile(0.95)
+        return max(self.hedge_min_delay, p95) if p95 is not None else None
+
+    def _key(self, inputs: Dict) -> str:
+        return hashlib.blake2b(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _remember(self, inputs: Dict, answer: str):
+        key = self._key(inputs)
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.cache_size:
+                self._answers.popitem(last=False)
+
+    def _fallback(self, inputs: Dict) -> Tuple[str, bool]:
+        """The fallback answer, and whether it is a cached earlier answer."""
+        self._count("fallbacks")
+        with self._lock:
+            cached = self._answers.get(self._key(inputs))
+        if cached is not None:
+            return cached, True
+        context = inputs.get("context")
+        if context and context != "None":
+            return f"{ERROR_MESSAGES['llm_unavailable']}.\n\nFrom our food notes for your {inputs.get('phase')} phase:\n{context}", False
+        raise RuntimeError(ERROR_MESSAGES["llm_unavailable"])
+
+    def _account(self, category: str, usage: UsageCallback, started: float, cache: str, outcome: str):
+        if self.usage is None:
+            return
+        # Tokens of a hedge still running at this point are not counted
+        self.usage.record(category, usage.model, usage.prompt_tokens, usage.completion_tokens,
+                          (time.monotonic() - started) * 1000, usage.ttft_ms, cache, outcome)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
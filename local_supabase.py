@@ -0,0 +1,290 @@
+"""In-memory stand-in for the Supabase client, for benchmarks and local runs.
+
+Implements the subset of the postgrest query builder the services use
+(select/insert/upsert/update/delete with eq/neq/in_/gt/gte/lt/lte filters,
+order, limit and range) with unique constraints that fail like PostgreSQL,
+identity ``id`` columns filled in on insert, the database functions the
+services call through ``rpc`` (see supabase/migrations), plus an optional
+per-request latency to mimic the network round trip.
+
+    from local_supabase import LocalSupabase
+    auth = AuthService(supabase=LocalSupabase(latency=0.005))
+"""
+import copy
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from postgrest.exceptions import APIError
+
+DEFAULT_UNIQUE = {
+    "users": [("id",), ("email",)],
+    "profiles": [("user_id",)],
+    "email_verifications": [("token",)],
+    "password_resets": [("token",)],
+    "meal_log_aggregates": [("user_id", "bucket")],
+    "period_history": [("user_id", "period_start")],
+    "cycle_stats": [("user_id",)],
+    "meal_plans": [("id",), ("user_id", "profile_key", "request_key")],
+}
+# Tables whose ``id`` is a bigserial in PostgreSQL
+DEFAULT_IDENTITY = ("chat_history", "feedback", "notifications")
+
+
+class _Response:
+    def __init__(self, data: List[Dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, db: "LocalSupabase", table: str):
+        self.db = db
+        self.table_name = table
+        self.action = "select"
+        self.columns: Optional[List[str]] = None
+        self.payload = None
+        self.on_conflict: Optional[Sequence[str]] = None
+        self.filters = []
+        self.ordering = []
+        self.limit_count: Optional[int] = None
+        self.offset = 0
+        self.count_mode = None
+
+    # --- actions ---
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        self.action = "select"
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count_mode = count
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: Optional[str] = None):
+        self.action, self.payload = "upsert", rows
+        self.on_conflict = tuple(c.strip() for c in on_conflict.split(",")) if on_conflict else None
+        return self
+
+    def update(self, values: Dict):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    # --- filters and modifiers ---
+    def _filter(self, column, test):
+        self.filters.append((column, test))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def in_(self, column, values: Iterable):
+        values = set(values)
+        return self._filter(column, lambda v: v in values)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def is_(self, column, value):
+        return self._filter(column, lambda v: v is None if value in (None, "null") else v == value)
+
+    def order(self, column, desc: bool = False):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int):
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    def execute(self) -> _Response:
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            self.db.requests += 1
+            return getattr(self, f"_execute_{self.action}")()
+
+    # --- execution, under the database lock ---
+    def _matches(self, row: Dict) -> bool:
+        return all(test(row.get(column)) for column, test in self.filters)
+
+    def _project(self, row: Dict) -> Dict:
+        if self.columns is None:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in self.columns}
+
+    def _execute_select(self) -> _Response:
+        rows = [row for row in self.db.tables[self.table_name] if self._matches(row)]
+        for column, desc in reversed(self.ordering):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        total = len(rows)
+        end = None if self.limit_count is None else self.offset + self.limit_count
+        rows = rows[self.offset:end]
+        return _Response([self._project(r) for r in rows], total if self.count_mode else None)
+
+    def _rows(self) -> List[Dict]:
+        rows = [dict(r) for r in (self.payload if isinstance(self.payload, list) else [self.payload])]
+        if self.table_name in self.db.identity:
+            self.db._assign_ids(self.table_name, rows)
+        return rows
+
+    def _execute_insert(self) -> _Response:
+        rows = self._rows()
+        self.db._check_unique(self.table_name, rows)
+        self.db.tables[self.table_name].extend(rows)
+        self.db._index(self.table_name, rows)
+        return _Response(copy.deepcopy(rows))
+
+    def _execute_upsert(self) -> _Response:
+        table = self.db.tables[self.table_name]
+        key = tuple(self.on_conflict or self.db.unique_keys(self.table_name)[0])
+        if (self.table_name, key) not in self.db._unique_index:
+            self.db._unique_index[(self.table_name, key)] = {tuple(r.get(c) for c in key): r for r in table}
+        index = self.db._unique_index[(self.table_name, key)]
+        result = []
+        for row in self._rows():
+            existing = index.get(tuple(row.get(c) for c in key))
+            if existing is None:
+                self.db._check_unique(self.table_name, [row])
+                table.append(row)
+                self.db._index(self.table_name, [row])
+                index[tuple(row.get(c) for c in key)] = row
+                result.append(row)
+            else:
+                existing.update(row)
+                result.append(existing)
+        self.db._reindex(self.table_name)
+        return _Response(copy.deepcopy(result))
+
+    def _execute_update(self) -> _Response:
+        updated = []
+        for row in self.db.tables[self.table_name]:
+            if self._matches(row):
+                row.update(self.payload)
+                updated.append(row)
+        self.db._reindex(self.table_name)
+        return _Response(copy.deepcopy(updated))
+
+    def _execute_delete(self) -> _Response:
+        table = self.db.tables[self.table_name]
+        deleted = [row for row in table if self._matches(row)]
+        self.db.tables[self.table_name] = [row for row in table if not self._matches(row)]
+        self.db._reindex(self.table_name)
+        return _Response(deleted)
+
+
+def _increment_meal_log_aggregates(db: "LocalSupabase", params: Dict) -> List[Dict]:
+    table = db.tables["meal_log_aggregates"]
+    index = {(row["user_id"], row["bucket"]): row for row in table if row.get("user_id") == params["p_user_id"]}
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for delta in params["p_deltas"]:
+        row = index.get((params["p_user_id"], delta["bucket"]))
+        if row is None:
+            row = {"user_id": params["p_user_id"], "bucket": delta["bucket"], "entries": 0, "counts": {}}
+            table.append(row)
+        row["entries"] += delta["entries"]
+        counts = dict(row["counts"])
+        for item, count in delta["counts"].items():
+            counts[item] = counts.get(item, 0) + count
+        row["counts"] = counts
+        row["updated_at"] = now
+    db._reindex("meal_log_aggregates")
+    return []
+
+
+FUNCTIONS = {
+    "increment_meal_log_aggregates": _increment_meal_log_aggregates
+}
+
+
+class _RPC:
+    def __init__(self, db: "LocalSupabase", name: str, params: Dict):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self) -> _Response:
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            self.db.requests += 1
+            return _Response(FUNCTIONS[self.name](self.db, copy.deepcopy(self.params)))
+
+
+class LocalSupabase:
+    def __init__(self, latency: float = 0.0, unique: Optional[Dict[str, List[Sequence[str]]]] = None,
+                 identity: Sequence[str] = DEFAULT_IDENTITY):
+        self.latency = latency
+        self.unique = {**DEFAULT_UNIQUE, **(unique or {})}
+        self.identity = set(identity)
+        self._last_id = defaultdict(int)
+        self.tables = defaultdict(list)
+        self.lock = threading.RLock()
+        self.requests = 0
+        self._unique_index = {}
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict] = None) -> _RPC:
+        return _RPC(self, name, params or {})
+
+    def unique_keys(self, table: str) -> List[Sequence[str]]:
+        return self.unique.get(table) or [("id",)]
+
+    def _assign_ids(self, table: str, rows: Sequence[Dict]):
+        for row in rows:
+            if row.get("id") is None:
+                self._last_id[table] += 1
+                row["id"] = self._last_id[table]
+            else:
+                self._last_id[table] = max(self._last_id[table], row["id"])
+
+    def _index(self, table: str, rows: Iterable[Dict]):
+        for key in self.unique.get(table, []):
+            index = self._unique_index.setdefault((table, key), {})
+            index.update((tuple(row.get(c) for c in key), row) for row in rows)
+
+    def _reindex(self, table: str):
+        for index_table, key in list(self._unique_index):
+            if index_table == table:
+                del self._unique_index[(index_table, key)]
+        self._index(table, self.tables[table])
+
+    def _check_unique(self, table: str, rows: Sequence[Dict]):
+        for key in self.unique.get(table, []):
+            index = self._unique_index.get((table, key), {})
+            seen = set()
+            for row in rows:
+                value = tuple(row.get(c) for c in key)
+                if None in value:
+                    continue
+                if value in index or value in seen:
+                    raise APIError({
+                        "code": "23505",
+                        "message": f'duplicate key value violates unique constraint "{table}_{"_".join(key)}_key"',
+                        "details": f"Key ({', '.join(key)})=({', '.join(map(str, value))}) already exists.",
+                        "hint": None
+                    })
+                seen.add(value)
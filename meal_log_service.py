@@ -0,0 +1,209 @@
+import re
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from supabase import create_client
+from config import (
+    SUPABASE_URL,
+    SUPABASE_SERVICE_ROLE_KEY
+)
+from logging_service import LoggingService
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MEALS = ["breakfast", "lunch", "dinner", "snack", "snacks"]
+
+MEAL_LOG_FORMAT_HINT = (
+    "Please log your meals in the following format: Day + Meal ingredients. "
+    "For example: \"Monday breakfast: oats, banana, chia seeds\" (one meal per line)."
+)
+
+_ENTRY_PATTERN = re.compile(
+    r"^\s*(?P<day>" + "|".join(WEEKDAYS) + r"|mon|tue|wed|thu|fri|sat|sun|today|yesterday|day\s*\d+)\b"
+    r"\s*(?P<meal>" + "|".join(MEALS) + r")?\s*[:\-–]\s*(?P<ingredients>.+?)\s*$",
+    re.IGNORECASE
+)
+# "Sunday: which seeds are best for me?" is a question, not a meal
+_QUESTION = re.compile(
+    r"\?|^\s*(?:what|which|who|why|how|when|where|can|could|should|would|will|is|are|do|does|did|may|shall)\b",
+    re.IGNORECASE
+)
+# "Today: I feel bloated and tired" or "Monday - had cramps all day" is for the model, not the log
+_NOT_FOOD = re.compile(
+    r"\b(?:feel\w*|felt|tired|exhausted|bloat\w*|cramp\w*|nause\w*|pain\w*|ache\w*|headaches?|migraines?|mood\w*|"
+    r"energy|sleep\w*|slept|skip\w*|tips?|advice|help|period|symptoms?|sick|anxious|stress\w*|acne|spotting|bleeding)\b",
+    re.IGNORECASE
+)
+_FOOD_VERB = re.compile(r"^(?:i\s+)?(?:ate|eaten|eat|had|have\s+had|drank|drink|cooked|made)\s+", re.IGNORECASE)
+# Without a meal name ("Monday lunch: ...") a line is only a log if it names at least one food
+FOOD_WORDS = frozenset("""
+    almond apple avocado banana bean beef berry blueberry bread broccoli butter cabbage carrot cashew cauliflower
+    cereal cheese chia chicken chickpea chili chocolate coffee cookie corn couscous cracker cream cucumber curry date
+    dhal dal egg fig fish flax granola grape hummus juice kale kefir kiwi lamb leek lentil lettuce mango meat milk
+    miso muesli mushroom noodle nut oat oatmeal olive omelette onion orange pancake pasta pea peanut pear pepper pesto
+    pizza porridge pork potato prawn pumpkin quinoa raspberry rice salad salmon sandwich sardine seed sesame shrimp
+    smoothie soup soy spinach spelt stew strawberry sunflower sushi tahini tea toast tofu tomato tortilla tuna turkey
+    walnut wrap yogurt yoghurt zucchini
+""".split())
+_WORD = re.compile(r"[a-z]+")
+_INGREDIENT_SPLIT = re.compile(r"\s*(?:,|\+|;|\band\b|&)\s*", re.IGNORECASE)
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    return word[:-1] if word.endswith("s") and not word.endswith("ss") else word
+
+
+def _names_food(ingredients: List[str]) -> bool:
+    return any(_singular(word) in FOOD_WORDS for item in ingredients for word in _WORD.findall(item))
+
+
+def _resolve_day(day: str, today: date) -> date:
+    day = day.lower()
+    if day == "yesterday":
+        return today - timedelta(days=1)
+    if day == "today" or day.startswith("day"):
+        return today
+    weekday = next(i for i, name in enumerate(WEEKDAYS) if name.startswith(day[:3]))
+    # Most recent such weekday, today included
+    return today - timedelta(days=(today.weekday() - weekday) % 7)
+
+
+def parse_meal_log(text: str, today: Optional[date] = None) -> List[Dict]:
+    """Parse "Day + meal ingredients" lines. Returns [] if no line matches.
+
+    A line counts when it names a meal ("Monday lunch: ...") or at least one
+    known food; questions and lines about symptoms or feelings never do.
+    """
+    today = today or datetime.utcnow().date()
+    entries = []
+    for line in re.split(r"[\n;]+", text or ""):
+        match = _ENTRY_PATTERN.match(line)
+        if not match:
+            continue
+        text = match.group("ingredients")
+        if _QUESTION.search(text) or _NOT_FOOD.search(text):
+            continue
+        verb = _FOOD_VERB.match(text)
+        if verb:
+            text = text[verb.end():]
+        ingredients = [item.strip().lower() for item in _INGREDIENT_SPLIT.split(text) if item.strip()]
+        if not ingredients or not (match.group("meal") or _names_food(ingredients)):
+            continue
+        log_date = _resolve_day(match.group("day"), today)
+        meal = match.group("meal").lower() if match.group("meal") else "meal"
+        if meal == "snacks":
+            meal = "snack"
+        entries.append({
+            "day_label": match.group("day").strip().capitalize(),
+            "log_date": log_date.isoformat(),
+            "meal": meal,
+            "ingredients": ingredients
+        })
+    return entries
+
+
+def week_key(log_date: str) -> str:
+    year, week, _ = date.fromisoformat(log_date).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class MealAggregates:
+    """Per-phase and per-week ingredient counts, updated in O(new entries)."""
+
+    def __init__(self, buckets: Optional[Dict[str, Dict]] = None):
+        # bucket ("phase:Luteal" / "week:2025-W20") -> {"entries": int, "counts": Counter}
+        self.buckets = {
+            bucket: {"entries": data["entries"], "counts": Counter(data["counts"])}
+            for bucket, data in (buckets or {}).items()
+        }
+
+    @staticmethod
+    def buckets_for(entry: Dict) -> Tuple[str, str]:
+        return f"phase:{entry['phase']}", f"week:{week_key(entry['log_date'])}"
+
+    def add(self, entries: Iterable[Dict]) -> set:
+        touched = set()
+        for entry in entries:
+            for bucket in self.buckets_for(entry):
+                data = self.buckets.setdefault(bucket, {"entries": 0, "counts": Counter()})
+                data["entries"] += 1
+                data["counts"].update(entry["ingredients"])
+                touched.add(bucket)
+        return touched
+
+    def summary(self, phase: Optional[str], today: Optional[date] = None, top_n: int = 12) -> str:
+        """Compact text digest of the log, small enough to put in a prompt."""
+        today = today or datetime.utcnow().date()
+        this_week = week_key(today.isoformat())
+        last_week = week_key((today - timedelta(days=7)).isoformat())
+        sections = [
+            (f"phase:{phase}", f"During {phase} phases"),
+            (f"week:{this_week}", "This week"),
+            (f"week:{last_week}", "Last week")
+        ]
+        lines = []
+        for bucket, label in sections:
+            data = self.buckets.get(bucket)
+            if not data or not data["entries"]:
+                continue
+            top = ", ".join(f"{item} x{count}" for item, count in data["counts"].most_common(top_n))
+            lines.append(f"{label} ({data['entries']} meals): {top}")
+        return "\n".join(lines)
+
+
+class MealLogService:
+    def __init__(self, supabase=None):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.logger = LoggingService()
+
+    def log_meals(self, user_id: str, text: str, phase: str) -> Tuple[bool, List[Dict], str]:
+        entries = parse_meal_log(text)
+        if not entries:
+            return False, [], MEAL_LOG_FORMAT_HINT
+        try:
+            now = datetime.utcnow().isoformat()
+            rows = [{**entry, "user_id": user_id, "phase": phase, "week": week_key(entry["log_date"]), "created_at": now}
+                    for entry in entries]
+            self.supabase.table("meal_logs").insert(rows).execute()
+            self._update_aggregates(user_id, rows)
+            self.logger.log_db_event('meal_log_insert', 'meal_logs', True, {'entries': len(rows)})
+            return True, rows, f"Logged {len(rows)} meal{'s' if len(rows) != 1 else ''}."
+        except Exception as e:
+            self.logger.log_db_event('meal_log_insert', 'meal_logs', False, {'error': str(e)})
+            return False, [], f"Error logging meals: {str(e)}"
+
+    def _update_aggregates(self, user_id: str, rows: List[Dict]):
+        # Only the increments are sent; the database adds them in one statement,
+        # so concurrent sessions of the same user don't overwrite each other's counts
+        deltas = MealAggregates()
+        deltas.add(rows)
+        self.supabase.rpc("increment_meal_log_aggregates", {
+            "p_user_id": user_id,
+            "p_deltas": [
+                {"bucket": bucket, "entries": data["entries"], "counts": dict(data["counts"])}
+                for bucket, data in deltas.buckets.items()
+            ]
+        }).execute()
+
+    def _load_aggregates(self, user_id: str, buckets: Iterable[str]) -> MealAggregates:
+        response = self.supabase.table("meal_log_aggregates").select("bucket, entries, counts") \
+            .eq("user_id", user_id).in_("bucket", list(buckets)).execute()
+        return MealAggregates({row["bucket"]: row for row in response.data or []})
+
+    def get_summary(self, user_id: str, phase: Optional[str]) -> Tuple[bool, str, str]:
+        try:
+            today = datetime.utcnow().date()
+            buckets = [
+                f"phase:{phase}",
+                f"week:{week_key(today.isoformat())}",
+                f"week:{week_key((today - timedelta(days=7)).isoformat())}"
+            ]
+            summary = self._load_aggregates(user_id, buckets).summary(phase, today)
+            self.logger.log_db_event('meal_log_summary', 'meal_log_aggregates', True)
+            return True, summary, ""
+        except Exception as e:
+            self.logger.log_db_event('meal_log_summary', 'meal_log_aggregates', False, {'error': str(e)})
+            return False, "", f"Error retrieving meal log: {str(e)}"
@@ -0,0 +1,398 @@
+"""Structured meal plans, generated once and reused for follow-ups.
+
+A meal-plan request ("Give me a 3-day breakfast plan") asks the model for a
+JSON plan (days -> meals -> ingredients) that is validated against the
+models below and stored per user and profile. Follow-ups are then answered
+from the stored plan without another LLM call:
+
+- "shopping list": ingredients summed over the whole plan;
+- "swap day 2": the meal is replaced by one of the spare meals generated
+  with the plan;
+- "make it vegan": meals that break a dietary restriction are swapped for
+  compliant spares, or dropped when none fits;
+- "download": the plan as text and as a PDF (pdf_export).
+"""
+import hashlib
+import json
+import re
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from supabase import create_client
+
+from config import (
+    MEAL_PLAN_ALTERNATIVES,
+    MEAL_PLAN_DEFAULT_DAYS,
+    MEAL_PLAN_MAX_DAYS,
+    SUPABASE_URL,
+    SUPABASE_SERVICE_ROLE_KEY
+)
+from knowledge_base import DIET_EXCLUSIONS
+from logging_service import LoggingService
+
+PLAN_MEALS = ["breakfast", "lunch", "dinner", "snack"]
+INGREDIENT_TAGS = sorted(set().union(*DIET_EXCLUSIONS.values()))
+
+# Fallback tagging for ingredients the model left untagged (whole words, plurals included)
+_TAG_KEYWORDS = {
+    "meat": ["chicken", "beef", "pork", "lamb", "turkey", "bacon", "ham", "sausage", "mince"],
+    "fish": ["salmon", "tuna", "sardine", "mackerel", "cod", "shrimp", "prawn", "anchovy", "anchovies", "fish"],
+    "dairy": ["milk", "yogurt", "yoghurt", "cheese", "butter", "cream", "kefir", "feta", "ricotta", "skyr"],
+    "egg": ["egg"],
+    "honey": ["honey"],
+    "nuts": ["almond", "walnut", "cashew", "hazelnut", "pecan", "pistachio", "peanut", "macadamia", "nut"],
+    "gluten": ["wheat", "bread", "pasta", "barley", "rye", "spelt", "couscous", "flour", "toast", "seitan"]
+}
+_TAG_PATTERNS = {tag: re.compile(r"\b(?:" + "|".join(words) + r")(?:s|es)?\b") for tag, words in _TAG_KEYWORDS.items()}
+_PLANT_BASED = re.compile(r"\b(?:oat|almond|soy|coconut|rice|cashew|plant)[- ]?(?:milk|yogh?urt|cream|butter)\b|\bpeanut butter\b")
+
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "a": 1}
+_PLAN_REQUEST = re.compile(r"\b(?:meal[- ]?plan|(?:" + "|".join(PLAN_MEALS) + r"|menu)s?\s+plan|plan\s+(?:my|for)\s+(?:"
+                           + "|".join(PLAN_MEALS) + r"|meals))", re.IGNORECASE)
+_PLAN_DAYS = re.compile(r"\b(\d+|" + "|".join(_NUMBER_WORDS) + r")[- ]?days?\b|\b(week(?:ly)?)\b", re.IGNORECASE)
+# Follow-ups are imperatives about the plan and must match the whole message, so
+# questions that merely mention a diet, shopping or a day go to the model instead
+_POLITE = re.compile(r"^(?:please\s+|(?:can|could|would|will)\s+you\s+(?:please\s+)?)|\s+please$")
+_PLAN_REF = r"(?:it|(?:the|this|my)\s+(?:meal\s+)?plan)"
+_MEAL = "|".join(PLAN_MEALS)
+# "swap day 2 lunch", "replace the lunch on day 2" and "Day 2: swap breakfast" alike
+_SWAP = re.compile(
+    rf"(?:swap|replace|change)\s+(?:the\s+)?(?:(?P<meal>{_MEAL})\s+(?:on|of|for)\s+)?day\s*(?P<day>\d+)(?:'s)?"
+    rf"(?:\s+(?P<meal_after>{_MEAL}))?"
+    rf"|day\s*(?P<day_first>\d+)\s*[:,-]?\s*(?:swap|replace|change)(?:\s+(?:the\s+)?(?P<meal_first>{_MEAL}))?"
+)
+_GROCERY = re.compile(rf"(?:(?:give|show|send|get)\s+me\s+|show\s+|make\s+|create\s+)?(?:the\s+|a\s+|my\s+)?"
+                      rf"(?:shopping|grocery)\s+list(?:\s+(?:for|of)\s+{_PLAN_REF})?")
+_EXPORT = re.compile(rf"(?:download|export|print|save)(?:\s+{_PLAN_REF})?(?:\s+as\s+(?:an?\s+)?(?:pdf|text))?"
+                     rf"|(?:give\s+me\s+)?(?:an?\s+|the\s+)?pdf(?:\s+(?:of|for)\s+{_PLAN_REF})?")
+# "make the plan vegan", "make it gluten free and dairy free", "vegan version of the plan"
+_FILTER = re.compile(rf"(?:make|turn|adapt|change|filter)\s+{_PLAN_REF}\s+(?:(?:to\s+be|into)\s+)?(?:an?\s+)?(?P<diets>.+?)"
+                     rf"(?:\s+version)?|(?:give\s+me\s+)?(?:an?\s+)?(?P<diets_version>.+?)\s+version(?:\s+of\s+{_PLAN_REF})?")
+_DIET_LIST_SEPARATOR = re.compile(r"\s*(?:,|&|\band\b)\s*")
+# Phrases naming each dietary option in a follow-up
+_DIET_PHRASES = {
+    "Vegan": r"\bvegan\b",
+    "Vegetarian": r"\bvegetarian\b",
+    "Nut allergy": r"\bnut[- ]?(?:free|allergy)\b|\bwithout nuts\b|\bno nuts\b",
+    "Gluten free": r"\bgluten[- ]?free\b|\bwithout gluten\b|\bno gluten\b",
+    "Lactose intolerance": r"\b(?:lactose|dairy)[- ]?free\b|\bwithout (?:dairy|lactose)\b|\bno (?:dairy|lactose)\b"
+}
+
+
+class Ingredient(BaseModel):
+    name: str = Field(min_length=1)
+    quantity: Optional[float] = Field(default=None, ge=0)
+    unit: str = ""
+    contains: List[str] = Field(default_factory=list)
+
+    @field_validator("name", "unit")
+    @classmethod
+    def _normalise(cls, value: str) -> str:
+        return " ".join(value.lower().split())
+
+    @field_validator("contains")
+    @classmethod
+    def _known_tags(cls, tags: List[str]) -> List[str]:
+        return sorted({tag.lower() for tag in tags} & set(INGREDIENT_TAGS))
+
+    def tags(self) -> set:
+        tags = set(self.contains) | {tag for tag, pattern in _TAG_PATTERNS.items() if pattern.search(self.name)}
+        if _PLANT_BASED.search(self.name) and "dairy" not in self.contains:
+            tags.discard("dairy")
+        return tags
+
+
+class Meal(BaseModel):
+    meal: str
+    title: str = Field(min_length=1)
+    ingredients: List[Ingredient] = Field(min_length=1)
+    instructions: str = ""
+
+    @field_validator("meal")
+    @classmethod
+    def _meal_type(cls, value: str) -> str:
+        value = value.strip().lower()
+        value = next((meal for meal in PLAN_MEALS if value in (meal, f"{meal}s", f"{meal}es")), value)
+        if value not in PLAN_MEALS:
+            raise ValueError(f"meal must be one of {', '.join(PLAN_MEALS)}")
+        return value
+
+    def excluded_by(self, dietary_preferences) -> List[str]:
+        """The dietary options this meal breaks."""
+        tags = set().union(*(ingredient.tags() for ingredient in self.ingredients))
+        return [option for option in dietary_preferences or [] if tags & DIET_EXCLUSIONS.get(option, set())]
+
+
+class PlanDay(BaseModel):
+    day: int = Field(ge=1)
+    meals: List[Meal] = Field(default_factory=list)
+
+
+class MealPlan(BaseModel):
+    title: str = Field(min_length=1)
+    days: List[PlanDay] = Field(min_length=1, max_length=MEAL_PLAN_MAX_DAYS)
+    # Spare meals generated with the plan, used for swaps and diet filtering
+    alternatives: List[Meal] = Field(default_factory=list)
+
+
+class PlanRequest(NamedTuple):
+    days: int
+    meals: Tuple[str, ...]
+
+    @property
+    def key(self) -> str:
+        return f"{self.days}d:{'+'.join(self.meals)}"
+
+
+def parse_plan_request(text: str) -> Optional[PlanRequest]:
+    """The plan a message asks for, or None if it is not a meal-plan request."""
+    if not text or not _PLAN_REQUEST.search(text):
+        return None
+    days = MEAL_PLAN_DEFAULT_DAYS
+    match = _PLAN_DAYS.search(text)
+    if match:
+        count, week = match.groups()
+        days = 7 if week else int(_NUMBER_WORDS.get(count.lower(), count))
+    meals = tuple(meal for meal in PLAN_MEALS if re.search(rf"\b{meal}(?:s|es)?\b", text, re.IGNORECASE))
+    return PlanRequest(max(1, min(days, MEAL_PLAN_MAX_DAYS)), meals or ("breakfast", "lunch", "dinner"))
+
+
+def _diet_list(text: str) -> List[str]:
+    """The dietary options ``text`` consists of, or [] if any part of it is something else."""
+    diets = []
+    for part in filter(None, _DIET_LIST_SEPARATOR.split(text)):
+        option = next((option for option, phrase in _DIET_PHRASES.items()
+                       if re.fullmatch(f"(?:{phrase})", part)), None)
+        if option is None:
+            return []
+        diets.append(option)
+    return diets
+
+
+def parse_plan_followup(text: str) -> Optional[Tuple[str, Dict]]:
+    """A follow-up on the current plan: ("grocery" | "swap" | "filter" | "export", arguments).
+
+    Only whole-message requests count ("swap day 2 lunch", "make the plan
+    vegan", "can you give me the shopping list?"); anything else, questions
+    in particular, is None and answered by the model.
+    """
+    text = " ".join((text or "").lower().split()).rstrip(".!")
+    polite = _POLITE.search(text)
+    text = _POLITE.sub("", text)
+    if text.endswith("?"):
+        if not polite:
+            return None
+        text = text.rstrip("?").rstrip()
+    if not text:
+        return None
+    swap = _SWAP.fullmatch(text)
+    if swap:
+        day = swap.group("day") or swap.group("day_first")
+        meal = swap.group("meal") or swap.group("meal_after") or swap.group("meal_first")
+        return "swap", {"day": int(day), "meal": meal}
+    if _GROCERY.fullmatch(text):
+        return "grocery", {}
+    if _EXPORT.fullmatch(text):
+        return "export", {}
+    filtered = _FILTER.fullmatch(text)
+    if filtered:
+        diets = _diet_list(filtered.group("diets") or filtered.group("diets_version"))
+        if diets:
+            return "filter", {"dietary_preferences": diets}
+    return None
+
+
+def parse_meal_plan(text: str) -> Optional[MealPlan]:
+    """The plan in a model answer (bare JSON or inside a code fence), or None if it does not validate."""
+    start, end = (text or "").find("{"), (text or "").rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        return MealPlan.model_validate_json(text[start:end + 1])
+    except (ValidationError, ValueError):
+        return None
+
+
+def profile_key(phase: Optional[str], goal: Optional[str], dietary_preferences) -> str:
+    profile = json.dumps([phase, goal, sorted(dietary_preferences or [])])
+    return hashlib.blake2b(profile.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def grocery_list(plan: MealPlan) -> List[Dict]:
+    """Ingredients summed over the plan, per name and unit, in first-use order."""
+    items = OrderedDict()
+    for day in plan.days:
+        for meal in day.meals:
+            for ingredient in meal.ingredients:
+                item = items.setdefault((ingredient.name, ingredient.unit),
+                                        {"name": ingredient.name, "unit": ingredient.unit, "quantity": 0.0, "meals": 0})
+                item["meals"] += 1
+                if item["quantity"] is not None and ingredient.quantity is not None:
+                    item["quantity"] += ingredient.quantity
+                else:
+                    item["quantity"] = None  # at least one use without an amount
+    return list(items.values())
+
+
+def format_grocery_list(items: List[Dict]) -> str:
+    lines = ["**Shopping list**"]
+    for item in items:
+        if item["quantity"]:
+            amount = f"{item['quantity']:g} {item['unit']}".strip()
+        else:
+            amount = f"for {item['meals']} meal{'s' if item['meals'] != 1 else ''}"
+        lines.append(f"- {item['name']}: {amount}")
+    return "\n".join(lines)
+
+
+def _used_titles(plan: MealPlan) -> set:
+    return {meal.title for day in plan.days for meal in day.meals}
+
+
+def _take_alternative(plan: MealPlan, meal_type: str, dietary_preferences) -> Optional[Meal]:
+    used = _used_titles(plan)
+    for i, alternative in enumerate(plan.alternatives):
+        if alternative.meal == meal_type and alternative.title not in used \
+                and not alternative.excluded_by(dietary_preferences):
+            return plan.alternatives.pop(i)
+    return None
+
+
+def swap_meal(plan: MealPlan, day: int, meal_type: Optional[str] = None,
+              dietary_preferences=None) -> Tuple[MealPlan, Optional[Meal], Optional[Meal]]:
+    """A copy of ``plan`` with one meal of ``day`` replaced by a spare; returns (plan, old, new)."""
+    plan = plan.model_copy(deep=True)
+    target = next((d for d in plan.days if d.day == day), None)
+    if target is None:
+        return plan, None, None
+    for index, meal in enumerate(target.meals):
+        if meal_type is not None and meal.meal != meal_type:
+            continue
+        replacement = _take_alternative(plan, meal.meal, dietary_preferences)
+        if replacement is not None:
+            target.meals[index] = replacement
+            plan.alternatives.append(meal)  # so the swap can be undone
+            return plan, meal, replacement
+    return plan, None, None
+
+
+def filter_plan(plan: MealPlan, dietary_preferences) -> Tuple[MealPlan, List[str], List[str]]:
+    """A copy of ``plan`` that keeps to ``dietary_preferences``; returns (plan, swapped titles, dropped titles)."""
+    plan = plan.model_copy(deep=True)
+    swapped, dropped = [], []
+    for day in plan.days:
+        kept = []
+        for meal in day.meals:
+            if not meal.excluded_by(dietary_preferences):
+                kept.append(meal)
+                continue
+            replacement = _take_alternative(plan, meal.meal, dietary_preferences)
+            if replacement is not None:
+                kept.append(replacement)
+                swapped.append(meal.title)
+            else:
+                dropped.append(meal.title)
+        day.meals = kept
+    plan.alternatives = [meal for meal in plan.alternatives if not meal.excluded_by(dietary_preferences)]
+    return plan, swapped, dropped
+
+
+def plan_to_text(plan: MealPlan, with_grocery_list: bool = True) -> str:
+    """Readable plan for the chat, the text download and the PDF (numbered day headers)."""
+    lines = [plan.title, ""]
+    for day in plan.days:
+        lines.append(f"{day.day}. Day {day.day}")
+        if not day.meals:
+            lines.append("- No meal fits your dietary preferences; ask me for a new plan.")
+        for meal in day.meals:
+            ingredients = ", ".join(
+                f"{ingredient.quantity:g} {ingredient.unit} {ingredient.name}".replace("  ", " ")
+                if ingredient.quantity else ingredient.name
+                for ingredient in meal.ingredients
+            )
+            lines.append(f"- {meal.meal.capitalize()}: {meal.title} ({ingredients})")
+            if meal.instructions:
+                lines.append(f"  {meal.instructions}")
+        lines.append("")
+    if with_grocery_list:
+        lines.append(format_grocery_list(grocery_list(plan)))
+    return "\n".join(lines).strip()
+
+
+def plan_chain_inputs(request: PlanRequest, phase, goal, dietary_preferences, context: str) -> Dict:
+    return {
+        "phase": phase,
+        "goal": goal,
+        "diet": ", ".join(dietary_preferences or []) or "none",
+        "context": context or "None",
+        "days": request.days,
+        "meals": ", ".join(request.meals),
+        "tags": ", ".join(INGREDIENT_TAGS),
+        "alternatives": MEAL_PLAN_ALTERNATIVES
+    }
+
+
+class MealPlanService:
+    def __init__(self, supabase=None):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.logger = LoggingService()
+
+    def get_plan(self, user_id: str, profile: str, request: PlanRequest) -> Tuple[bool, Optional[Dict], str]:
+        """The stored plan for this user, profile and request, if there is one."""
+        try:
+            response = self.supabase.table("meal_plans").select("*").eq("user_id", user_id) \
+                .eq("profile_key", profile).eq("request_key", request.key).execute()
+            self.logger.log_db_event('meal_plan_get', 'meal_plans', True, {'found': bool(response.data)})
+            return True, response.data[0] if response.data else None, "Meal plan retrieved"
+        except Exception as e:
+            self.logger.log_db_event('meal_plan_get', 'meal_plans', False, {'error': str(e)})
+            return False, None, f"Error retrieving meal plan: {str(e)}"
+
+    def get_plan_by_id(self, user_id: str, plan_id: str) -> Tuple[bool, Optional[Dict], str]:
+        try:
+            response = self.supabase.table("meal_plans").select("*").eq("user_id", user_id).eq("id", plan_id).execute()
+            self.logger.log_db_event('meal_plan_get', 'meal_plans', True, {'found': bool(response.data)})
+            if not response.data:
+                return False, None, "Meal plan not found"
+            return True, response.data[0], "Meal plan retrieved"
+        except Exception as e:
+            self.logger.log_db_event('meal_plan_get', 'meal_plans', False, {'error': str(e)})
+            return False, None, f"Error retrieving meal plan: {str(e)}"
+
+    def save_plan(self, user_id: str, profile: str, request: PlanRequest, plan: MealPlan,
+                  phase: Optional[str] = None) -> Tuple[bool, Optional[Dict], str]:
+        """Store a newly generated plan, replacing any earlier one for the same profile and request."""
+        try:
+            now = datetime.utcnow().isoformat()
+            row = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "profile_key": profile,
+                "request_key": request.key,
+                "phase": phase,
+                "plan": plan.model_dump(),
+                "created_at": now,
+                "updated_at": now
+            }
+            response = self.supabase.table("meal_plans").upsert(row, on_conflict="user_id,profile_key,request_key").execute()
+            self.logger.log_db_event('meal_plan_save', 'meal_plans', True, {'days': len(plan.days)})
+            return True, response.data[0] if response.data else row, "Meal plan saved"
+        except Exception as e:
+            self.logger.log_db_event('meal_plan_save', 'meal_plans', False, {'error': str(e)})
+            return False, None, f"Error saving meal plan: {str(e)}"
+
+    def update_plan(self, user_id: str, plan_id: str, plan: MealPlan) -> Tuple[bool, str]:
+        """Store the result of a swap or diet filter."""
+        try:
+            self.supabase.table("meal_plans").update({
+                "plan": plan.model_dump(),
+                "updated_at": datetime.utcnow().isoformat()
+            }).eq("user_id", user_id).eq("id", plan_id).execute()
+            self.logger.log_db_event('meal_plan_update', 'meal_plans', True)
+            return True, "Meal plan updated"
+        except Exception as e:
+            self.logger.log_db_event('meal_plan_update', 'meal_plans', False, {'error': str(e)})
+            return False, f"Error updating meal plan: {str(e)}"
@@ -0,0 +1,412 @@
+"""Notify users when they move into a new cycle phase.
+
+Each user's next transition is computed from their last period and cycle
+length and kept in a min-heap, so the scheduler sleeps until the earliest
+one is due instead of polling every user. Changing a user's cycle data
+pushes a new entry; the superseded one is recognised and dropped when it
+reaches the top of the heap.
+
+The queue is snapshotted to PHASE_SCHEDULER_STATE_PATH and reloaded on
+start, so transitions that came due while the process was down are still
+announced (within PHASE_TRANSITION_GRACE). Cycle edits made by other
+processes, new users and deleted accounts are picked up by re-reading
+profiles changed since the last sync (by ``updated_at``) every
+PHASE_SCHEDULER_SYNC_INTERVAL and scanning for deleted profiles every
+PHASE_SCHEDULER_RECONCILE_INTERVAL. Exactly one process per
+deployment may run it, or users get every email once per process: either
+set PHASE_SCHEDULER_ENABLED=true for a single app process, or leave it off
+(the default) everywhere and run it on its own:
+
+    python phase_scheduler.py
+"""
+import argparse
+import atexit
+import heapq
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from config import (
+    PHASE_SCHEDULER_CLOCK_SKEW,
+    PHASE_SCHEDULER_RECONCILE_INTERVAL,
+    PHASE_SCHEDULER_SNAPSHOT_INTERVAL,
+    PHASE_SCHEDULER_SYNC_INTERVAL,
+    PHASE_SCHEDULER_STATE_PATH,
+    PHASE_TRANSITION_GRACE,
+    PHASE_TRANSITION_HOUR
+)
+from cycle import DEFAULT_CYCLE_LENGTH, detect_phase, next_transition
+from logging_service import LoggingService
+
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+class PhaseTransition(NamedTuple):
+    user_id: str
+    phase: str
+    due: float  # epoch seconds
+
+
+def _as_ordinal(value) -> int:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.toordinal()
+
+
+class PhaseTransitionScheduler:
+    def __init__(self, state_path: Optional[str] = PHASE_SCHEDULER_STATE_PATH,
+                 hour: int = PHASE_TRANSITION_HOUR, grace: float = PHASE_TRANSITION_GRACE,
+                 clock: Callable[[], float] = time.time):
+        self.state_path = state_path
+        self.hour = hour
+        self.grace = grace
+        self.clock = clock
+        self._heap = []  # (due, user_id); stale when it no longer matches _due
+        self._due: Dict[str, float] = {}
+        self._cycles: Dict[str, tuple] = {}  # user_id -> (last period ordinal, cycle length)
+        self._listeners: List[Callable[[List[PhaseTransition]], None]] = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+        self._supabase = None
+        self._synced_until: Optional[str] = None  # updated_at watermark of the last sync
+        self._next_sync = self._next_reconcile = 0.0  # monotonic
+        self.metrics = {"scheduled": 0, "fired": 0, "missed": 0, "listener_errors": 0, "synced": 0, "dropped": 0}
+        self.logger = LoggingService()
+
+    def add_listener(self, listener: Callable[[List[PhaseTransition]], None]):
+        """``listener`` gets each batch of transitions that came due together."""
+        self._listeners.append(listener)
+
+    def _due_at(self, day: int) -> float:
+        return (day - _EPOCH) * 86400.0 + self.hour * 3600
+
+    def _next(self, user_id: str, now: float) -> float:
+        last_period, cycle_length = self._cycles[user_id]
+        # The latest announcement day whose announcement time is not after now
+        today = int((now - self.hour * 3600) // 86400) + _EPOCH
+        day, _ = next_transition(today, last_period, cycle_length)
+        return self._due_at(day)
+
+    def _push(self, user_id: str, due: float):
+        self._due[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+        # Superseded entries are skipped lazily; rebuild once they dominate the heap
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(d, u) for u, d in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def schedule(self, user_id: str, last_period, cycle_length: Optional[int] = None) -> Optional[float]:
+        """(Re)schedule a user from their cycle data; returns the next due time."""
+        if last_period is None:
+            self.unschedule(user_id)
+            return None
+        with self._cond:
+            self._cycles[user_id] = (_as_ordinal(last_period), int(cycle_length or DEFAULT_CYCLE_LENGTH))
+            due = self._next(user_id, self.clock())
+            head = self._heap[0][0] if self._heap else None
+            self._push(user_id, due)
+            self.metrics["scheduled"] += 1
+            self._dirty = True
+            if head is None or due < head:
+                self._cond.notify()
+        return due
+
+    def unschedule(self, user_id: str):
+        with self._cond:
+            if self._cycles.pop(user_id, None) is not None:
+                del self._due[user_id]
+                self._dirty = True
+
+    def next_due(self, user_id: str) -> Optional[float]:
+        with self._cond:
+            return self._due.get(user_id)
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def _peek(self) -> Optional[float]:
+        while self._heap:
+            due, user_id = self._heap[0]
+            if self._due.get(user_id) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def run_due(self, now: Optional[float] = None, batch_size: int = 10000) -> List[PhaseTransition]:
+        """Fire every transition due by ``now`` and schedule each user's next one.
+
+        Works through the heap ``batch_size`` users at a time so that
+        ``schedule`` calls are not blocked for the whole burst.
+        """
+        now = self.clock() if now is None else now
+        fired = []
+        while True:
+            batch = []
+            with self._cond:
+                while len(batch) < batch_size and self._peek() is not None and self._heap[0][0] <= now:
+                    due, user_id = heapq.heappop(self._heap)
+                    if now - due <= self.grace:
+                        last_period, cycle_length = self._cycles[user_id]
+                        day = int(due // 86400) + _EPOCH
+                        batch.append(PhaseTransition(user_id, detect_phase((day - last_period) % cycle_length), due))
+                    else:
+                        self.metrics["missed"] += 1
+                    self._push(user_id, self._next(user_id, now))
+                    self._dirty = True
+                self.metrics["fired"] += len(batch)
+                more = self._peek() is not None and self._heap[0][0] <= now
+            if batch:
+                self._notify(batch)
+                fired.extend(batch)
+            if not more:
+                return fired
+
+    def _notify(self, batch: List[PhaseTransition]):
+        for listener in self._listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                self.metrics["listener_errors"] += 1
+                self.logger.log_app_event('phase_transition_listener_error', {'error': str(e)}, level='ERROR')
+
+    def get_metrics(self) -> Dict:
+        with self._cond:
+            head = self._peek()
+            return {
+                **self.metrics,
+                "users": len(self._due),
+                "heap_entries": len(self._heap),
+                "next_due": datetime.utcfromtimestamp(head).isoformat() if head is not None else None
+            }
+
+    def save(self, path: Optional[str] = None):
+        """Write the queue atomically as ``user_id<TAB>last period<TAB>cycle length<TAB>due`` lines."""
+        path = path or self.state_path
+        with self._cond:
+            rows = [(user_id, cycle, self._due[user_id]) for user_id, cycle in self._cycles.items()]
+            self._dirty = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{user_id}\t{last_period}\t{cycle_length}\t{due:.0f}\n"
+                         for user_id, (last_period, cycle_length), due in rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._last_snapshot = time.monotonic()
+
+    def load(self, path: Optional[str] = None) -> int:
+        """Restore a snapshot, keeping saved due times so overdue transitions still fire."""
+        path = path or self.state_path
+        if not path or not os.path.exists(path):
+            return 0
+        cycles, dues = {}, {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                user_id, last_period, cycle_length, due = line.rstrip("\n").split("\t")
+                cycles[user_id] = (int(last_period), int(cycle_length))
+                dues[user_id] = float(due)
+        with self._cond:
+            self._cycles, self._due = cycles, dues
+            self._heap = [(due, user_id) for user_id, due in dues.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        return len(dues)
+
+    def bootstrap(self, supabase, page_size: int = 1000) -> int:
+        """Schedule every profile with cycle data, paging by user id."""
+        count, last_id = 0, ""
+        while True:
+            rows = supabase.table("profiles").select("user_id, last_period, cycle_length") \
+                .gt("user_id", last_id).order("user_id").limit(page_size).execute().data
+            if not rows:
+                return count
+            last_id = rows[-1]["user_id"]
+            for row in rows:
+                if row.get("last_period"):
+                    self.schedule(row["user_id"], row["last_period"], row.get("cycle_length"))
+                    count += 1
+
+    def sync(self, supabase, since: Optional[str], page_size: int = 1000) -> int:
+        """Reschedule profiles updated at or after ``since`` (an ISO timestamp, None for all); returns how many changed."""
+        changed, offset = 0, 0
+        while True:
+            query = supabase.table("profiles").select("user_id, last_period, cycle_length, updated_at")
+            if since is not None:
+                query = query.gte("updated_at", since)
+            rows = query.order("updated_at").order("user_id").range(offset, offset + page_size - 1).execute().data
+            for row in rows or []:
+                user_id = row["user_id"]
+                if not row.get("last_period"):
+                    if user_id in self._cycles:
+                        self.unschedule(user_id)
+                        changed += 1
+                    continue
+                cycle = (_as_ordinal(row["last_period"]), int(row.get("cycle_length") or DEFAULT_CYCLE_LENGTH))
+                # Overlapping windows re-read rows; only real changes are rescheduled
+                if self._cycles.get(user_id) != cycle:
+                    self.schedule(user_id, row["last_period"], row.get("cycle_length"))
+                    changed += 1
+            if not rows or len(rows) < page_size:
+                break
+            offset += page_size
+        self.metrics["synced"] += changed
+        return changed
+
+    def reconcile(self, supabase, page_size: int = 1000) -> int:
+        """Unschedule users whose profile no longer exists (deleted accounts); returns how many."""
+        existing, last_id = set(), ""
+        while True:
+            rows = supabase.table("profiles").select("user_id") \
+                .gt("user_id", last_id).order("user_id").limit(page_size).execute().data
+            if not rows:
+                break
+            existing.update(row["user_id"] for row in rows)
+            last_id = rows[-1]["user_id"]
+        with self._cond:
+            gone = [user_id for user_id in self._cycles if user_id not in existing]
+        for user_id in gone:
+            self.unschedule(user_id)
+        self.metrics["dropped"] += len(gone)
+        return len(gone)
+
+    def _refresh(self, now: float):
+        """Apply profile changes made by other processes since the last sync, if one is due."""
+        if self._supabase is None or now < self._next_sync:
+            return
+        started = datetime.utcnow()
+        try:
+            changed = self.sync(self._supabase, self._synced_until)
+            if now >= self._next_reconcile:
+                self.reconcile(self._supabase)
+                self._next_reconcile = now + PHASE_SCHEDULER_RECONCILE_INTERVAL
+            self._synced_until = (started - timedelta(seconds=PHASE_SCHEDULER_CLOCK_SKEW)).isoformat()
+            if changed:
+                self.logger.log_app_event('phase_scheduler_sync', {'changed': changed})
+        except Exception as e:
+            self.logger.log_app_event('phase_scheduler_sync', {'error': str(e)}, level='ERROR')
+        self._next_sync = now + PHASE_SCHEDULER_SYNC_INTERVAL
+
+    def start(self, supabase=None) -> "PhaseTransitionScheduler":
+        """Restore the snapshot (or bootstrap from ``supabase``) and fire transitions as they come due.
+
+        With ``supabase``, profiles changed since the snapshot was written (or
+        since the bootstrap) are re-read now and then every sync interval.
+        """
+        def run():
+            if supabase is not None:
+                snapshot_at = os.path.getmtime(self.state_path) if self.state_path and os.path.exists(self.state_path) \
+                    else None
+                if self.load():
+                    self._synced_until = (datetime.utcfromtimestamp(snapshot_at)
+                                          - timedelta(seconds=PHASE_SCHEDULER_CLOCK_SKEW)).isoformat()
+                else:
+                    started = datetime.utcnow()
+                    self.logger.log_app_event('phase_scheduler_bootstrap', {'users': self.bootstrap(supabase)})
+                    self._synced_until = (started - timedelta(seconds=PHASE_SCHEDULER_CLOCK_SKEW)).isoformat()
+                self._supabase = supabase
+            else:
+                self.load()
+            self._loop()
+
+        self._thread = threading.Thread(target=run, name="phase-scheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._dirty and self.state_path:
+            self.save()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                head = self._peek()
+                wait = PHASE_SCHEDULER_SNAPSHOT_INTERVAL
+                if self._supabase is not None:
+                    wait = min(wait, max(0.0, self._next_sync - time.monotonic()))
+                if head is not None:
+                    wait = min(wait, max(0.0, head - self.clock()))
+                if wait > 0:
+                    self._cond.wait(wait)
+                if self._stopped:
+                    return
+            self._refresh(time.monotonic())
+            self.run_due()
+            if self._dirty and self.state_path and \
+                    time.monotonic() - self._last_snapshot >= PHASE_SCHEDULER_SNAPSHOT_INTERVAL:
+                self.save()
+
+
+class PhaseTransitionNotifier:
+    """Scheduler listener: stores an in-app notice and emails verified users."""
+
+    def __init__(self, supabase, email_service=None, email_dispatcher=None, chunk_size: int = 500):
+        self.supabase = supabase
+        self.email_service = email_service
+        self.email_dispatcher = email_dispatcher
+        self.chunk_size = chunk_size
+        self.logger = LoggingService()
+
+    def __call__(self, transitions: List[PhaseTransition]):
+        now = datetime.utcnow().isoformat()
+        for start in range(0, len(transitions), self.chunk_size):
+            chunk = transitions[start:start + self.chunk_size]
+            self.supabase.table("notifications").insert([
+                {"user_id": t.user_id, "kind": "phase_transition", "phase": t.phase, "read": False, "created_at": now}
+                for t in chunk
+            ]).execute()
+            if self.email_dispatcher is None:
+                continue
+            phases = {t.user_id: t.phase for t in chunk}
+            users = self.supabase.table("users").select("id, email, email_verified") \
+                .in_("id", list(phases)).execute().data
+            for user in users:
+                if user.get("email_verified"):
+                    self.email_dispatcher.submit('phase_transition', user["email"],
+                                                 self._email_job(user["email"], phases[user["id"]]))
+        self.logger.log_app_event('phase_transitions_notified', {'count': len(transitions)})
+
+    def _email_job(self, email: str, phase: str):
+        return lambda: self.email_service.send_phase_transition_email(email, phase)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the phase-transition scheduler as its own process.")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the snapshot and reschedule from profiles")
+    args = parser.parse_args(argv)
+
+    from supabase import create_client
+    from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+    from email_dispatcher import EmailDispatcher
+    from email_service import EmailService
+
+    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    scheduler = PhaseTransitionScheduler()
+    if args.rebuild:
+        print(f"Scheduled {scheduler.bootstrap(supabase)} users")
+        scheduler.save()
+    scheduler.add_listener(PhaseTransitionNotifier(supabase, EmailService(), EmailDispatcher()))
+    scheduler.start(supabase)
+    try:
+        while True:
+            time.sleep(60)
+            print(scheduler.get_metrics(), flush=True)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
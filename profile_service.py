@@ -1,21 +1,30 @@
 import json
-from datetime import datetime
+from datetime import date, datetime
 from typing import Dict, List, Optional, Tuple
 from supabase import create_client
+from postgrest.exceptions import APIError
 from config import (
     SUPABASE_URL,
     SUPABASE_SERVICE_ROLE_KEY,
     SUPPORT_OPTIONS,
     DIETARY_OPTIONS,
     CYCLE_PHASES,
+    MIN_CYCLE_LENGTH,
+    MAX_CYCLE_LENGTH,
     ERROR_MESSAGES,
     SUCCESS_MESSAGES
 )
+from auth_service import UNIQUE_VIOLATION
+from cycle import CycleStats
 from logging_service import LoggingService
+from session_cache import session_cache
 
 class ProfileService:
-    def __init__(self):
-        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    def __init__(self, supabase=None, phase_scheduler=None, chat_search=None, write_buffer=None):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.phase_scheduler = phase_scheduler
+        self.chat_search = chat_search
+        self.write_buffer = write_buffer
         self.logger = LoggingService()
 
     def get_profile(self, user_id: str) -> Tuple[bool, Dict, str]:
@@ -33,15 +42,27 @@ class ProfileService:
             self.logger.log_db_event('profile_get', 'profiles', False, {'error': str(e)})
             return False, {}, f"Error retrieving profile: {str(e)}"
 
+    @staticmethod
+    def _invalid_update(updates: Dict) -> Optional[str]:
+        if 'phase' in updates and updates['phase'] not in CYCLE_PHASES:
+            return "Invalid cycle phase"
+        if 'goal' in updates and updates['goal'] not in SUPPORT_OPTIONS:
+            return "Invalid support goal"
+        if 'diet' in updates and not all(diet in DIETARY_OPTIONS for diet in updates['diet']):
+            return "Invalid dietary preference"
+        if 'cycle_length' in updates and updates['cycle_length'] is not None \
+                and not MIN_CYCLE_LENGTH <= updates['cycle_length'] <= MAX_CYCLE_LENGTH:
+            return "Invalid cycle length"
+        return None
+
     def update_profile(self, user_id: str, updates: Dict) -> Tuple[bool, str]:
         try:
             # Validate updates
-            if 'phase' in updates and updates['phase'] not in CYCLE_PHASES:
-                return False, "Invalid cycle phase"
-            if 'goal' in updates and updates['goal'] not in SUPPORT_OPTIONS:
-                return False, "Invalid support goal"
-            if 'diet' in updates and not all(diet in DIETARY_OPTIONS for diet in updates['diet']):
-                return False, "Invalid dietary preference"
+            error = self._invalid_update(updates)
+            if error:
+                return False, error
+            if isinstance(updates.get('last_period'), date):
+                updates['last_period'] = updates['last_period'].isoformat()
 
             # Add updated_at timestamp
             updates['updated_at'] = datetime.utcnow().isoformat()
@@ -51,6 +72,10 @@ class ProfileService:
                 self.logger.log_db_event('profile_update', 'profiles', False, {'error': 'update_failed'})
                 return False, "Failed to update profile"
 
+            if self.phase_scheduler is not None and ('last_period' in updates or 'cycle_length' in updates):
+                profile = response.data[0]
+                self.phase_scheduler.schedule(user_id, profile.get('last_period'), profile.get('cycle_length'))
+
             self.logger.log_db_event('profile_update', 'profiles', True)
             return True, "Profile updated successfully"
 
@@ -58,8 +83,131 @@ class ProfileService:
             self.logger.log_db_event('profile_update', 'profiles', False, {'error': str(e)})
             return False, f"Error updating profile: {str(e)}"
 
+    def queue_personalization(self, user_id: str, updates: Dict) -> Tuple[bool, str]:
+        """Save phase, goal and diet without waiting for the database.
+
+        The write buffer merges repeated changes and upserts them in batches.
+        Period data changes reminders, so it goes through ``update_profile``.
+        """
+        if self.write_buffer is None:
+            return self.update_profile(user_id, updates)
+        if not set(updates) <= {'phase', 'goal', 'diet'}:
+            return False, "Only phase, goal and diet can be queued"
+        error = self._invalid_update(updates)
+        if error:
+            return False, error
+        self.write_buffer.update("profiles", user_id, {**updates, 'updated_at': datetime.utcnow().isoformat()})
+        return True, "Profile update queued"
+
+    def record_period(self, user_id: str, period_start) -> Tuple[bool, Optional[CycleStats], str]:
+        """Append a period start to the user's history and fold it into their cycle statistics."""
+        if isinstance(period_start, str):
+            period_start = date.fromisoformat(period_start[:10])
+        if period_start > datetime.utcnow().date():
+            return False, None, "Period start can't be in the future"
+        try:
+            try:
+                self.supabase.table("period_history").insert({
+                    "user_id": user_id,
+                    "period_start": period_start.isoformat(),
+                    "created_at": datetime.utcnow().isoformat()
+                }).execute()
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    raise
+                _, stats, _ = self.get_cycle_stats(user_id)
+                # Already folded in, unless an earlier attempt failed between the two writes
+                if stats.last_period is not None and period_start <= stats.last_period:
+                    return True, stats, "Period already logged"
+
+            # Optimistic concurrency: retry if another writer bumped the version first
+            for _ in range(5):
+                response = self.supabase.table("cycle_stats").select("*").eq("user_id", user_id).execute()
+                row = response.data[0] if response.data else None
+                stats = CycleStats.from_row(row)
+                previous_last_period = stats.last_period
+                if not stats.add(period_start):
+                    # An earlier date filled in after later ones; rebuild from the history once
+                    stats = self._rebuild_cycle_stats(user_id, stats.version)
+                if self._save_cycle_stats(user_id, stats, row is not None):
+                    break
+            else:
+                raise RuntimeError("cycle statistics kept changing concurrently")
+
+            if stats.last_period != previous_last_period:
+                self.update_profile(user_id, {"last_period": stats.last_period, "cycle_length": stats.cycle_length})
+            self.logger.log_db_event('period_record', 'period_history', True)
+            return True, stats, "Period logged"
+
+        except Exception as e:
+            self.logger.log_db_event('period_record', 'period_history', False, {'error': str(e)})
+            return False, None, f"Error logging period: {str(e)}"
+
+    def _rebuild_cycle_stats(self, user_id: str, version: int) -> CycleStats:
+        response = self.supabase.table("period_history").select("period_start").eq("user_id", user_id) \
+            .order("period_start").execute()
+        stats = CycleStats(version=version)
+        for row in response.data:
+            stats.add(date.fromisoformat(row["period_start"][:10]))
+        return stats
+
+    def _save_cycle_stats(self, user_id: str, stats: CycleStats, exists: bool) -> bool:
+        expected = stats.version
+        stats.version += 1
+        row = {**stats.to_row(), "user_id": user_id, "updated_at": datetime.utcnow().isoformat()}
+        if not exists:
+            try:
+                self.supabase.table("cycle_stats").insert(row).execute()
+                return True
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    raise
+                return False
+        response = self.supabase.table("cycle_stats").update(row).eq("user_id", user_id) \
+            .eq("version", expected).execute()
+        return bool(response.data)
+
+    def get_cycle_stats(self, user_id: str) -> Tuple[bool, CycleStats, str]:
+        try:
+            response = self.supabase.table("cycle_stats").select("*").eq("user_id", user_id).execute()
+            self.logger.log_db_event('cycle_stats_get', 'cycle_stats', True)
+            return True, CycleStats.from_row(response.data[0] if response.data else None), "Cycle statistics retrieved"
+
+        except Exception as e:
+            self.logger.log_db_event('cycle_stats_get', 'cycle_stats', False, {'error': str(e)})
+            return False, CycleStats(), f"Error retrieving cycle statistics: {str(e)}"
+
+    def predict_phase(self, user_id: str, day: Optional[date] = None) -> Tuple[bool, Optional[str], str]:
+        success, stats, msg = self.get_cycle_stats(user_id)
+        if not success:
+            return False, None, msg
+        phase = stats.phase_on(day or datetime.utcnow().date())
+        if phase is None:
+            return False, None, "No periods logged yet"
+        return True, phase, "Phase predicted from your cycle history"
+
+    def pop_notifications(self, user_id: str) -> Tuple[bool, List, str]:
+        """Unread in-app notices for the user, marked read as they are returned."""
+        try:
+            response = self.supabase.table("notifications").select("*").eq("user_id", user_id) \
+                .eq("read", False).order("created_at").execute()
+            if response.data:
+                # Only the rows returned here: notices inserted since then stay unread for next time
+                self.supabase.table("notifications").update({"read": True}) \
+                    .in_("id", [row["id"] for row in response.data]).execute()
+            self.logger.log_db_event('notifications_get', 'notifications', True)
+            return True, response.data, "Notifications retrieved successfully"
+
+        except Exception as e:
+            self.logger.log_db_event('notifications_get', 'notifications', False, {'error': str(e)})
+            return False, [], f"Error retrieving notifications: {str(e)}"
+
     def export_user_data(self, user_id: str) -> Tuple[bool, Dict, str]:
         try:
+            # Include personalization and logins still waiting in the write buffer
+            if self.write_buffer is not None:
+                self.write_buffer.flush()
+
             # Get user profile
             profile_response = self.supabase.table("profiles").select("*").eq("user_id", user_id).execute()
             if not profile_response.data:
@@ -68,6 +216,11 @@ class ProfileService:
             # Get chat history
             chat_response = self.supabase.table("chat_history").select("*").eq("user_id", user_id).execute()
 
+            meal_plan_response = self.supabase.table("meal_plans").select("*").eq("user_id", user_id).execute()
+            meal_log_response = self.supabase.table("meal_logs").select("*").eq("user_id", user_id).execute()
+            meal_aggregate_response = self.supabase.table("meal_log_aggregates").select("*") \
+                .eq("user_id", user_id).execute()
+
             # Get user info
             user_response = self.supabase.table("users").select("email, created_at, last_login").eq("id", user_id).execute()
             if not user_response.data:
@@ -77,6 +230,9 @@ class ProfileService:
             export_data = {
                 "profile": profile_response.data[0],
                 "chat_history": chat_response.data,
+                "meal_plans": meal_plan_response.data,
+                "meal_logs": meal_log_response.data,
+                "meal_log_aggregates": meal_aggregate_response.data,
                 "user_info": {
                     "email": user_response.data[0]["email"],
                     "created_at": user_response.data[0]["created_at"],
@@ -94,14 +250,30 @@ class ProfileService:
 
     def delete_account(self, user_id: str) -> Tuple[bool, str]:
         try:
+            # Queued writes would otherwise recreate the deleted rows
+            if self.write_buffer is not None:
+                self.write_buffer.discard(user_id)
+
             # Delete chat history
             self.supabase.table("chat_history").delete().eq("user_id", user_id).execute()
 
+            # Delete period history
+            self.supabase.table("period_history").delete().eq("user_id", user_id).execute()
+            self.supabase.table("cycle_stats").delete().eq("user_id", user_id).execute()
+            self.supabase.table("meal_plans").delete().eq("user_id", user_id).execute()
+            self.supabase.table("meal_logs").delete().eq("user_id", user_id).execute()
+            self.supabase.table("meal_log_aggregates").delete().eq("user_id", user_id).execute()
+
             # Delete profile
             self.supabase.table("profiles").delete().eq("user_id", user_id).execute()
 
             # Delete user
             self.supabase.table("users").delete().eq("id", user_id).execute()
+            session_cache.revoke_user(user_id)
+            if self.chat_search is not None:
+                self.chat_search.drop(user_id)
+            if self.phase_scheduler is not None:
+                self.phase_scheduler.unschedule(user_id)
 
             self.logger.log_db_event('account_deletion', 'all', True)
             return True, "Account deleted successfully"
@@ -110,6 +282,24 @@ class ProfileService:
             self.logger.log_db_event('account_deletion', 'all', False, {'error': str(e)})
             return False, f"Error deleting account: {str(e)}"
 
+    def add_chat_message(self, user_id: str, role: str, message: str) -> Tuple[bool, Dict, str]:
+        try:
+            response = self.supabase.table("chat_history").insert({
+                "user_id": user_id,
+                "role": role,
+                "message": message,
+                "timestamp": datetime.utcnow().isoformat()
+            }).execute()
+            row = response.data[0]
+            if self.chat_search is not None:
+                self.chat_search.index_message(user_id, row)
+            self.logger.log_db_event('chat_history_add', 'chat_history', True)
+            return True, row, "Chat message saved successfully"
+
+        except Exception as e:
+            self.logger.log_db_event('chat_history_add', 'chat_history', False, {'error': str(e)})
+            return False, {}, f"Error saving chat message: {str(e)}"
+
     def get_chat_history(self, user_id: str, limit: int = 50) -> Tuple[bool, List, str]:
         try:
             response = self.supabase.table("chat_history").select("*").eq("user_id", user_id).order("timestamp", desc=True).limit(limit).execute()
@@ -123,6 +313,8 @@ class ProfileService:
     def clear_chat_history(self, user_id: str) -> Tuple[bool, str]:
         try:
             self.supabase.table("chat_history").delete().eq("user_id", user_id).execute()
+            if self.chat_search is not None:
+                self.chat_search.drop(user_id)
             self.logger.log_db_event('chat_history_clear', 'chat_history', True)
             return True, "Chat history cleared successfully"
 
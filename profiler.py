@@ -0,0 +1,204 @@
+"""Opt-in sampling profiler for whole Streamlit reruns.
+
+A profiled rerun is sampled from a background thread every
+PROFILER_INTERVAL seconds until the script's module frame leaves the stack,
+which also catches runs ended early by st.rerun() or st.stop(). Each
+profile is written to PROFILE_DIR as
+
+- ``<name>.collapsed``: one ``frame;frame;frame count`` line per stack, for
+  flamegraph.pl, speedscope or inferno;
+- ``<name>.top.txt``: the hottest functions by self and inclusive samples;
+
+and appended to ``index.jsonl`` under its interaction type (``page_load``,
+``chat_question``, ...), so runs of the same interaction can be compared:
+
+    python profiler.py summary
+    python profiler.py merge chat_question > chat_question.collapsed
+
+Profiling is enabled for a session by opening the app with
+``?profile=<PROFILER_TOKEN>`` (``?profile=off`` stops it) or for a random
+PROFILER_SAMPLE_RATE fraction of reruns. Otherwise the per-rerun cost is a
+couple of dictionary lookups.
+"""
+import argparse
+import hmac
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import (
+    PROFILER_TOKEN,
+    PROFILER_SAMPLE_RATE,
+    PROFILER_INTERVAL,
+    PROFILER_TOP_N,
+    PROFILE_DIR
+)
+from logging_service import LoggingService
+
+# Script thread id -> profiler sampling it
+_active: Dict[int, "RerunProfiler"] = {}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RerunProfiler:
+    def __init__(self, session_id: str, interaction: str, script_frame, interval: float = PROFILER_INTERVAL,
+                 out_dir: str = PROFILE_DIR, top_n: int = PROFILER_TOP_N):
+        self.session_id = session_id
+        self.interaction = interaction
+        self.script_frame = script_frame
+        self.interval = interval
+        self.out_dir = out_dir
+        self.top_n = top_n
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.duration = 0.0
+        self.done = threading.Event()
+
+    def start(self) -> "RerunProfiler":
+        _active[self.thread_id] = self
+        threading.Thread(target=self._sample, name="rerun-profiler", daemon=True).start()
+        return self
+
+    def _sample(self):
+        try:
+            while True:
+                time.sleep(self.interval)
+                frame = sys._current_frames().get(self.thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    if frame is self.script_frame:
+                        break
+                    frame = frame.f_back
+                if frame is None:  # the rerun has finished
+                    if not self.stacks:
+                        self.duration = time.perf_counter() - self.started
+                    break
+                self.stacks[tuple(reversed(stack))] += 1
+                self.duration = time.perf_counter() - self.started
+            if _active.get(self.thread_id) is self:
+                del _active[self.thread_id]
+            self.script_frame = None
+            self.write()
+        finally:
+            self.done.set()
+
+    def top_functions(self):
+        self_samples, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack[-1]] += count
+            for code in set(stack):
+                inclusive[code] += count
+        return (
+            [(_frame_label(code), count) for code, count in self_samples.most_common(self.top_n)],
+            [(_frame_label(code), count) for code, count in inclusive.most_common(self.top_n)]
+        )
+
+    def write(self) -> Dict:
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = f"{self.started_at:%Y%m%dT%H%M%S%f}-{self.interaction}-{self.session_id[:8]}"
+        with open(os.path.join(self.out_dir, f"{name}.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(";".join(_frame_label(code) for code in stack) + f" {count}\n")
+
+        by_self, by_inclusive = self.top_functions()
+        total = sum(self.stacks.values()) or 1
+        with open(os.path.join(self.out_dir, f"{name}.top.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{self.interaction}  {self.duration * 1000:.0f} ms  {total} samples every "
+                    f"{self.interval * 1000:.0f} ms\n\nSelf\n")
+            f.writelines(f"{count / total:6.1%}  {label}\n" for label, count in by_self)
+            f.write("\nInclusive\n")
+            f.writelines(f"{count / total:6.1%}  {label}\n" for label, count in by_inclusive)
+
+        entry = {
+            "profile": name,
+            "interaction": self.interaction,
+            "session": self.session_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": sum(self.stacks.values()),
+            "top": [label for label, _ in by_self[:5]]
+        }
+        with open(os.path.join(self.out_dir, "index.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        LoggingService().log_app_event('rerun_profiled', entry)
+        return entry
+
+
+def profile_rerun(session_id: str, session_state, query_params, interaction: str = "rerun") -> Optional[RerunProfiler]:
+    """Call first thing in the script; samples this rerun if profiling is on for it."""
+    requested = query_params.get("profile")
+    if requested is not None:
+        if requested == "off":
+            session_state["profiling"] = False
+        elif PROFILER_TOKEN and hmac.compare_digest(requested, PROFILER_TOKEN):
+            session_state["profiling"] = True
+    if not session_state.get("profiling") and not (PROFILER_SAMPLE_RATE and random.random() < PROFILER_SAMPLE_RATE):
+        return None
+    # Compared by identity, so the next rerun on the same thread ends this profile
+    return RerunProfiler(session_id or "anonymous", interaction, sys._getframe(1)).start()
+
+
+def mark_interaction(interaction: str):
+    """Label the current rerun's profile, if it is being profiled."""
+    profiler = _active.get(threading.get_ident())
+    if profiler is not None:
+        profiler.interaction = interaction
+
+
+def read_index(out_dir: str = PROFILE_DIR):
+    path = os.path.join(out_dir, "index.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare rerun profiles by interaction type.")
+    parser.add_argument("--dir", default=PROFILE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("summary", help="run count and duration percentiles per interaction")
+    merge = sub.add_parser("merge", help="sum the collapsed stacks of every profile of one interaction")
+    merge.add_argument("interaction")
+    args = parser.parse_args(argv)
+
+    entries = read_index(args.dir)
+    if args.command == "summary":
+        by_interaction = defaultdict(list)
+        for entry in entries:
+            by_interaction[entry["interaction"]].append(entry)
+        print(f"{'interaction':<22} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8}  most frequent hot spot")
+        for interaction, runs in sorted(by_interaction.items()):
+            durations = sorted(run["duration_ms"] for run in runs)
+            hot = Counter(run["top"][0] for run in runs if run["top"]).most_common(1)
+            print(f"{interaction:<22} {len(runs):>5} {statistics.median(durations):>8.0f} "
+                  f"{durations[min(len(durations) - 1, int(len(durations) * 0.95))]:>8.0f}  {hot[0][0] if hot else '-'}")
+    else:
+        merged = Counter()
+        for entry in entries:
+            if entry["interaction"] != args.interaction:
+                continue
+            with open(os.path.join(args.dir, f"{entry['profile']}.collapsed"), "r", encoding="utf-8") as f:
+                for line in f:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    merged[stack] += int(count)
+        for stack, count in merged.most_common():
+            print(f"{stack} {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+from functools import lru_cache
+from typing import Optional
+from supabase import create_client
+from auth_service import AuthService
+from profile_service import ProfileService
+from chat_search import ChatSearchService
+from write_buffer import WriteBuffer
+from feedback_service import FeedbackService
+from session_store import SessionSync, create_session_store
+from meal_log_service import MealLogService
+from meal_plan_service import MealPlanService
+from session_memory import SessionMemoryManager
+from admission import AdmissionController, create_admission_controller
+from phase_scheduler import PhaseTransitionScheduler, PhaseTransitionNotifier
+from llm_accounting import LLMUsageStore
+from llm_resilience import ResilientChain
+from email_dispatcher import EmailDispatcher
+from email_service import EmailService
+from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, PHASE_SCHEDULER_ENABLED
+
+
+# Process-wide singletons shared by every Streamlit session (and any other
+# entry point) so clients, background workers and caches are only created once.
+
+@lru_cache(maxsize=None)
+def get_auth_service() -> AuthService:
+    return AuthService(write_buffer=get_write_buffer())
+
+
+@lru_cache(maxsize=None)
+def get_profile_service() -> ProfileService:
+    return ProfileService(phase_scheduler=get_phase_scheduler(), chat_search=get_chat_search_service(),
+                          write_buffer=get_write_buffer())
+
+
+@lru_cache(maxsize=None)
+def get_write_buffer() -> WriteBuffer:
+    return WriteBuffer()
+
+
+@lru_cache(maxsize=None)
+def get_chat_search_service() -> ChatSearchService:
+    return ChatSearchService()
+
+
+@lru_cache(maxsize=None)
+def get_phase_scheduler() -> Optional[PhaseTransitionScheduler]:
+    # Runs in one process per deployment; others leave rescheduling to it
+    if not PHASE_SCHEDULER_ENABLED:
+        return None
+    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    scheduler = PhaseTransitionScheduler()
+    scheduler.add_listener(PhaseTransitionNotifier(supabase, EmailService(), EmailDispatcher()))
+    return scheduler.start(supabase)
+
+
+@lru_cache(maxsize=None)
+def get_feedback_service() -> FeedbackService:
+    return FeedbackService()
+
+
+@lru_cache(maxsize=None)
+def get_session_sync() -> SessionSync:
+    return SessionSync(create_session_store())
+
+
+@lru_cache(maxsize=None)
+def get_session_memory() -> SessionMemoryManager:
+    manager = SessionMemoryManager(get_session_sync())
+    manager.start_reaper()
+    return manager
+
+
+@lru_cache(maxsize=None)
+def get_meal_log_service() -> MealLogService:
+    return MealLogService()
+
+
+@lru_cache(maxsize=None)
+def get_meal_plan_service() -> MealPlanService:
+    return MealPlanService()
+
+
+@lru_cache(maxsize=None)
+def get_admission_controller() -> AdmissionController:
+    return create_admission_controller()
+
+
+@lru_cache(maxsize=None)
+def get_llm_usage_store() -> LLMUsageStore:
+    return LLMUsageStore()
+
+
+@lru_cache(maxsize=None)
+def get_llm_chain() -> ResilientChain:
+    # Shared by every session and API request, so the latency window and circuit breaker see all traffic.
+    # utils imports this module, so its chain builders are imported on first use.
+    from utils import build_llm_chain
+    return ResilientChain(build_llm_chain(), admission=get_admission_controller(), usage=get_llm_usage_store())
+
+
+@lru_cache(maxsize=None)
+def get_meal_plan_chain() -> ResilientChain:
+    from utils import build_meal_plan_chain
+    return ResilientChain(build_meal_plan_chain(), admission=get_admission_controller(), usage=get_llm_usage_store())
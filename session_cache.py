@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from config import SESSION_TIMEOUT, SESSION_REVOCATION_REFRESH
+from logging_service import LoggingService
+from session_store import create_session_store, encode_value
+
+
+def _revocations_id(user_id: str) -> str:
+    # A pseudo session in the session store: "before" for revoke-all, one key per logged-out jti
+    return f"revoked:{user_id}"
+
+
+class SessionCache:
+    """In-process LRU of recently verified session tokens plus revocation state.
+
+    Streamlit re-creates services on every rerun, so this lives at module level
+    and is shared by every AuthService instance in the process. Revocations are
+    written to the shared session store as well, so a logout or password change
+    in one worker reaches the others: a cached token is re-checked against the
+    store once it has been trusted for ``refresh`` seconds.
+    """
+
+    def __init__(self, max_entries: int = 10000, store=None, refresh: float = SESSION_REVOCATION_REFRESH):
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._store = store
+        self._entries = OrderedDict()  # token -> (user_id, jti, issued_at, expires_at, checked_at)
+        self._revoked_jtis = {}  # jti -> expires_at
+        self._revoked_users = {}  # user_id -> revoked_before (epoch seconds)
+        self._lock = threading.Lock()
+        self.logger = LoggingService()
+
+    @property
+    def store(self):
+        # Opened on first use, so importing the auth code doesn't create the store
+        with self._lock:
+            if self._store is None:
+                self._store = create_session_store()
+            return self._store
+
+    def get(self, token: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user_id, jti, issued_at, expires_at, checked_at = entry
+            if expires_at <= now or self._is_revoked(user_id, jti, issued_at):
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+        if now - checked_at >= self.refresh:
+            if self._is_revoked_elsewhere(user_id, jti, issued_at, expires_at):
+                with self._lock:
+                    self._entries.pop(token, None)
+                return None
+            with self._lock:
+                if token in self._entries:
+                    self._entries[token] = (user_id, jti, issued_at, expires_at, now)
+        return user_id
+
+    def put(self, token: str, user_id: str, jti: str, issued_at: float, expires_at: float):
+        """Cache a token that ``is_revoked`` has just cleared."""
+        with self._lock:
+            self._entries[token] = (user_id, jti, issued_at, expires_at, time.time())
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def is_revoked(self, user_id: str, jti: str, issued_at: float, expires_at: float) -> bool:
+        with self._lock:
+            if self._is_revoked(user_id, jti, issued_at):
+                return True
+        return self._is_revoked_elsewhere(user_id, jti, issued_at, expires_at)
+
+    def _is_revoked(self, user_id: str, jti: str, issued_at: float) -> bool:
+        if jti and jti in self._revoked_jtis:
+            return True
+        revoked_before = self._revoked_users.get(user_id)
+        return revoked_before is not None and issued_at <= revoked_before
+
+    def _is_revoked_elsewhere(self, user_id: str, jti: str, issued_at: float, expires_at: float) -> bool:
+        """Check the shared store, remembering what it says locally."""
+        try:
+            revocations = self.store.load(_revocations_id(user_id), ("before", jti) if jti else ("before",))
+        except Exception as e:
+            # Fail open: an unreachable store must not log everybody out
+            self.logger.log_app_event('session_revocation_check_failed', {'error': str(e)}, level='ERROR')
+            return False
+        with self._lock:
+            if jti and jti in revocations:
+                self._revoked_jtis[jti] = expires_at
+            revoked_before = revocations.get("before")
+            if revoked_before is not None and revoked_before + SESSION_TIMEOUT > time.time():
+                self._revoked_users[user_id] = max(revoked_before, self._revoked_users.get(user_id, 0))
+            return self._is_revoked(user_id, jti, issued_at)
+
+    def revoke_token(self, token: str, user_id: str, jti: str, expires_at: float):
+        with self._lock:
+            self._entries.pop(token, None)
+            if jti:
+                self._revoked_jtis[jti] = expires_at
+            self._purge(time.time())
+        if jti:
+            self.store.save(_revocations_id(user_id), {jti: encode_value(expires_at)})
+
+    def revoke_user(self, user_id: str):
+        now = time.time()
+        with self._lock:
+            self._revoked_users[user_id] = now
+            for token in [t for t, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[token]
+            self._purge(now)
+        self.store.save(_revocations_id(user_id), {"before": encode_value(now)})
+
+    def _purge(self, now: float):
+        # Drop revocations for tokens that would have expired anyway
+        for stale in [j for j, exp in self._revoked_jtis.items() if exp <= now]:
+            del self._revoked_jtis[stale]
+        for stale in [u for u, before in self._revoked_users.items() if before + SESSION_TIMEOUT <= now]:
+            del self._revoked_users[stale]
+
+
+session_cache = SessionCache()
@@ -0,0 +1,223 @@
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from config import (
+    SESSION_TIMEOUT,
+    SESSION_MEMORY_BUDGET_MB,
+    SESSION_MEMORY_MIN_IDLE,
+    SESSION_REAP_INTERVAL
+)
+from logging_service import LoggingService
+from session_store import SessionSync
+
+# Dropped from memory on spill and restored from the session store on the next rerun
+SPILLED_SESSION_KEYS = ("chat_history", "recommendations_response")
+
+
+def approx_size(value, seen: Optional[set] = None) -> int:
+    """Approximate deep size in bytes; objects shared within the state are counted once."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += approx_size(vars(value), seen)
+    return size
+
+
+def share_recommendations_text(state):
+    """Point recommendations_response at the identical chat message instead of
+    keeping a second copy of the text (they diverge after a restore)."""
+    text = state["recommendations_response"] if "recommendations_response" in state else None
+    if not text or "chat_history" not in state:
+        return
+    for _, message in state["chat_history"] or []:
+        if message is text:
+            return
+        if len(message) == len(text) and message == text:
+            state["recommendations_response"] = message
+            return
+
+
+class _StateHandle:
+    """Mapping view over a session's state that works outside its script run."""
+
+    def __init__(self, state):
+        try:
+            self._ref = weakref.ref(state)
+        except TypeError:  # plain dicts, e.g. in benchmarks
+            self._ref = lambda: state
+
+    @property
+    def state(self):
+        return self._ref()
+
+    def get(self, key, default=None):
+        state = self.state
+        return state[key] if state is not None and key in state else default
+
+    def __contains__(self, key):
+        return key in self.state
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def __setitem__(self, key, value):
+        self.state[key] = value
+
+    def __delitem__(self, key):
+        del self.state[key]
+
+
+class SessionMemoryManager:
+    """Tracks the approximate memory of every live session in this process.
+
+    ``enter`` is called at the start of every script or fragment run and
+    ``touch`` once per rerun. A background sweep spills sessions idle for
+    ``SESSION_TIMEOUT`` and, while the total is over the budget, the least
+    recently used sessions idle for at least ``SESSION_MEMORY_MIN_IDLE``.
+    Spilling persists the session to the session store, drops its heavy keys
+    and makes the next rerun restore them.
+
+    The sweep runs in another thread than the session's script, so it only
+    spills while holding the session's lock and never while a run of it is
+    in progress; ``enter`` waits for a spill that is under way to finish.
+    """
+
+    def __init__(self, sync: SessionSync, budget_bytes: int = SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+                 idle_timeout: float = SESSION_TIMEOUT, min_idle: float = SESSION_MEMORY_MIN_IDLE):
+        self.sync = sync
+        self.budget_bytes = budget_bytes
+        self.idle_timeout = timedelta(seconds=idle_timeout)
+        self.min_idle = timedelta(seconds=min_idle)
+        self.sessions: Dict[str, Dict] = {}
+        self.evictions = {"idle": 0, "budget": 0}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self.logger = LoggingService()
+
+    def _entry(self, session_id: str, handle) -> Dict:
+        # Called with self._lock held
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            entry = self.sessions[session_id] = {
+                "handle": _StateHandle(handle), "last_activity": datetime.now(), "bytes": 0,
+                "lock": threading.Lock(), "run": None, "spilled": False
+            }
+        return entry
+
+    def enter(self, session_id: str, handle):
+        """Mark a run of the session as in progress in this thread (script runs and fragment runs).
+
+        Call it before reading the session's state; a spill of the session that
+        is under way finishes first, and none starts until the run is over.
+        """
+        with self._lock:
+            entry = self._entry(session_id, handle)
+        with entry["lock"]:
+            entry["run"] = threading.current_thread()
+            entry["last_activity"] = datetime.now()
+
+    def touch(self, session_id: str, state, handle=None):
+        """Record activity and the current size of ``state``.
+
+        ``handle`` is the underlying state object used for spilling from the
+        reaper thread; it defaults to ``state``.
+        """
+        now = datetime.now()
+        state["last_activity"] = now
+        share_recommendations_text(state)
+        seen = set()
+        size = sum(approx_size(key, seen) + approx_size(state[key], seen) for key in list(state.keys()))
+        with self._lock:
+            entry = self._entry(session_id, handle if handle is not None else state)
+            entry.update(last_activity=now, bytes=size, spilled=False)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["bytes"] for entry in self.sessions.values())
+
+    def spill(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self.sessions.get(session_id)
+        if entry is None:
+            return False
+        with entry["lock"]:
+            handle = entry["handle"]
+            # The script thread lives until its last queued rerun is done
+            if entry["spilled"] or handle.state is None or (entry["run"] is not None and entry["run"].is_alive()):
+                return False
+            try:
+                self.sync.persist(session_id, handle)
+                for key in SPILLED_SESSION_KEYS + (SessionSync.FINGERPRINTS_KEY,):
+                    if key in handle:
+                        del handle[key]
+                handle["_session_id"] = None  # the next rerun restores from the store
+            except Exception as e:
+                self.logger.log_app_event('session_spill', {'session_id': session_id, 'error': str(e)}, level='ERROR')
+                return False
+            entry.update(spilled=True, bytes=0)
+            return True
+
+    def reap(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or datetime.now()
+        with self._lock:
+            # Sessions Streamlit has already closed need no spilling
+            for session_id in [s for s, e in self.sessions.items() if e["handle"].state is None]:
+                del self.sessions[session_id]
+            by_age = sorted(((s, e) for s, e in self.sessions.items() if not e["spilled"]),
+                            key=lambda item: item[1]["last_activity"])
+        reaped = {"idle": 0, "budget": 0}
+        total = sum(entry["bytes"] for _, entry in by_age)
+        for session_id, entry in by_age:
+            idle = now - entry["last_activity"]
+            if idle >= self.idle_timeout:
+                reason = "idle"
+            elif total > self.budget_bytes and idle >= self.min_idle:
+                reason = "budget"
+            else:
+                continue
+            size = entry["bytes"]
+            if self.spill(session_id):
+                reaped[reason] += 1
+                total -= size
+        with self._lock:
+            self.evictions["idle"] += reaped["idle"]
+            self.evictions["budget"] += reaped["budget"]
+        if reaped["idle"] or reaped["budget"]:
+            self.logger.log_app_event('session_reap', {**reaped, **self.get_metrics()})
+        return reaped
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": sum(1 for entry in self.sessions.values() if not entry["spilled"]),
+                "bytes": sum(entry["bytes"] for entry in self.sessions.values()),
+                "budget_bytes": self.budget_bytes,
+                "evicted_idle": self.evictions["idle"],
+                "evicted_budget": self.evictions["budget"]
+            }
+
+    def start_reaper(self, interval: float = SESSION_REAP_INTERVAL):
+        if self._reaper is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap()
+                except Exception as e:
+                    self.logger.log_app_event('session_reap', {'error': str(e)}, level='ERROR')
+
+        self._reaper = threading.Thread(target=loop, name="session-reaper", daemon=True)
+        self._reaper.start()
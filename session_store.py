@@ -0,0 +1,237 @@
+import abc
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, Iterable
+from config import (
+    SESSION_STORE_BACKEND,
+    SESSION_STORE_PATH,
+    SESSION_STORE_URL,
+    SESSION_STORE_TTL,
+    SESSION_STORE_PURGE_INTERVAL
+)
+
+# Bump when the shape of a persisted value changes; old keys are simply ignored.
+SESSION_STATE_VERSION = 1
+
+# The part of st.session_state that has to survive a restart or a move to another worker.
+# Credentials are not among them: anyone holding a ?sid= link can restore these,
+# so a logged-in session is resumed from the HttpOnly login cookie instead.
+PERSISTED_SESSION_KEYS = (
+    "guest_mode",
+    "personalization_completed",
+    "phase",
+    "support_goal",
+    "dietary_preferences",
+    "cycle_length",
+    "chat_history",
+    "recommendations_response",
+    "recommendations_title",
+    "meal_plan",
+    "meal_plan_id"
+)
+
+_COMPRESS_THRESHOLD = 512  # bytes; smaller values are stored as plain JSON
+
+
+def encode_value(value) -> bytes:
+    raw = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def decode_value(key: str, blob: bytes):
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    value = json.loads(raw)
+    if key == "chat_history" and value is not None:
+        # JSON has no tuples; the app stores (role, message) pairs. Interning the
+        # roles keeps one "user"/"assistant" string per process, not one per message.
+        value = [(sys.intern(role), message) for role, message in value]
+    return value
+
+
+def storage_key(session_id: str, key: str) -> str:
+    return f"v{SESSION_STATE_VERSION}:{session_id}:{key}"
+
+
+class SessionStore(abc.ABC):
+    """Versioned key/value storage for per-session state."""
+
+    @abc.abstractmethod
+    def load(self, session_id: str, keys: Iterable[str] = PERSISTED_SESSION_KEYS) -> Dict:
+        """Return the stored, unexpired values of one session."""
+
+    @abc.abstractmethod
+    def save(self, session_id: str, values: Dict[str, bytes]):
+        """Write already-encoded values for one session in a single round trip."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str, keys: Iterable[str] = PERSISTED_SESSION_KEYS):
+        """Remove the given keys of one session."""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Local store shared by every worker process on one host (WAL mode).
+
+    Expired rows are purged when the store is opened and then at most once per
+    ``purge_interval`` seconds from ``save``; the network backend expires keys itself.
+    """
+
+    def __init__(self, path: str = SESSION_STORE_PATH, ttl: int = SESSION_STORE_TTL,
+                 purge_interval: int = SESSION_STORE_PURGE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.commit()
+        self.purge_expired()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str, keys: Iterable[str] = PERSISTED_SESSION_KEYS) -> Dict:
+        prefix = storage_key(session_id, "")
+        rows = self._conn().execute(
+            "SELECT key, value FROM session_state WHERE key >= ? AND key < ? AND updated_at > ?",
+            (prefix, prefix + "\uffff", time.time() - self.ttl)
+        ).fetchall()
+        wanted = set(keys)
+        values = {}
+        for full_key, blob in rows:
+            key = full_key[len(prefix):]
+            if key in wanted:
+                values[key] = decode_value(key, blob)
+        return values
+
+    def save(self, session_id: str, values: Dict[str, bytes]):
+        if not values:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO session_state (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(storage_key(session_id, key), blob, now) for key, blob in values.items()]
+            )
+        if now - self._last_purge >= self.purge_interval:
+            self.purge_expired()
+
+    def delete(self, session_id: str, keys: Iterable[str] = PERSISTED_SESSION_KEYS):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "DELETE FROM session_state WHERE key = ?",
+                [(storage_key(session_id, key),) for key in keys]
+            )
+
+    def purge_expired(self) -> int:
+        self._last_purge = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM session_state WHERE updated_at <= ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+
+class NetworkSessionStore(SessionStore):
+    """Store backed by a shared key/value server, for workers spread over several hosts.
+
+    ``client`` needs the redis-py style ``mget``, ``pipeline`` (with ``set(..., ex=)``
+    and ``delete``) and works with any compatible server.
+    """
+
+    def __init__(self, client, ttl: int = SESSION_STORE_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    def load(self, session_id: str, keys: Iterable[str] = PERSISTED_SESSION_KEYS) -> Dict:
+        keys = list(keys)
+        blobs = self.client.mget([storage_key(session_id, key) for key in keys])
+        return {key: decode_value(key, blob) for key, blob in zip(keys, blobs) if blob is not None}
+
+    def save(self, session_id: str, values: Dict[str, bytes]):
+        if not values:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, blob in values.items():
+            pipe.set(storage_key(session_id, key), blob, ex=self.ttl)
+        pipe.execute()
+
+    def delete(self, session_id: str, keys: Iterable[str] = PERSISTED_SESSION_KEYS):
+        self.client.delete(*[storage_key(session_id, key) for key in keys])
+
+
+def create_session_store() -> SessionStore:
+    if SESSION_STORE_BACKEND == "redis":
+        import redis  # optional dependency, only needed for the network backend
+        return NetworkSessionStore(redis.Redis.from_url(SESSION_STORE_URL))
+    return SQLiteSessionStore()
+
+
+class SessionSync:
+    """Mirrors the persisted keys of a session-state mapping into a SessionStore.
+
+    Only keys whose encoded value changed since the last sync are written, so a
+    rerun that touches nothing costs one fingerprint pass and no I/O.
+    """
+
+    FINGERPRINTS_KEY = "_session_store_fingerprints"
+
+    def __init__(self, store: SessionStore, keys: Iterable[str] = PERSISTED_SESSION_KEYS):
+        self.store = store
+        self.keys = tuple(keys)
+
+    def restore(self, session_id: str, state) -> bool:
+        """Load a stored session into ``state``. Returns True if anything was found."""
+        values = self.store.load(session_id, self.keys)
+        fingerprints = {}
+        for key, value in values.items():
+            state[key] = value
+            fingerprints[key] = self._fingerprint(encode_value(value))
+        state[self.FINGERPRINTS_KEY] = fingerprints
+        return bool(values)
+
+    def persist(self, session_id: str, state):
+        fingerprints = state.get(self.FINGERPRINTS_KEY)
+        if fingerprints is None:
+            fingerprints = state[self.FINGERPRINTS_KEY] = {}
+        changed = {}
+        for key in self.keys:
+            if key not in state:
+                continue
+            blob = encode_value(state[key])
+            fingerprint = self._fingerprint(blob)
+            if fingerprints.get(key) != fingerprint:
+                changed[key] = blob
+                fingerprints[key] = fingerprint
+        self.store.save(session_id, changed)
+
+    def forget(self, session_id: str, state):
+        self.store.delete(session_id, self.keys)
+        state[self.FINGERPRINTS_KEY] = {}
+
+    @staticmethod
+    def _fingerprint(blob: bytes) -> bytes:
+        return hashlib.blake2b(blob, digest_size=16).digest()
@@ -0,0 +1,174 @@
+"""Coalesce identical requests that are in flight at the same time.
+
+When many sessions ask the same question within seconds (a suggested
+question during a campaign), only the first caller for a key does the work;
+the others wait for its result, or its exception, instead of repeating it.
+Nothing is kept once the call finishes, so this is not a cache: a request
+arriving after the leader returned starts a new call.
+
+``SingleFlight`` is for blocking callers (the app's script threads),
+``StreamFlight`` fans one async token stream out to every subscriber, with
+late joiners first replaying the chunks already produced.
+"""
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as ResultTimeout
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+
+def prompt_key(prompt: str) -> str:
+    """Key for a fully rendered prompt; identical prompts coalesce."""
+    return hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def coalescing_ratio(metrics: Dict) -> float:
+    total = metrics["leaders"] + metrics["coalesced"]
+    return round(metrics["coalesced"] / total, 4) if total else 0.0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.metrics = {"leaders": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def do(self, key: str, fn: Callable, timeout: Optional[float] = None) -> Tuple[object, bool]:
+        """Run ``fn()`` unless a call for ``key`` is in flight, then wait for that one.
+
+        Returns ``(result, shared)``. The leader's exception is raised in every
+        waiting caller; a waiter that gives up after ``timeout`` seconds gets
+        ``TimeoutError`` while the leader carries on.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.metrics["leaders"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            try:
+                return future.result(timeout), True
+            except ResultTimeout:
+                if future.done():
+                    raise  # the leader's own TimeoutError
+                self._count("timeouts")
+                raise TimeoutError(f"shared call still running after {timeout}s") from None
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._count("errors")
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return {**self.metrics, "in_flight": len(self._calls), "coalescing_ratio": coalescing_ratio(self.metrics)}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+
+class _Broadcast:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class StreamFlight:
+    """Async fan-out of one chunk stream per key to every concurrent subscriber.
+
+    The producer runs as its own task, so a leader that disconnects does not
+    end the stream for the others; it is cancelled once nobody is listening.
+    """
+
+    def __init__(self, idle_timeout: Optional[float] = None):
+        self.idle_timeout = idle_timeout
+        self._streams: Dict[str, _Broadcast] = {}
+        self.metrics = {"leaders": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def in_flight(self) -> int:
+        return len(self._streams)
+
+    def get_metrics(self) -> Dict:
+        return {**self.metrics, "in_flight": len(self._streams), "coalescing_ratio": coalescing_ratio(self.metrics)}
+
+    async def subscribe(self, key: str, source: Callable[[], AsyncIterator[str]],
+                        on_join: Optional[Callable[[bool], None]] = None) -> AsyncIterator[str]:
+        """Yield the chunks of ``source()``, sharing one run per ``key``.
+
+        ``on_join(shared)`` is called once the caller knows whether it leads.
+        """
+        broadcast = self._streams.get(key)
+        shared = broadcast is not None
+        if not shared:
+            broadcast = self._streams[key] = _Broadcast()
+            broadcast.task = asyncio.create_task(self._produce(key, broadcast, source))
+        self.metrics["coalesced" if shared else "leaders"] += 1
+        if on_join is not None:
+            on_join(shared)
+
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                async with broadcast.changed:
+                    try:
+                        await asyncio.wait_for(
+                            broadcast.changed.wait_for(lambda: position < len(broadcast.chunks) or broadcast.done),
+                            self.idle_timeout
+                        )
+                    except asyncio.TimeoutError:
+                        self.metrics["timeouts"] += 1
+                        raise TimeoutError(f"no chunk within {self.idle_timeout}s") from None
+                    chunks = broadcast.chunks[position:]
+                    finished = broadcast.done
+                for chunk in chunks:
+                    yield chunk
+                position += len(chunks)
+                if finished and position == len(broadcast.chunks):
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                broadcast.task.cancel()
+
+    async def _produce(self, key: str, broadcast: _Broadcast, source: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in source():
+                async with broadcast.changed:
+                    broadcast.chunks.append(chunk)
+                    broadcast.changed.notify_all()
+        except asyncio.CancelledError:
+            broadcast.error = ConnectionAbortedError("stream abandoned by every subscriber")
+        except Exception as e:
+            self.metrics["errors"] += 1
+            broadcast.error = e
+        finally:
+            # New subscribers start a fresh run from here on
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            async with broadcast.changed:
+                broadcast.done = True
+                broadcast.changed.notify_all()
@@ -1,27 +1,63 @@
 from dotenv import load_dotenv
 load_dotenv()
 import streamlit as st
-from supabase import create_client, Client
 from datetime import datetime
 import os
-from utils import reset_session, load_llm_chain, add_to_chat_history
-from auth_service import AuthService
-from profile_service import ProfileService
+from utils import reset_session, load_llm_chain, load_meal_plan_chain, add_to_chat_history, build_chain_inputs
+from knowledge_base import get_knowledge_base
+from admission import PRIORITY_USER, PRIORITY_GUEST
+from services import (
+    get_auth_service,
+    get_profile_service,
+    get_feedback_service,
+    get_session_sync,
+    get_session_memory,
+    get_meal_log_service,
+    get_meal_plan_service,
+    get_chat_search_service,
+    get_llm_usage_store
+)
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from meal_log_service import MealAggregates, MEAL_LOG_FORMAT_HINT, parse_meal_log
+from meal_plan_service import (
+    MealPlan,
+    filter_plan,
+    format_grocery_list,
+    grocery_list,
+    parse_meal_plan,
+    parse_plan_followup,
+    parse_plan_request,
+    plan_chain_inputs,
+    plan_to_text,
+    profile_key,
+    swap_meal
+)
+from pdf_export import recommendations_to_pdf
+from chat_view import CHUNK_CACHE_KEY, render_chat_history
+from cycle import detect_phase
+from profiler import profile_rerun, mark_interaction
 from config import (
     ERROR_MESSAGES, 
     SUCCESS_MESSAGES, 
     SESSION_TIMEOUT,
-    SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY,
     SUPPORT_OPTIONS,
     DIETARY_OPTIONS,
-    CYCLE_PHASES
+    CYCLE_PHASES,
+    MIN_CYCLE_LENGTH,
+    API_BASE_URL,
+    SESSION_COOKIE_NAME
 )
 import streamlit.components.v1 as components
+import functools
 import json
-from fpdf import FPDF
 import time
-import logging
+import uuid
+
+# Opt-in profiling of this whole rerun (?profile=<token> or sampled)
+profile_rerun(
+    st.query_params.get("sid", ""), st.session_state, st.query_params,
+    "rerun" if "_session_id" in st.session_state else "page_load"
+)
 
 # More info & guidance page logic at the very top
 if 'show_info_page' not in st.session_state:
@@ -56,6 +92,7 @@ if top_sidebar_placeholder.button("More info & guidance", key="info_btn"):
 
 # Show info page if selected, otherwise show main app
 if st.session_state.get('show_info_page', False):
+    mark_interaction("info_page")
     show_info_page()
     st.stop()
 
@@ -75,11 +112,9 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-
-auth_service = AuthService()
-profile_service = ProfileService()
+# Services are process-wide singletons, not rebuilt on every rerun
+auth_service = get_auth_service()
+profile_service = get_profile_service()
 
 # Session state
 if "logged_in" not in st.session_state:
@@ -103,14 +138,77 @@ if "support_goal" not in st.session_state:
 if "dietary_preferences" not in st.session_state:
     st.session_state.dietary_preferences = []
 
+# Session state is mirrored into a shared store keyed by ?sid=, so a refresh,
+# a restart or the load balancer picking another worker resumes the session
+if "sid" not in st.query_params:
+    st.query_params["sid"] = uuid.uuid4().hex
+session_id = st.query_params["sid"]
+session_sync = get_session_sync()
+
+
+def enter_session_run():
+    """Start a script or fragment run: hold off the idle-session reaper, then restore a spilled session."""
+    get_session_memory().enter(session_id, get_script_run_ctx().session_state)
+    if st.session_state.get("_session_id") != session_id:
+        session_sync.restore(session_id, st.session_state)
+        st.session_state["_session_id"] = session_id
+
+
+def session_fragment(func):
+    """``st.fragment`` whose reruns, like full reruns, are protected from the reaper."""
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        enter_session_run()
+        return func(*args, **kwargs)
+    return st.fragment(run)
+
+
+enter_session_run()
+session_sync.persist(session_id, st.session_state)
+# Accounts this session's memory; idle sessions are spilled back to the store above
+get_session_memory().touch(session_id, st.session_state, get_script_run_ctx().session_state)
+
+
+def sync_session_cookie(token=None):
+    """Have the browser ask the API to set (or, without a token, clear) the HttpOnly login cookie.
+
+    The token only travels in the request header, never in a URL; page scripts can't read the cookie.
+    """
+    if token:
+        request = {"method": "POST", "credentials": "include", "headers": {"Authorization": f"Bearer {token}"}}
+    else:
+        request = {"method": "DELETE", "credentials": "include"}
+    components.html(
+        f"<script>fetch({json.dumps(API_BASE_URL + '/v1/session')}, {json.dumps(request)});</script>",
+        height=0
+    )
+
+
+# Resume a logged-in session from the HttpOnly cookie the API set at login
+session_cookie = st.context.cookies.get(SESSION_COOKIE_NAME)
+if not st.session_state.logged_in and session_cookie and not st.session_state.get("cookie_cleared"):
+    resumed, user_data, _ = auth_service.resume_session(session_cookie)
+    if resumed:
+        st.session_state.user_id = user_data["id"]
+        st.session_state.session_token = user_data["session_token"]
+        st.session_state.logged_in = True
+if st.session_state.pop("cookie_pending", None):
+    sync_session_cookie(st.session_state.get("session_token"))
+
 # Logo at the top
 st.image("images/HerFoodCodeLOGO.png", width=120)
 
 # Title
 st.title("Your Scientific Cycle Nutrition Assistant")
 
+# Phase-change notices from the scheduler, shown once per session
+if st.session_state.logged_in and not st.session_state.get("notices_checked"):
+    _, notices, _ = get_profile_service().pop_notifications(st.session_state.user_id)
+    for notice in notices:
+        st.info(f"Your **{notice['phase']}** phase has started.")
+    st.session_state.notices_checked = True
+
 query_params = st.query_params
-logging.warning(f"RAW QUERY PARAMS: {query_params}")
 if "token" in query_params and st.session_state.get("show_info_page", False) is False:
     token_param = query_params["token"]
     # Handle both list and string types
@@ -118,16 +216,39 @@ if "token" in query_params and st.session_state.get("show_info_page", False) is
         token = token_param[0]
     else:
         token = token_param
+
+    if auth_service.token_service.token_type(token) == "reset":
+        st.header("Reset Your Password")
+        new_password = st.text_input("New Password", type="password")
+        confirm_password = st.text_input("Confirm New Password", type="password")
+        if st.button("Reset Password"):
+            if new_password != confirm_password:
+                st.error("Passwords do not match.")
+            else:
+                success, msg = auth_service.reset_password(token, new_password)
+                if success:
+                    st.success("Password reset successful! You can now log in.")
+                else:
+                    st.error(msg)
+        if st.button("Back to login"):
+            del st.query_params["token"]
+            st.rerun()
+        st.stop()
+
     st.header("Email Verification")
-    with st.spinner("Verifying your email..."):
-        success, msg = auth_service.verify_email(token)
-        if success:
-            st.success("Verification successful! Welcome!")
-            if st.button("Go to login page and get started"):
-                st.experimental_set_query_params()
-                st.rerun()
-        else:
-            st.error(f"Verification failed: {msg}")
+    # Remember the outcome for this session so reruns don't verify the same token again
+    verification_results = st.session_state.setdefault("verification_results", {})
+    if token not in verification_results:
+        with st.spinner("Verifying your email..."):
+            verification_results[token] = auth_service.verify_email(token)
+    success, msg = verification_results[token]
+    if success:
+        st.success("Verification successful! Welcome!")
+        if st.button("Go to login page and get started"):
+            del st.query_params["token"]
+            st.rerun()
+    else:
+        st.error(f"Verification failed: {msg}")
     st.stop()
 # --- END EMAIL VERIFICATION HANDLER ---
 
@@ -165,6 +286,7 @@ if not st.session_state.logged_in and not st.session_state.guest_mode:
         if auth_mode == "Register":
             confirm_password = st.text_input("Confirm Password", type="password")
             if st.button("Register"):
+                mark_interaction("register")
                 if password != confirm_password:
                     st.error("Passwords do not match")
                 else:
@@ -175,11 +297,15 @@ if not st.session_state.logged_in and not st.session_state.guest_mode:
                         st.error(msg)
         else:
             if st.button("Login"):
+                mark_interaction("login")
                 success, user_data, msg = auth_service.login_user(email, password)
                 if success:
                     st.session_state.user_id = user_data["id"]
+                    st.session_state.session_token = user_data["session_token"]
                     st.session_state.logged_in = True
                     st.session_state.login_attempts = 0
+                    st.session_state.cookie_pending = True
+                    st.session_state.pop("cookie_cleared", None)
                     st.rerun()
                 else:
                     st.session_state.login_attempts += 1
@@ -194,24 +320,6 @@ if not st.session_state.logged_in and not st.session_state.guest_mode:
     
     st.stop()
 
-# Handle password reset via token in URL
-query_params = st.query_params
-if "token" in query_params:
-    token = query_params["token"][0]
-    st.header("Reset Your Password")
-    new_password = st.text_input("New Password", type="password")
-    confirm_password = st.text_input("Confirm New Password", type="password")
-    if st.button("Reset Password"):
-        if new_password != confirm_password:
-            st.error("Passwords do not match.")
-        else:
-            success, msg = auth_service.reset_password(token, new_password)
-            if success:
-                st.success("Password reset successful! You can now log in.")
-            else:
-                st.error(msg)
-    st.stop()
-
 # Personalization
 st.header("Personalization")
 
@@ -236,36 +344,64 @@ st.markdown("#### Option 2: Or let me help you to find your current phase:")
 
 has_cycle = st.radio("Do you have a (regular) menstrual cycle?", ("Yes", "No"))
 
+def apply_detected_phase(detected_phase):
+    st.session_state.phase = phase_override if phase_override else detected_phase
+    if not phase_override:
+        st.success(f"Based on your data, you are likely in the **{st.session_state.phase}** phase.")
+    st.session_state.personalization_completed = True
+
+
+def record_periods(*period_starts):
+    for period_start in period_starts:
+        success, stats, msg = get_profile_service().record_period(st.session_state.user_id, period_start)
+        if not success:
+            st.error(msg)
+            return
+    st.session_state.cycle_stats = stats
+
+
 if has_cycle == "Yes":
     today = datetime.now().date()
-    st.session_state.second_last_period = st.date_input("Second most recent period start date", value=today)
-    st.session_state.last_period = st.date_input("Most recent period start date", value=today)
+    # Logged-in users continue from their stored period history: one lookup per session
+    cycle_stats = None
+    if st.session_state.logged_in:
+        if "cycle_stats" not in st.session_state:
+            _, st.session_state.cycle_stats, _ = get_profile_service().get_cycle_stats(st.session_state.user_id)
+        cycle_stats = st.session_state.cycle_stats
+
+    if cycle_stats is not None and cycle_stats.last_period:
+        last_period = st.date_input("Most recent period start date", value=cycle_stats.last_period, max_value=today)
+        if last_period != cycle_stats.last_period and st.session_state.get("recorded_period") != last_period:
+            record_periods(last_period)
+            st.session_state.recorded_period = last_period
+            cycle_stats = st.session_state.cycle_stats
+        st.session_state.last_period = cycle_stats.last_period
+        st.session_state.cycle_length = cycle_stats.cycle_length
+        if cycle_stats.count:
+            st.caption(
+                f"From {cycle_stats.count} logged cycle{'s' if cycle_stats.count != 1 else ''}: "
+                f"{cycle_stats.mean:.0f} days on average (± {cycle_stats.stddev:.1f})."
+            )
+        apply_detected_phase(cycle_stats.phase_on(today))
+    else:
+        st.session_state.second_last_period = st.date_input("Second most recent period start date", value=today)
+        st.session_state.last_period = st.date_input("Most recent period start date", value=today)
 
-    if st.session_state.last_period and st.session_state.second_last_period:
-        if st.session_state.second_last_period > st.session_state.last_period:
-            st.session_state.second_last_period, st.session_state.last_period = st.session_state.last_period, st.session_state.second_last_period
+        if st.session_state.last_period and st.session_state.second_last_period:
+            if st.session_state.second_last_period > st.session_state.last_period:
+                st.session_state.second_last_period, st.session_state.last_period = st.session_state.last_period, st.session_state.second_last_period
 
-        if st.session_state.last_period != today and st.session_state.second_last_period != today:
-            cycle_length = (st.session_state.last_period - st.session_state.second_last_period).days
-            if cycle_length <= 10:
-                st.error("Your periods seem too close together. Please check the entered dates.")
-            else:
-                st.session_state.cycle_length = cycle_length
-                days_since_last = (today - st.session_state.last_period).days
-
-                if days_since_last <= 5:
-                    detected_phase = "Menstrual"
-                elif days_since_last <= 14:
-                    detected_phase = "Follicular"
-                elif days_since_last <= 21:
-                    detected_phase = "Ovulatory"
+            if st.session_state.last_period != today and st.session_state.second_last_period != today:
+                cycle_length = (st.session_state.last_period - st.session_state.second_last_period).days
+                if cycle_length < MIN_CYCLE_LENGTH:
+                    st.error("Your periods seem too close together. Please check the entered dates.")
                 else:
-                    detected_phase = "Luteal"
-
-                st.session_state.phase = phase_override if phase_override else detected_phase
-                if not phase_override:
-                    st.success(f"Based on your data, you are likely in the **{st.session_state.phase}** phase.")
-                st.session_state.personalization_completed = True
+                    st.session_state.cycle_length = cycle_length
+                    # Start the stored history so the next visit (and phase-change notices) build on it
+                    if st.session_state.logged_in:
+                        record_periods(st.session_state.second_last_period, st.session_state.last_period)
+                    days_since_last = (today - st.session_state.last_period).days
+                    apply_detected_phase(detect_phase(days_since_last))
 else:
     st.subheader("No active menstrual cycle detected.")
     pseudo_choice = st.radio("Would you like:", ("Get general energetic advice", "Start with a pseudo-cycle based on a 28-day rhythm"))
@@ -288,101 +424,238 @@ if phase_override and phase_override in ["Menstrual", "Follicular", "Ovulatory",
 if st.session_state.phase and st.session_state.support_goal and st.session_state.dietary_preferences:
     st.session_state.personalization_completed = True
 
-# --- Chat area: chat bubbles with speaker labels ---
-st.markdown('''
-<style>
-.chat-bubble-user {
-    background: #2d2d2d;
-    color: #fff;
-    border-radius: 16px 16px 4px 16px;
-    padding: 1rem;
-    margin-bottom: 0.5rem;
-    margin-left: 20%;
-    margin-right: 0;
-    text-align: right;
-    box-shadow: 0 2px 8px rgba(0,0,0,0.04);
-}
-.chat-bubble-assistant {
-    background: #232323;
-    color: #fff;
-    border-radius: 16px 16px 16px 4px;
-    padding: 1rem;
-    margin-bottom: 1.5rem;
-    margin-right: 20%;
-    margin-left: 0;
-    text-align: left;
-    box-shadow: 0 2px 8px rgba(0,0,0,0.04);
-}
-.speaker-label {
-    font-weight: bold;
-    font-size: 0.95em;
-    margin-bottom: 0.2em;
-    color: #e07a5f;
-}
-</style>
-''', unsafe_allow_html=True)
+def save_personalization():
+    """Queue changed personalization for logged-in users; the write buffer batches it."""
+    choices = {"diet": list(st.session_state.dietary_preferences or [])}
+    if st.session_state.phase in CYCLE_PHASES:
+        choices["phase"] = st.session_state.phase
+    if st.session_state.support_goal in SUPPORT_OPTIONS:
+        choices["goal"] = st.session_state.support_goal
+    # The widgets start empty rather than from the stored profile: only save what the user changes
+    if "saved_personalization" not in st.session_state:
+        st.session_state.saved_personalization = choices
+        return
+    saved = st.session_state.saved_personalization
+    changed = {field: value for field, value in choices.items() if saved.get(field) != value}
+    if changed:
+        success, _ = get_profile_service().queue_personalization(st.session_state.user_id, changed)
+        if success:
+            st.session_state.saved_personalization = {**saved, **changed}
 
-if st.session_state.get("personalization_completed"):
+if st.session_state.logged_in:
+    save_personalization()
+
+# --- Chat area: chat bubbles with speaker labels ---
+@session_fragment
+def render_chat_section():
     st.header("Chat History")
     if st.session_state.chat_history:
-        for role, msg in st.session_state.chat_history:
-            if role == "user":
-                st.markdown(f'''<div class="chat-bubble-user"><div class="speaker-label">You</div>{msg}</div>''', unsafe_allow_html=True)
-            else:
-                st.markdown(f'''<div class="chat-bubble-assistant"><div class="speaker-label">Assistant</div>{msg}</div>''', unsafe_allow_html=True)
+        render_chat_history(st.session_state.chat_history)
     else:
         st.markdown('<div style="color:#888; margin:2em 0; text-align:center;">Start the conversation by asking your first question below!</div>', unsafe_allow_html=True)
 
+if st.session_state.get("personalization_completed"):
+    render_chat_section()
+
 # Input at the bottom, always visible after latest message
 if st.session_state.get("clear_chat_input"):
     st.session_state["chat_input"] = ""
     st.session_state["clear_chat_input"] = False
 
+# --- Meal log: "Day + meal ingredients" messages are stored, not sent to the LLM ---
+def log_meals_from_chat(text):
+    """Store meal-log lines from a chat message. Returns the reply, or None if it isn't a meal log."""
+    # "Day 2: swap breakfast" is about the stored plan, not a meal eaten
+    if st.session_state.get("meal_plan") and parse_plan_followup(text) is not None:
+        return None
+    entries = parse_meal_log(text)
+    if not entries:
+        return None
+    if st.session_state.logged_in:
+        success, _, msg = get_meal_log_service().log_meals(st.session_state.user_id, text, st.session_state.phase)
+        if not success:
+            return msg
+    else:
+        # Guests keep their aggregates in the session only
+        aggregates = st.session_state.setdefault("meal_aggregates", MealAggregates())
+        aggregates.add({**entry, "phase": st.session_state.phase} for entry in entries)
+        msg = f"Logged {len(entries)} meal{'s' if len(entries) != 1 else ''}."
+    return f"{msg} Ask me to review my previous meal choices whenever you like."
+
+def meal_log_summary():
+    if st.session_state.logged_in:
+        _, summary, _ = get_meal_log_service().get_summary(st.session_state.user_id, st.session_state.phase)
+        return summary
+    aggregates = st.session_state.get("meal_aggregates")
+    return aggregates.summary(st.session_state.phase) if aggregates else ""
+
+def knowledge_base_answer(question, category):
+    """Answer from the knowledge base alone when it fully covers the question (a cache hit in the LLM accounting)."""
+    started = time.perf_counter()
+    response = get_knowledge_base().answer_factual(
+        question, st.session_state.phase, st.session_state.dietary_preferences
+    )
+    if response is not None:
+        get_llm_usage_store().record(category, latency_ms=(time.perf_counter() - started) * 1000, cache="hit")
+    return response
+
+def llm_caller():
+    # Logged-in users are admitted ahead of guests when the LLM budget is tight
+    if st.session_state.logged_in:
+        return {"user_id": st.session_state.user_id, "priority": PRIORITY_USER}
+    return {"user_id": session_id, "priority": PRIORITY_GUEST}
+
+# --- Meal plans: generated once as structured JSON, follow-ups answered from the stored plan ---
+def show_meal_plan(plan, plan_id=None):
+    st.session_state.meal_plan = plan.model_dump()
+    if plan_id is not None:
+        st.session_state.meal_plan_id = plan_id
+    # Offered through the usual text and PDF downloads
+    st.session_state.recommendations_response = plan_to_text(plan)
+    st.session_state.recommendations_title = plan.title
+
+def plan_followup_reply(plan, action, args):
+    if action == "grocery":
+        return format_grocery_list(grocery_list(plan))
+    if action == "export":
+        show_meal_plan(plan)
+        return "Your plan is ready below: download it as PDF or as text."
+    if action == "swap":
+        plan, old, new = swap_meal(plan, args["day"], args["meal"], st.session_state.dietary_preferences)
+        if new is None:
+            return f"I have no spare {args['meal'] or 'meal'} left for day {args['day']}. Ask me for a new plan for more options."
+        reply = f"Swapped day {args['day']}: **{old.title}** is now **{new.title}**."
+    else:
+        plan, swapped, dropped = filter_plan(plan, args["dietary_preferences"])
+        reply = f"Your plan now fits: {', '.join(args['dietary_preferences'])}."
+        if swapped:
+            reply += f" Replaced: {', '.join(swapped)}."
+        if dropped:
+            reply += f" Removed, as no spare meal fits: {', '.join(dropped)}."
+    if st.session_state.logged_in and st.session_state.get("meal_plan_id"):
+        get_meal_plan_service().update_plan(st.session_state.user_id, st.session_state.meal_plan_id, plan)
+    show_meal_plan(plan)
+    return f"{reply}\n\n{plan_to_text(plan, with_grocery_list=False)}"
+
+def meal_plan_reply(text, category):
+    """Answer a meal-plan request or a follow-up on the current plan. Returns the reply, or None."""
+    started = time.perf_counter()
+    plan = MealPlan.model_validate(st.session_state.meal_plan) if st.session_state.get("meal_plan") else None
+    followup = parse_plan_followup(text) if plan is not None else None
+    if followup is not None:
+        reply = plan_followup_reply(plan, *followup)
+        get_llm_usage_store().record(category, latency_ms=(time.perf_counter() - started) * 1000, cache="hit")
+        return reply
+    request = parse_plan_request(text)
+    if request is None:
+        return None
+    phase, goal, diet = st.session_state.phase, st.session_state.support_goal, st.session_state.dietary_preferences
+    profile = profile_key(phase, goal, diet)
+    if st.session_state.logged_in:
+        _, row, _ = get_meal_plan_service().get_plan(st.session_state.user_id, profile, request)
+        if row is not None:
+            plan = MealPlan.model_validate(row["plan"])
+            show_meal_plan(plan, row["id"])
+            get_llm_usage_store().record(category, latency_ms=(time.perf_counter() - started) * 1000, cache="hit")
+            return plan_to_text(plan)
+    context = get_knowledge_base().context_for(text, phase, goal, diet)
+    answer = load_meal_plan_chain().run(plan_chain_inputs(request, phase, goal, diet, context),
+                                        category=category, **llm_caller())
+    plan = parse_meal_plan(answer)
+    if plan is None:
+        return answer  # the resilience fallback, or a model answer that is not a valid plan
+    plan_id = ""
+    if st.session_state.logged_in:
+        success, row, _ = get_meal_plan_service().save_plan(st.session_state.user_id, profile, request, plan, phase)
+        plan_id = row["id"] if success else ""
+    show_meal_plan(plan, plan_id)
+    return plan_to_text(plan)
+
 # --- Use Streamlit's st.chat_input for always-visible chat input ---
 user_question = st.chat_input("Type your question...")
-if user_question:
+meal_log_reply = log_meals_from_chat(user_question) if user_question else None
+if meal_log_reply:
+    mark_interaction("meal_log")
+    add_to_chat_history("user", user_question)
+    add_to_chat_history("assistant", meal_log_reply)
+    st.rerun()
+elif user_question:
+    mark_interaction("chat_question")
     try:
-        qa_chain = load_llm_chain()
-        response = qa_chain.run({
-            "phase": st.session_state.phase,
-            "goal": st.session_state.support_goal,
-            "diet": ", ".join(st.session_state.dietary_preferences),
-            "question": user_question
-        })
+        response = meal_plan_reply(user_question, "free_text")
+        if response is None:
+            response = knowledge_base_answer(user_question, "free_text")
+        if response is None:
+            qa_chain = load_llm_chain()
+            response = qa_chain.run(build_chain_inputs(
+                st.session_state.phase,
+                st.session_state.support_goal,
+                st.session_state.dietary_preferences,
+                user_question
+            ), category="free_text", **llm_caller())
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+    else:
+        # Outside the try: st.rerun() raises an Exception subclass to stop the script
         add_to_chat_history("user", user_question)
         add_to_chat_history("assistant", response)
         st.rerun()
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
 
 # Logout button for logged-in users
 if st.session_state.logged_in:
     if st.button("Logout"):
+        if st.session_state.get("session_token"):
+            auth_service.logout(st.session_state.session_token)
+            st.session_state.session_token = None
+        # The cookie read at page load stays in st.context until the next page load
+        st.session_state.cookie_pending = True
+        st.session_state.cookie_cleared = True
         st.session_state.logged_in = False
         st.session_state.personalization_completed = False
         st.session_state.chat_history = []
+        st.session_state.pop("chat_visible_messages", None)
+        st.session_state.pop(CHUNK_CACHE_KEY, None)
+        for key in ("cycle_stats", "recorded_period", "notices_checked", "meal_plan", "meal_plan_id",
+                    "saved_personalization"):
+            st.session_state.pop(key, None)
         st.rerun()
 
-# --- Always-Visible Personalization Summary in Sidebar ---
-st.sidebar.markdown("## Your Personalization Summary")
-if st.session_state.get("phase"):
-    st.sidebar.markdown(f"**Cycle phase:** {st.session_state.phase}")
-else:
-    st.sidebar.markdown("**Cycle phase:** _Not set_")
-if st.session_state.get("support_goal"):
-    st.sidebar.markdown(f"**Support goal:** {st.session_state.support_goal}")
-else:
-    st.sidebar.markdown("**Support goal:** _Not set_")
-if st.session_state.get("dietary_preferences"):
-    st.sidebar.markdown(f"**Dietary preferences:** {', '.join(st.session_state.dietary_preferences)}")
-else:
-    st.sidebar.markdown("**Dietary preferences:** _None_")
-
-# Divider between summary and suggested questions
-st.sidebar.markdown("---")
-
-# --- Suggested Questions Panel in Sidebar ---
-suggested_questions = [
+# --- Sidebar regions ---
+# Each region is a fragment: an interaction inside one only reruns that region.
+@session_fragment
+def render_sidebar_summary():
+    st.markdown("## Your Personalization Summary")
+    if st.session_state.get("phase"):
+        st.markdown(f"**Cycle phase:** {st.session_state.phase}")
+    else:
+        st.markdown("**Cycle phase:** _Not set_")
+    if st.session_state.get("support_goal"):
+        st.markdown(f"**Support goal:** {st.session_state.support_goal}")
+    else:
+        st.markdown("**Support goal:** _Not set_")
+    if st.session_state.get("dietary_preferences"):
+        st.markdown(f"**Dietary preferences:** {', '.join(st.session_state.dietary_preferences)}")
+    else:
+        st.markdown("**Dietary preferences:** _None_")
+
+@session_fragment
+def render_chat_search():
+    st.markdown("## 🔎 Search your conversations")
+    query = st.text_input("Search past answers", key="chat_search_query",
+                          placeholder='e.g. seeds or "pumpkin seeds"', label_visibility="collapsed")
+    if not query.strip():
+        return
+    success, results, msg = get_chat_search_service().search(st.session_state.user_id, query)
+    if not success:
+        st.error(msg)
+    elif not results:
+        st.caption("No matching messages.")
+    for result in results:
+        speaker = "You" if result["role"] == "user" else "Assistant"
+        st.markdown(f"**{speaker}** · {str(result['timestamp'])[:10]}  \n{result['snippet']}")
+
+MEAL_REVIEW_INDEX = 1
+SUGGESTED_QUESTIONS = [
     "Give me a personal overview of foods for each of the 4 cycle phases to start experimenting with.",
     "Review my previous meal choices and give me feedback.",
     "What foods are best for my current cycle phase?",
@@ -390,56 +663,85 @@ suggested_questions = [
     "Why is organic food important for my cycle?",
     "What nutritional seeds support my phase (seed syncing)?"
 ]
-st.sidebar.markdown("## 💡 Suggested Questions")
-for i, question in enumerate(suggested_questions):
-    if st.sidebar.button(question, key=f"sidebar_suggested_q_{i}"):
-        add_to_chat_history("user", question)
-        # Custom response for meal review question
-        if question == "Review my previousmeal choices and give me feedback.":
-            response = "Please log your meals in the following format: Day + Meal ingredients."
-            add_to_chat_history("assistant", response)
-            st.rerun()
-        else:
+
+@session_fragment
+def render_suggested_questions():
+    st.markdown("## 💡 Suggested Questions")
+    for i, question in enumerate(SUGGESTED_QUESTIONS):
+        if st.button(question, key=f"sidebar_suggested_q_{i}"):
+            add_to_chat_history("user", question)
+            llm_question = question
+            # Meal review: send the precomputed log summary, not the raw log
+            if i == MEAL_REVIEW_INDEX:
+                summary = meal_log_summary()
+                if not summary:
+                    add_to_chat_history("assistant", MEAL_LOG_FORMAT_HINT)
+                    st.rerun()
+                llm_question = f"{question}\nSummary of my logged meals (ingredient x times eaten):\n{summary}"
             try:
-                qa_chain = load_llm_chain()
-                response = qa_chain.run({
-                    "phase": st.session_state.phase,
-                    "goal": st.session_state.support_goal,
-                    "diet": ", ".join(st.session_state.dietary_preferences),
-                    "question": question
-                })
+                response = meal_plan_reply(question, f"suggested_{i}")
+                # Lookups the knowledge base fully covers are answered without an LLM call
+                if response is None:
+                    response = knowledge_base_answer(question, f"suggested_{i}")
+                if response is None:
+                    qa_chain = load_llm_chain()
+                    response = qa_chain.run(build_chain_inputs(
+                        st.session_state.phase,
+                        st.session_state.support_goal,
+                        st.session_state.dietary_preferences,
+                        llm_question
+                    ), category=f"suggested_{i}", **llm_caller())
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+            else:
                 add_to_chat_history("assistant", response)
                 if i == 0:
                     st.session_state["recommendations_response"] = response
+                    st.session_state.pop("recommendations_title", None)
+                # Full rerun so the chat and download regions pick up the answer
                 st.rerun()
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
 
-# Divider between suggested questions and feedback
-st.sidebar.markdown("---")
-
-# --- Feedback Box at the bottom of the sidebar ---
-if st.session_state.get("clear_feedback_text"):
-    st.session_state["feedback_text"] = ""
-    st.session_state["clear_feedback_text"] = False
-st.sidebar.markdown("## Feedback")
-feedback_text = st.sidebar.text_area("Have feedback or a question I didn't answer?", key="feedback_text")
-if st.sidebar.button("Submit Feedback", key="submit_feedback"):
-    if feedback_text.strip():
-        feedback_data = {
-            "user_id": st.session_state.get("user_id", "guest"),
-            "timestamp": datetime.utcnow().isoformat(),
-            "feedback": feedback_text.strip()
-        }
-        try:
-            supabase.table("feedback").insert(feedback_data).execute()
-            st.sidebar.success("Thank you for your feedback!")
-            st.session_state["clear_feedback_text"] = True
-            st.rerun()
-        except Exception as e:
-            st.sidebar.error(f"Error submitting feedback: {str(e)}")
+def submit_feedback():
+    # Runs as the button's callback, before the fragment reruns, so the text
+    # area can still be cleared and no st.rerun() is needed
+    feedback_text = st.session_state.get("feedback_text", "").strip()
+    if not feedback_text:
+        st.session_state["feedback_status"] = ("warning", "Please enter your feedback before submitting.")
+        return
+    try:
+        # Spooled locally and bulk-inserted in the background
+        get_feedback_service().submit(
+            user_id=st.session_state.get("user_id", "guest"),
+            timestamp=datetime.utcnow().isoformat(),
+            feedback=feedback_text
+        )
+    except Exception as e:
+        st.session_state["feedback_status"] = ("error", f"Error submitting feedback: {str(e)}")
     else:
-        st.sidebar.warning("Please enter your feedback before submitting.")
+        st.session_state["feedback_text"] = ""
+        st.session_state["feedback_status"] = ("success", "Thank you for your feedback!")
+
+@session_fragment
+def render_feedback_box():
+    st.markdown("## Feedback")
+    status = st.session_state.pop("feedback_status", None)
+    if status:
+        kind, message = status
+        getattr(st, kind)(message)
+    st.text_area("Have feedback or a question I didn't answer?", key="feedback_text")
+    st.button("Submit Feedback", key="submit_feedback", on_click=submit_feedback)
+
+with st.sidebar:
+    render_sidebar_summary()
+    # Divider between summary and suggested questions
+    st.markdown("---")
+    if st.session_state.logged_in:
+        render_chat_search()
+        st.markdown("---")
+    render_suggested_questions()
+    # Divider between suggested questions and feedback
+    st.markdown("---")
+    render_feedback_box()
 
 # Divider and Exit Guest Mode button at the bottom of the sidebar
 if st.session_state.guest_mode:
@@ -448,43 +750,29 @@ if st.session_state.guest_mode:
         st.session_state.guest_mode = False
         st.session_state.personalization_completed = False
         st.session_state.chat_history = []
+        st.session_state.pop("chat_visible_messages", None)
+        st.session_state.pop(CHUNK_CACHE_KEY, None)
         st.rerun()
 
 # After rendering chat bubbles, show download if available
-def recommendations_to_pdf(text):
-    pdf = FPDF()
-    pdf.add_page()
-    # Add logo (centered)
-    logo_path = "images/HerFoodCodeLOGO.png"
-    pdf.image(logo_path, x=pdf.w/2-15, y=10, w=30)
-    pdf.ln(25)
-    # Title with color #442369
-    pdf.set_text_color(68, 35, 105)
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, "Your Nutritional overview per cycle phase", ln=True, align='C')
-    pdf.ln(10)
-    pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Arial", size=12)
-    for line in text.split('\n'):
-        # Make section headers (lines starting with a number and dot) colored
-        if line.strip().startswith(tuple(str(i)+'.' for i in range(1,10))):
-            pdf.set_text_color(68, 35, 105)
-            pdf.set_font("Arial", 'B', 12)
-            pdf.multi_cell(0, 10, line)
-            pdf.set_text_color(0, 0, 0)
-            pdf.set_font("Arial", size=12)
-        else:
-            pdf.multi_cell(0, 10, line)
-    return pdf.output(dest='S').encode('latin-1')
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_recommendations_pdf(text, title=None):
+    return recommendations_to_pdf(text, title) if title else recommendations_to_pdf(text)
 
-if st.session_state.get("recommendations_response"):
+@session_fragment
+def render_downloads():
     st.markdown("### Download your recommendations")
-    st.download_button(
-        label="Download as PDF",
-        data=recommendations_to_pdf(st.session_state["recommendations_response"]),
-        file_name="cycle_phase_recommendations.pdf",
-        mime="application/pdf"
-    )
+    # The PDF is only built and held for the session once it is asked for
+    if st.session_state.get("pdf_requested"):
+        st.download_button(
+            label="Download as PDF",
+            data=cached_recommendations_pdf(st.session_state["recommendations_response"],
+                                            st.session_state.get("recommendations_title")),
+            file_name="cycle_phase_recommendations.pdf",
+            mime="application/pdf"
+        )
+    else:
+        st.button("Prepare PDF", on_click=lambda: st.session_state.update(pdf_requested=True))
     st.download_button(
         label="Download as Text",
         data=st.session_state["recommendations_response"],
@@ -492,7 +780,11 @@ if st.session_state.get("recommendations_response"):
         mime="text/plain"
     )
 
+if st.session_state.get("recommendations_response"):
+    render_downloads()
+
+session_sync.persist(session_id, st.session_state)
+
 if not st.session_state.get("personalization_completed"):
     st.info("Please complete personalization above.")
     st.stop()
-
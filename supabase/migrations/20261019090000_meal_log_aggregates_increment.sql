@@ -0,0 +1,55 @@
+-- Adds meal-log increments to the per-user aggregates in one statement.
+-- The conflicting row is locked by ON CONFLICT, so concurrent sessions of the
+-- same user add up instead of overwriting each other (meal_log_service.py).
+-- Creates both meal-log tables first so it also applies on a fresh database.
+
+create table if not exists meal_logs (
+    id bigint generated always as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    day_label text not null,
+    log_date date not null,
+    meal text not null,
+    ingredients jsonb not null default '[]'::jsonb,
+    phase text,
+    week text not null,
+    created_at timestamptz not null default now()
+);
+create index if not exists meal_logs_user_id_log_date_idx on meal_logs (user_id, log_date);
+
+-- bucket is "phase:<phase>" or "week:<iso week>"; counts maps ingredient -> times logged
+create table if not exists meal_log_aggregates (
+    user_id uuid not null references users (id) on delete cascade,
+    bucket text not null,
+    entries integer not null default 0,
+    counts jsonb not null default '{}'::jsonb,
+    updated_at timestamptz not null default now()
+);
+
+create unique index if not exists meal_log_aggregates_user_id_bucket_key
+    on meal_log_aggregates (user_id, bucket);
+
+create or replace function increment_meal_log_aggregates(
+    p_user_id meal_log_aggregates.user_id%type,
+    p_deltas jsonb
+) returns void
+language sql
+as $$
+    insert into meal_log_aggregates as a (user_id, bucket, entries, counts, updated_at)
+    select p_user_id, d->>'bucket', (d->>'entries')::int, d->'counts', now()
+    from jsonb_array_elements(p_deltas) as d
+    on conflict (user_id, bucket) do update set
+        entries = a.entries + excluded.entries,
+        counts = (
+            select coalesce(jsonb_object_agg(item, total), '{}'::jsonb)
+            from (
+                select key as item, sum(value::int) as total
+                from (
+                    select * from jsonb_each_text(a.counts)
+                    union all
+                    select * from jsonb_each_text(excluded.counts)
+                ) as both_counts
+                group by key
+            ) as merged
+        ),
+        updated_at = excluded.updated_at;
+$$;
@@ -0,0 +1,20 @@
+-- Tables and unique indexes the single-use tokens (token_service.py) and
+-- registration (auth_service.py) rely on. Creating a unique index fails if
+-- the table already holds duplicates; remove those first.
+
+-- consume() deletes a token by value and trusts that only one row matches
+create table if not exists email_verifications (
+    token text not null,
+    email text not null,
+    user_id uuid not null references users (id) on delete cascade,
+    expiry timestamp not null,
+    created_at timestamptz not null default now()
+);
+create unique index if not exists email_verifications_token_key on email_verifications (token);
+create index if not exists email_verifications_expiry_idx on email_verifications (expiry);
+
+create unique index if not exists password_resets_token_key on password_resets (token);
+create index if not exists password_resets_expiry_idx on password_resets (expiry);
+
+-- register_user reads a 23505 on insert as "email already registered"
+create unique index if not exists users_email_key on users (email);
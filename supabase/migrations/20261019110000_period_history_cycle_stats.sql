@@ -0,0 +1,23 @@
+-- Period history and the per-user running cycle statistics (profile_service.py).
+
+-- record_period reads a 23505 on insert as "this period start is already logged"
+create table if not exists period_history (
+    user_id uuid not null references users (id) on delete cascade,
+    period_start date not null,
+    created_at timestamptz not null default now(),
+    primary key (user_id, period_start)
+);
+
+-- One row per user; writes are conditional on version (optimistic concurrency),
+-- and the first insert relies on the primary key to detect a concurrent creator
+create table if not exists cycle_stats (
+    user_id uuid primary key references users (id) on delete cascade,
+    last_period date,
+    cycle_count integer not null default 0,
+    mean_length double precision not null default 0,
+    m2 double precision not null default 0,
+    recent_lengths integer[] not null default '{}',
+    cycle_length integer,
+    version integer not null default 0,
+    updated_at timestamptz not null default now()
+);
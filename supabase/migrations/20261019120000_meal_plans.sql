@@ -0,0 +1,16 @@
+-- Structured meal plans (meal_plan_service.py), one per user, profile and request.
+
+create table if not exists meal_plans (
+    id uuid primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    profile_key text not null,
+    request_key text not null,
+    phase text,
+    plan jsonb not null,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+-- save_plan upserts with on_conflict=user_id,profile_key,request_key, which needs this constraint
+create unique index if not exists meal_plans_user_id_profile_key_request_key_key
+    on meal_plans (user_id, profile_key, request_key);
@@ -0,0 +1,13 @@
+-- In-app notices written by the phase scheduler (phase_scheduler.py) and read
+-- once by profile_service.pop_notifications, which marks the returned ids read.
+
+create table if not exists notifications (
+    id bigint generated always as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    kind text not null,
+    phase text,
+    read boolean not null default false,
+    created_at timestamptz not null default now()
+);
+create index if not exists notifications_user_id_unread_idx
+    on notifications (user_id, created_at) where not read;
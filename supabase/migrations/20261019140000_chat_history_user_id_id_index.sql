@@ -0,0 +1,5 @@
+-- Chat search (chat_search.py) builds and refreshes each user's index with a
+-- keyset scan: where user_id = ? and id > ? order by id. Without this index
+-- every refresh scans the user's rows via a sort, or the whole table.
+
+create index if not exists chat_history_user_id_id_idx on chat_history (user_id, id);
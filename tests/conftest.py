@@ -0,0 +1,18 @@
+import os
+import sys
+
+# config.py reads these at import time; the tests never reach a real service
+for name, value in {
+    "SUPABASE_URL": "http://localhost:54321",
+    "SUPABASE_ANON_KEY": "test-anon-key",
+    "SUPABASE_SERVICE_ROLE_KEY": "test-service-role-key",
+    "OPENAI_API_KEY": "sk-test",
+    "SMTP_USERNAME": "test",
+    "SMTP_PASSWORD": "test",
+    "SENDER_EMAIL": "noreply@example.com",
+    "LLM_BACKEND": "fake",
+    "PHASE_SCHEDULER_ENABLED": "false",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,25 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+
+
+@pytest.fixture
+def client():
+    api.app.dependency_overrides[api.current_user] = lambda: "u1"
+    yield TestClient(api.app)
+    api.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/v1/chat", {"phase": "Winter", "question": "What should I eat?"}),
+    ("/v1/meal-plans", {"phase": "luteal", "request": "Give me a 3-day breakfast plan"}),
+])
+def test_unknown_phase_is_rejected(client, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "phase"]
+
+
+def test_profile_update_rejects_unknown_phase(client):
+    assert client.patch("/v1/profile", json={"phase": "Autumn"}).status_code == 422
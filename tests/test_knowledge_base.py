@@ -0,0 +1,42 @@
+import pytest
+
+from knowledge_base import get_knowledge_base
+
+
+@pytest.fixture(scope="module")
+def kb():
+    return get_knowledge_base()
+
+
+@pytest.mark.parametrize("question", [
+    "What nutritional seeds support my phase (seed syncing)?",
+    "What nutritional seeds support my Luteal phase (seed syncing)?",
+    "Which seeds should I eat in my luteal phase?",
+    "which seeds for my phase",
+    "What seeds do I need during this phase?",
+    "Seed syncing",
+    "Seed syncing for my phase?",
+    "What are my seeds for this phase?",
+])
+def test_seed_lookups_are_answered(kb, question):
+    answer = kb.answer_factual(question, "Luteal", [])
+    assert answer and answer.startswith("For seed syncing in your **Luteal** phase")
+
+
+@pytest.mark.parametrize("question", [
+    "Which seeds should I avoid in my luteal phase?",
+    "What seeds should I not eat in my phase?",
+    "Which seeds are bad for my phase?",
+    "Which seeds should I eat in my follicular phase?",
+    "What is seed syncing?",
+    "Is seed syncing backed by science?",
+    "Do seeds help with cramps in my luteal phase?",
+    "What should I eat in my luteal phase?",
+])
+def test_other_seed_questions_go_to_the_model(kb, question):
+    assert kb.answer_factual(question, "Luteal", []) is None
+
+
+def test_no_lookup_without_a_known_phase(kb):
+    assert kb.answer_factual("Which seeds for my phase?", None, []) is None
+
@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+
+from local_supabase import LocalSupabase
+from meal_log_service import MealLogService, parse_meal_log
+
+TODAY = date(2026, 10, 19)  # a Monday
+
+
+def test_explicit_meal_is_logged():
+    assert parse_meal_log("Monday lunch: lentils, rice", today=TODAY) == [{
+        "day_label": "Monday",
+        "log_date": "2026-10-19",
+        "meal": "lunch",
+        "ingredients": ["lentils", "rice"]
+    }]
+
+
+@pytest.mark.parametrize("text, meal, ingredients", [
+    ("Yesterday dinner - salmon + sweet potatoes", "dinner", ["salmon", "sweet potatoes"]),
+    ("Tuesday: had oats with blueberries and a coffee", "meal", ["oats with blueberries", "a coffee"]),
+    ("Day 2 snacks: almonds", "snack", ["almonds"]),
+    ("Today breakfast: açaí bowl", "breakfast", ["açaí bowl"]),
+])
+def test_food_lines_are_logged(text, meal, ingredients):
+    [entry] = parse_meal_log(text, today=TODAY)
+    assert entry["meal"] == meal
+    assert entry["ingredients"] == ingredients
+
+
+@pytest.mark.parametrize("text", [
+    "Today: I feel bloated and tired, any tips",
+    "Monday - had cramps all day and low energy",
+    "Yesterday: skipped breakfast because of nausea",
+    "Sunday: which seeds are best for me?",
+    "Monday: went to the gym",
+    "Day 2: swap breakfast",
+    "What should I eat for dinner?",
+])
+def test_questions_and_symptoms_are_not_logged(text):
+    assert parse_meal_log(text, today=TODAY) == []
+
+
+def test_log_meals_updates_aggregates():
+    db = LocalSupabase()
+    service = MealLogService(supabase=db)
+    ok, rows, _ = service.log_meals("u1", "Monday lunch: lentils, rice\nTuesday: oats", "Luteal")
+    assert ok and len(rows) == 2
+    service.log_meals("u1", "Wednesday dinner: lentils", "Luteal")
+    [bucket] = db.table("meal_log_aggregates").select("*").eq("bucket", "phase:Luteal").execute().data
+    assert bucket["entries"] == 3
+    assert bucket["counts"]["lentils"] == 2
+
+
+def test_non_food_message_is_not_stored():
+    db = LocalSupabase()
+    ok, rows, _ = MealLogService(supabase=db).log_meals("u1", "Today: I feel bloated and tired, any tips", "Luteal")
+    assert not ok and rows == []
+    assert db.table("meal_logs").select("*").execute().data == []
@@ -0,0 +1,39 @@
+import pytest
+
+from meal_plan_service import parse_plan_followup
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("swap day 2 lunch", ("swap", {"day": 2, "meal": "lunch"})),
+    ("Day 2: swap breakfast", ("swap", {"day": 2, "meal": "breakfast"})),
+    ("replace the dinner on day 1", ("swap", {"day": 1, "meal": "dinner"})),
+    ("swap day 3", ("swap", {"day": 3, "meal": None})),
+    ("Can you swap day 2 lunch?", ("swap", {"day": 2, "meal": "lunch"})),
+    ("shopping list", ("grocery", {})),
+    ("Give me the grocery list for this plan", ("grocery", {})),
+    ("download", ("export", {})),
+    ("Export the plan as PDF", ("export", {})),
+    ("make the plan vegan", ("filter", {"dietary_preferences": ["Vegan"]})),
+    ("Make it gluten-free and dairy free.",
+     ("filter", {"dietary_preferences": ["Gluten free", "Lactose intolerance"]})),
+    ("please make my meal plan vegetarian", ("filter", {"dietary_preferences": ["Vegetarian"]})),
+    ("vegan version of the plan", ("filter", {"dietary_preferences": ["Vegan"]})),
+])
+def test_plan_followups(text, expected):
+    assert parse_plan_followup(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "Is it ok to be vegan during my period?",
+    "Is this gluten free diet good for acne?",
+    "What should I look for when grocery shopping in my luteal phase?",
+    "Can I print a list of iron-rich foods?",
+    "How do I change my diet on day 2 of my period?",
+    "I went shopping for vegan food today",
+    "change it",
+    "Monday lunch: lentils, rice",
+    "Give me a 3-day breakfast plan.",
+    "",
+])
+def test_other_messages_are_not_followups(text):
+    assert parse_plan_followup(text) is None
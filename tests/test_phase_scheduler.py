@@ -0,0 +1,93 @@
+from datetime import date, datetime
+
+import pytest
+
+from local_supabase import LocalSupabase
+from phase_scheduler import PhaseTransitionScheduler
+from profile_service import ProfileService
+
+LAST_PERIOD = date(2026, 10, 1)
+HOUR = 7
+
+
+def at(day: date, hour: int = HOUR) -> float:
+    return (datetime(day.year, day.month, day.day, hour) - datetime(1970, 1, 1)).total_seconds()
+
+
+@pytest.fixture
+def scheduler():
+    now = {"t": at(date(2026, 10, 3), 12)}
+    sched = PhaseTransitionScheduler(state_path=None, hour=HOUR, grace=6 * 3600, clock=lambda: now["t"])
+    sched.now = now
+    return sched
+
+
+def test_schedules_next_phase_start(scheduler):
+    # Day 6 after the period start begins the follicular phase
+    assert scheduler.schedule("u1", LAST_PERIOD, 28) == at(date(2026, 10, 7))
+
+
+def test_run_due_fires_once_and_schedules_the_next_transition(scheduler):
+    fired = []
+    scheduler.add_listener(fired.extend)
+    scheduler.schedule("u1", LAST_PERIOD, 28)
+
+    assert scheduler.run_due(at(date(2026, 10, 7)) - 1) == []
+    [transition] = scheduler.run_due(at(date(2026, 10, 7)))
+    assert (transition.user_id, transition.phase) == ("u1", "Follicular")
+    assert fired == [transition]
+    assert scheduler.next_due("u1") == at(date(2026, 10, 16))
+    assert scheduler.run_due(at(date(2026, 10, 7), 8)) == []
+
+
+def test_run_due_skips_transitions_missed_beyond_grace(scheduler):
+    scheduler.schedule("u1", LAST_PERIOD, 28)
+    assert scheduler.run_due(at(date(2026, 10, 8))) == []
+    assert scheduler.metrics["missed"] == 1
+    assert scheduler.next_due("u1") == at(date(2026, 10, 16))
+
+
+def test_run_due_ignores_superseded_and_unscheduled_entries(scheduler):
+    scheduler.schedule("u1", LAST_PERIOD, 28)
+    scheduler.schedule("u1", date(2026, 10, 3), 28)
+    scheduler.schedule("u2", LAST_PERIOD, 28)
+    scheduler.unschedule("u2")
+    fired = scheduler.run_due(at(date(2026, 10, 9)))
+    assert [(t.user_id, t.phase) for t in fired] == [("u1", "Follicular")]
+    assert len(scheduler) == 1
+
+
+def test_sync_picks_up_edits_new_users_and_deletions(scheduler):
+    db = LocalSupabase()
+    db.table("profiles").insert([
+        {"user_id": "u1", "last_period": "2026-10-01", "cycle_length": 28, "updated_at": "2026-10-03T10:00:00"},
+        {"user_id": "u2", "last_period": None, "cycle_length": None, "updated_at": "2026-10-03T10:00:00"},
+    ]).execute()
+    assert scheduler.sync(db, None) == 1
+    assert scheduler.sync(db, "2026-10-03T09:00:00") == 0  # overlapping window, nothing changed
+
+    db.table("profiles").update({"last_period": "2026-10-02", "updated_at": "2026-10-03T11:00:00"}) \
+        .eq("user_id", "u1").execute()
+    db.table("profiles").update({"last_period": "2026-10-01", "updated_at": "2026-10-03T11:00:00"}) \
+        .eq("user_id", "u2").execute()
+    assert scheduler.sync(db, "2026-10-03T10:30:00") == 2
+    assert scheduler.next_due("u1") == at(date(2026, 10, 8))
+    assert scheduler.next_due("u2") == at(date(2026, 10, 7))
+
+    db.table("profiles").delete().eq("user_id", "u2").execute()
+    assert scheduler.reconcile(db) == 1
+    assert scheduler.next_due("u2") is None and len(scheduler) == 1
+
+
+def test_pop_notifications_marks_only_the_returned_rows_read():
+    db = LocalSupabase()
+    service = ProfileService(supabase=db)
+    db.table("notifications").insert([
+        {"user_id": "u1", "kind": "phase_transition", "phase": "Luteal", "read": False, "created_at": "2026-10-19"},
+        {"user_id": "u2", "kind": "phase_transition", "phase": "Luteal", "read": False, "created_at": "2026-10-19"},
+    ]).execute()
+    ok, notices, _ = service.pop_notifications("u1")
+    assert ok and [n["phase"] for n in notices] == ["Luteal"]
+    rows = {row["user_id"]: row["read"] for row in db.table("notifications").select("*").execute().data}
+    assert rows == {"u1": True, "u2": False}
+    assert service.pop_notifications("u1")[1] == []
@@ -0,0 +1,50 @@
+import threading
+from datetime import datetime, timedelta
+
+from session_memory import SessionMemoryManager
+from session_store import SQLiteSessionStore, SessionSync
+
+
+def new_state():
+    return {"_session_id": "s1", "phase": "Luteal", "chat_history": [("user", "hi"), ("assistant", "hello")]}
+
+
+def test_reaper_spills_only_between_runs(tmp_path):
+    sync = SessionSync(SQLiteSessionStore(str(tmp_path / "sessions.db")))
+    manager = SessionMemoryManager(sync, budget_bytes=0, min_idle=0)
+    state = new_state()
+    started, finish = threading.Event(), threading.Event()
+
+    def script_run():
+        manager.enter("s1", state)
+        manager.touch("s1", state)
+        started.set()
+        finish.wait()
+
+    run = threading.Thread(target=script_run)
+    run.start()
+    started.wait()
+    later = datetime.now() + timedelta(hours=2)
+    assert manager.reap(later) == {"idle": 0, "budget": 0}
+    assert "chat_history" in state
+
+    finish.set()
+    run.join()
+    assert manager.reap(later) == {"idle": 1, "budget": 0}
+    assert "chat_history" not in state and state["_session_id"] is None
+    assert manager.get_metrics()["sessions"] == 0
+
+    restored = {}
+    sync.restore("s1", restored)
+    assert restored["chat_history"] == [("user", "hi"), ("assistant", "hello")]
+
+
+def test_spilled_session_is_tracked_again_on_its_next_run(tmp_path):
+    sync = SessionSync(SQLiteSessionStore(str(tmp_path / "sessions.db")))
+    manager = SessionMemoryManager(sync, budget_bytes=0, min_idle=0)
+    state = new_state()
+    manager.touch("s1", state)
+    assert manager.spill("s1") and not manager.spill("s1")
+    sync.restore("s1", state)
+    manager.touch("s1", state)
+    assert manager.get_metrics()["sessions"] == 1 and manager.total_bytes() > 0
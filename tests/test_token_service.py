@@ -0,0 +1,79 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from auth_service import AuthService
+from config import ERROR_MESSAGES
+from local_supabase import LocalSupabase
+
+EMAIL = "a@example.com"
+PASSWORD = "NewPassw0rd!"
+
+
+@pytest.fixture
+def auth():
+    db = LocalSupabase()
+    db.table("users").insert({"id": "11111111-1111-1111-1111-111111111111", "email": EMAIL,
+                              "password": "x", "email_verified": True}).execute()
+    service = AuthService(supabase=db)
+    service.db = db
+    return service
+
+
+def test_consume_hands_a_token_out_once(auth):
+    tokens = auth.token_service
+    token = tokens.issue("reset", EMAIL)
+    success, record, _ = tokens.consume(token, "reset")
+    assert success and record["email"] == EMAIL
+    assert auth.db.table("password_resets").select("*").execute().data == []
+    assert tokens.consume(token, "reset", replay=False) == (False, {}, ERROR_MESSAGES["invalid_token"])
+    assert tokens.consume(token, "reset")[0]  # replayed outcome, e.g. a second click on a verify link
+
+
+def test_consume_rejects_unknown_wrong_type_and_expired_tokens(auth):
+    tokens = auth.token_service
+    assert not tokens.consume("r_unknown", "reset")[0]
+    assert not tokens.consume(tokens.issue("reset", EMAIL), "verification")[0]
+    expired = tokens.issue("reset", EMAIL)
+    auth.db.table("password_resets").update(
+        {"expiry": (datetime.utcnow() - timedelta(minutes=1)).isoformat()}
+    ).eq("token", expired).execute()
+    assert tokens.consume(expired, "reset") == (False, {}, ERROR_MESSAGES["token_expired"])
+
+
+def test_reset_password_uses_the_token_up(auth):
+    token = auth.token_service.issue("reset", EMAIL)
+    assert auth.reset_password(token, PASSWORD)[0]
+    assert auth.reset_password(token, "Other1Passw0rd") == (False, ERROR_MESSAGES["invalid_token"])
+    assert auth.login_user(EMAIL, PASSWORD)[0]
+
+
+def test_concurrent_resets_with_one_token_set_one_password(auth):
+    token = auth.token_service.issue("reset", EMAIL)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def reset(i):
+        barrier.wait()
+        results.append(auth.change_password(token, f"Passw0rd!{i}")[0])
+
+    threads = [threading.Thread(target=reset, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+
+
+def test_failed_update_gives_the_token_back(auth, monkeypatch):
+    token = auth.token_service.issue("reset", EMAIL)
+    monkeypatch.setattr(auth, "update_user_password", lambda email, password: False)
+    assert auth.reset_password(token, PASSWORD) == (False, ERROR_MESSAGES["api_error"])
+    monkeypatch.undo()
+    assert auth.reset_password(token, PASSWORD)[0]
+
+
+def test_update_user_password_needs_a_matching_user(auth):
+    assert auth.update_user_password("nobody@example.com", PASSWORD) is False
+    assert auth.update_user_password(EMAIL, PASSWORD) is True
@@ -0,0 +1,180 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from config import (
+    VERIFICATION_TOKEN_EXPIRY,
+    RESET_TOKEN_EXPIRY,
+    ERROR_MESSAGES
+)
+from logging_service import LoggingService
+
+# Each token type lives in its own table, indexed (unique) on the token column.
+# The prefix routes a raw token to its table so a lookup is a single indexed read.
+TOKEN_TYPES = {
+    "verification": {"table": "email_verifications", "prefix": "v_", "expiry": VERIFICATION_TOKEN_EXPIRY},
+    "reset": {"table": "password_resets", "prefix": "r_", "expiry": RESET_TOKEN_EXPIRY},
+}
+
+SWEEP_INTERVAL = 15 * 60  # seconds between purges of expired tokens
+SWEEP_BATCH_SIZE = 500
+
+
+class _ConsumedTokenCache:
+    """Bounded record of tokens already consumed in this process, with their outcome."""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._entries.get(token)
+            if record is not None:
+                self._entries.move_to_end(token)
+            return record
+
+    def discard(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def put(self, token: str, record: Dict):
+        with self._lock:
+            self._entries[token] = record
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_consumed_tokens = _ConsumedTokenCache()
+_sweeper_lock = threading.Lock()
+_sweeper_thread = None
+
+
+class TokenService:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.logger = LoggingService()
+
+    def token_type(self, token: str) -> Optional[str]:
+        for token_type, spec in TOKEN_TYPES.items():
+            if token and token.startswith(spec["prefix"]):
+                return token_type
+        return None
+
+    def issue(self, token_type: str, email: str, user_id: str = None) -> str:
+        spec = TOKEN_TYPES[token_type]
+        token = f"{spec['prefix']}{secrets.token_urlsafe(32)}"
+        row = {
+            "token": token,
+            "email": email,
+            "expiry": (datetime.utcnow() + timedelta(seconds=spec["expiry"])).isoformat()
+        }
+        if user_id:
+            row["user_id"] = user_id
+        self.supabase.table(spec["table"]).insert(row).execute()
+        self.logger.log_db_event('token_issue', spec["table"], True)
+        return token
+
+    def lookup(self, token: str, token_type: str) -> Optional[Dict]:
+        """Return the live record for a token, or None if unknown, consumed or expired."""
+        if self.token_type(token) != token_type or _consumed_tokens.get(token):
+            return None
+        response = self.supabase.table(TOKEN_TYPES[token_type]["table"]).select("*").eq("token", token).limit(1).execute()
+        if not response.data or self._is_expired(response.data[0]):
+            return None
+        return response.data[0]
+
+    def consume(self, token: str, token_type: str, replay: bool = True) -> Tuple[bool, Dict, str]:
+        """Atomically use up a token. Repeat calls are answered from memory.
+
+        With ``replay=False`` a repeat of a successful consume fails like an
+        unknown token, so only one caller ever acts on it (password resets).
+        """
+        cached = _consumed_tokens.get(token)
+        if cached is not None:
+            if cached["success"] and not replay:
+                return False, {}, ERROR_MESSAGES["invalid_token"]
+            return cached["success"], cached["record"], cached["message"]
+        if self.token_type(token) != token_type:
+            return False, {}, ERROR_MESSAGES["invalid_token"]
+
+        table = TOKEN_TYPES[token_type]["table"]
+        try:
+            # Deleting the row is the single-use guarantee: only one caller gets it back
+            response = self.supabase.table(table).delete().eq("token", token).execute()
+        except Exception as e:
+            self.logger.log_db_event('token_consume', table, False, {'error': str(e)})
+            return False, {}, ERROR_MESSAGES["api_error"]
+
+        if not response.data:
+            result = {"success": False, "record": {}, "message": ERROR_MESSAGES["invalid_token"]}
+        elif self._is_expired(response.data[0]):
+            result = {"success": False, "record": {}, "message": ERROR_MESSAGES["token_expired"]}
+        else:
+            result = {"success": True, "record": response.data[0], "message": ""}
+        _consumed_tokens.put(token, result)
+        self.logger.log_db_event('token_consume', table, result["success"])
+        return result["success"], result["record"], result["message"]
+
+    def release(self, token: str, token_type: str, record: Dict):
+        """Put back a token consumed by a caller that then failed, so the link can be retried."""
+        table = TOKEN_TYPES[token_type]["table"]
+        self.supabase.table(table).insert(
+            {key: record[key] for key in ("token", "email", "user_id", "expiry") if key in record}
+        ).execute()
+        _consumed_tokens.discard(token)
+        self.logger.log_db_event('token_release', table, True)
+
+    def remember_outcome(self, token: str, success: bool, record: Dict, message: str):
+        """Overwrite the cached outcome of a consumed token (e.g. with the final user-facing message)."""
+        _consumed_tokens.put(token, {"success": success, "record": record, "message": message})
+
+    def purge_expired(self, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+        now = datetime.utcnow().isoformat()
+        purged = 0
+        for spec in TOKEN_TYPES.values():
+            table_purged = 0
+            while True:
+                response = self.supabase.table(spec["table"]).select("token").lt("expiry", now).limit(batch_size).execute()
+                tokens = [row["token"] for row in response.data or []]
+                if not tokens:
+                    break
+                self.supabase.table(spec["table"]).delete().in_("token", tokens).execute()
+                table_purged += len(tokens)
+                if len(tokens) < batch_size:
+                    break
+            self.logger.log_db_event('token_purge', spec["table"], True, {'purged': table_purged})
+            purged += table_purged
+        return purged
+
+    def start_sweeper(self, interval: int = SWEEP_INTERVAL):
+        """Start the process-wide background purge of expired tokens (idempotent)."""
+        global _sweeper_thread
+        with _sweeper_lock:
+            if _sweeper_thread is not None and _sweeper_thread.is_alive():
+                return
+
+            def sweep():
+                while True:
+                    try:
+                        self.purge_expired()
+                    except Exception as e:
+                        self.logger.log_db_event('token_purge', 'all', False, {'error': str(e)})
+                    time.sleep(interval)
+
+            _sweeper_thread = threading.Thread(target=sweep, name="token-sweeper", daemon=True)
+            _sweeper_thread.start()
+
+    @staticmethod
+    def _is_expired(record: Dict) -> bool:
+        expiry = record.get("expiry")
+        if not expiry:
+            return False
+        expiry = datetime.fromisoformat(expiry.replace("Z", "+00:00"))
+        if expiry.tzinfo is not None:
+            expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+        return expiry <= datetime.utcnow()
@@ -1,19 +1,24 @@
 # utils.py
+import os
 import openai
 import streamlit as st
+from config import OPENAI_API_KEY
+from knowledge_base import get_knowledge_base
+from services import get_llm_chain, get_meal_plan_chain, get_profile_service
 
-openai.api_key = st.secrets["OPENAI_API_KEY"]
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 
-@st.cache_resource
-def load_llm_chain():
-    llm = ChatOpenAI(model_name="gpt-4", temperature=0.2)
+# Environment first so the API and CLI tools don't need a Streamlit secrets file
+openai.api_key = OPENAI_API_KEY or st.secrets["OPENAI_API_KEY"]
+
+# "openai" for the real model, "fake" for the local stand-in in fake_llm.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
 
-    prompt_template = PromptTemplate(
-        input_variables=["phase", "goal", "diet", "question"],
-        template="""
+PROMPT_TEMPLATE = PromptTemplate(
+    input_variables=["phase", "goal", "diet", "context", "question"],
+    template="""
 You are a personalized cycle nutrition assistant.
 The user is currently in the {phase} phase of her menstrual cycle.
 Her main focus is {goal}.
@@ -23,15 +28,74 @@ Given this information, answer her question below in a clear, practical, and war
 Be specific when you recommend foods.
 Structure your answer with a list of bullet points when that clarifies.
 
+Background knowledge you can rely on (use what is relevant, ignore the rest):
+{context}
+
 When it makes sense based on the chat history, end your answer with a suggestion to give a recipe suggestion, a meal plan for for example breakfast, lunch or dinner or with specific questions.
 
 Question: {question}
 
 Answer:
 """
-    )
+)
+
+# One call returns the whole plan as JSON (validated by meal_plan_service.MealPlan)
+MEAL_PLAN_TEMPLATE = PromptTemplate(
+    input_variables=["phase", "goal", "diet", "context", "days", "meals", "tags", "alternatives"],
+    template="""
+You are a personalized cycle nutrition assistant writing a meal plan.
+The user is currently in the {phase} phase of her menstrual cycle.
+Her main focus is {goal}.
+She follows these dietary preferences: {diet}.
+
+Background knowledge you can rely on (use what is relevant, ignore the rest):
+{context}
+
+Number of days: {days}
+Meals per day: {meals}
+Also add {alternatives} spare meals per meal type under "alternatives", so a meal can be swapped later.
+Give every ingredient a quantity and unit for one person, and list in "contains" which of these it contains: {tags}.
+
+Return only JSON, without any other text, in this shape:
+{{"title": "...", "days": [{{"day": 1, "meals": [{{"meal": "breakfast", "title": "...", "ingredients": [{{"name": "rolled oats", "quantity": 50, "unit": "g", "contains": ["gluten"]}}], "instructions": "..."}}]}}], "alternatives": [{{"meal": "breakfast", "title": "...", "ingredients": [], "instructions": "..."}}]}}
+"""
+)
+
+def _default_llm():
+    if LLM_BACKEND == "fake":
+        from fake_llm import FakeChatModel
+        return FakeChatModel()
+    return ChatOpenAI(model_name="gpt-4", temperature=0.2, api_key=openai.api_key)
+
+def build_llm_chain(llm=None):
+    """Create a new chain; outside Streamlit this is the entry point to the prompt."""
+    return LLMChain(llm=llm or _default_llm(), prompt=PROMPT_TEMPLATE)
+
+def build_meal_plan_chain(llm=None):
+    return LLMChain(llm=llm or _default_llm(), prompt=MEAL_PLAN_TEMPLATE)
+
+def build_chain_inputs(phase, goal, dietary_preferences, question):
+    """Prompt inputs for a question, grounded with snippets from the local knowledge base."""
+    if isinstance(dietary_preferences, str):
+        dietary_preferences = [d.strip() for d in dietary_preferences.split(",") if d.strip()]
+    return {
+        "phase": phase,
+        "goal": goal,
+        "diet": ", ".join(dietary_preferences or []),
+        "context": get_knowledge_base().context_for(question, phase, goal, dietary_preferences) or "None",
+        "question": question
+    }
+
+def load_llm_chain():
+    return get_llm_chain()
+
+def load_meal_plan_chain():
+    return get_meal_plan_chain()
 
-    return LLMChain(llm=llm, prompt=prompt_template)
+async def astream_chain(chain, inputs, callbacks=None):
+    """Yield the answer of ``chain`` for ``inputs`` as text chunks."""
+    async for chunk in (chain.prompt | chain.llm).astream(inputs, config={"callbacks": callbacks}):
+        yield chunk.content
 
 def reset_session():
     keys_defaults = {
@@ -51,4 +115,7 @@ def reset_session():
 def add_to_chat_history(role, message):
     if st.session_state.chat_history is None:
         st.session_state.chat_history = []
-    st.session_state.chat_history.append((role, message))
\ No newline at end of file
+    st.session_state.chat_history.append((role, message))
+    # Logged-in conversations are kept so they can be searched later
+    if st.session_state.get("logged_in") and st.session_state.get("user_id"):
+        get_profile_service().add_chat_message(st.session_state.user_id, role, message)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import atexit
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+from supabase import create_client
+from config import (
+    SUPABASE_URL,
+    SUPABASE_SERVICE_ROLE_KEY,
+    WRITE_BUFFER_FLUSH_INTERVAL,
+    WRITE_BUFFER_MAX_ROWS
+)
+from logging_service import LoggingService
+
+# Tables the buffer writes to, and the column each row is keyed on
+BUFFERED_TABLES = {
+    "users": "id",
+    "profiles": "user_id"
+}
+
+
+class WriteBuffer:
+    """Coalesces per-row field updates and writes them in batched upserts.
+
+    ``update`` only merges the fields into a pending row (later values win),
+    so request handlers never wait on the database. A background flusher
+    upserts the pending rows every ``interval`` seconds, sooner once
+    ``max_rows`` rows are waiting, and once more at shutdown. Rows in one
+    upsert always carry the same columns, so no row overwrites another's
+    untouched columns with defaults. If a batch fails its rows are retried
+    one by one as plain updates, and rows that still fail are kept for the
+    next flush.
+
+    Pending writes are lost if the process is killed outright; only use it
+    for data that is cheap to lose for a few seconds, like ``last_login``
+    and personalization choices.
+    """
+
+    def __init__(self, supabase=None, interval: float = WRITE_BUFFER_FLUSH_INTERVAL,
+                 max_rows: int = WRITE_BUFFER_MAX_ROWS, start: bool = True):
+        self.supabase = supabase or create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.interval = interval
+        self.max_rows = max_rows
+        self.logger = LoggingService()
+        self._pending: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self.metrics = {
+            "updates_total": 0,
+            "rows_written": 0,
+            "batches": 0,
+            "flush_failures": 0,
+            "last_flush_latency_ms": 0.0
+        }
+        if start:
+            threading.Thread(target=self._flush_loop, name="write-buffer", daemon=True).start()
+        atexit.register(self.close)
+
+    def update(self, table: str, key: str, fields: Dict):
+        """Queue ``fields`` for the row of ``table`` whose key column equals ``key``."""
+        if table not in BUFFERED_TABLES:
+            raise ValueError(f"Table {table!r} is not buffered")
+        with self._lock:
+            row = self._pending[table].get(key)
+            if row is None:
+                row = self._pending[table][key] = {}
+                self._pending_rows += 1
+            row.update(fields)
+            self.metrics["updates_total"] += 1
+            if self._pending_rows >= self.max_rows:
+                self._wakeup.notify()
+
+    def discard(self, key: str):
+        """Drop pending writes for ``key`` in every table, e.g. before deleting the account."""
+        # Waits out a flush in progress, so nothing for ``key`` is written after this returns
+        with self._flush_lock, self._lock:
+            for rows in self._pending.values():
+                if rows.pop(key, None) is not None:
+                    self._pending_rows -= 1
+
+    def flush(self) -> int:
+        """Write every pending row now. Returns the number of rows stored."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(dict)
+                self._pending_rows = 0
+            if not pending:
+                return 0
+            started = time.perf_counter()
+            written, failed = 0, {}
+            for table, rows in pending.items():
+                key_column = BUFFERED_TABLES[table]
+                groups = defaultdict(list)
+                for key, fields in rows.items():
+                    groups[frozenset(fields)].append({key_column: key, **fields})
+                for batch in groups.values():
+                    stored = self._write(table, key_column, batch)
+                    written += len(stored)
+                    for row in batch:
+                        if row[key_column] not in stored:
+                            failed.setdefault(table, {})[row[key_column]] = row
+            latency_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                # Failed rows go back under anything queued since, which is newer
+                for table, rows in failed.items():
+                    for key, row in rows.items():
+                        fields = {column: value for column, value in row.items() if column != BUFFERED_TABLES[table]}
+                        newer = self._pending[table].get(key)
+                        if newer is None:
+                            self._pending_rows += 1
+                        self._pending[table][key] = {**fields, **(newer or {})}
+                self.metrics["rows_written"] += written
+                self.metrics["last_flush_latency_ms"] = latency_ms
+        self.logger.log_db_event('write_buffer_flush', ','.join(pending), not failed,
+                                 {'rows': written, 'failed': sum(len(rows) for rows in failed.values()),
+                                  'latency_ms': round(latency_ms, 1)})
+        return written
+
+    def _write(self, table: str, key_column: str, batch: List[Dict]) -> set:
+        """Upsert one batch; fall back to per-row updates. Returns the keys stored."""
+        try:
+            self.supabase.table(table).upsert(batch, on_conflict=key_column).execute()
+            with self._lock:
+                self.metrics["batches"] += 1
+            return {row[key_column] for row in batch}
+        except Exception as e:
+            with self._lock:
+                self.metrics["flush_failures"] += 1
+            self.logger.log_db_event('write_buffer_flush', table, False, {'error': str(e), 'rows': len(batch)})
+        stored = set()
+        for row in batch:
+            fields = {column: value for column, value in row.items() if column != key_column}
+            try:
+                self.supabase.table(table).update(fields).eq(key_column, row[key_column]).execute()
+                stored.add(row[key_column])
+            except Exception as e:
+                self.logger.log_db_event('write_buffer_flush', table, False, {'error': str(e), 'key': row[key_column]})
+        return stored
+
+    def get_metrics(self) -> Dict:
+        """Counters plus ``coalescing_ratio``: the share of updates that never needed a write of their own."""
+        with self._lock:
+            metrics = dict(self.metrics, pending_rows=self._pending_rows)
+        updates = metrics["updates_total"]
+        writes = metrics["rows_written"] + metrics["pending_rows"]
+        metrics["coalescing_ratio"] = round(max(0.0, 1 - writes / updates), 4) if updates else 0.0
+        return metrics
+
+    def close(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._wakeup.notify()
+        self.flush()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._wakeup.wait_for(lambda: self._stopped or self._pending_rows >= self.max_rows,
+                                      timeout=self.interval)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.log_db_event('write_buffer_flush', 'all', False, {'error': str(e)})